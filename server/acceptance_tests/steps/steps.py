@@ -149,6 +149,7 @@ def step_impl(context):
         '_link': context.log_url,
         'name': 'Project named partner',
         'description': 'My attempts to found my own firm',
+        'entry_count': 0,
         'entries': [],
     }
     actual_response = response.json()
@@ -0,0 +1 @@
+"""Load tests and micro-benchmarks for the TinyLog API"""
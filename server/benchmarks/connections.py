@@ -0,0 +1,281 @@
+"""Compare how many live followers a WSGI and an ASGI worker can hold
+
+Opens an increasing number of live entry streams against one log, then,
+while they are open, times requests to another route and posts an entry
+that every follower should receive:
+
+    python -m benchmarks connections --followers 0 16 32 64 256
+
+Both workers run the app in-process. The WSGI worker handles each
+connection on one of --threads threads, as a threaded WSGI server does.
+The ASGI worker is tinylog_server.asgi with ASGI_THREADS set to the same
+number. A request that does not complete within --timeout seconds is
+counted as timed out.
+"""
+
+import asyncio
+import concurrent.futures
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+
+class _Follower(object):
+    def __init__(self):
+        self.ready = threading.Event()
+        self.received = threading.Event()
+        self.closed = threading.Event()
+        self.future = None
+
+
+class WSGIWorker(object):
+    """Serves every connection on a thread of a fixed size pool"""
+
+    def __init__(self, app, threads):
+        self.client = app.test_client()
+        self.executor = concurrent.futures.ThreadPoolExecutor(threads)
+
+    def follow(self, path, headers):
+        follower = _Follower()
+        follower.future = self.executor.submit(
+            self._follow, follower, path, headers)
+        return follower
+
+    def unfollow(self, follower):
+        follower.closed.set()
+        follower.future.cancel()
+
+    def request(self, method, path, headers, body, timeout):
+        future = self.executor.submit(
+            self._request, method, path, headers, body)
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            return None
+
+    def close(self):
+        self.executor.shutdown()
+
+    def _follow(self, follower, path, headers):
+        response = self.client.get(path, headers=headers, buffered=False)
+        try:
+            for chunk in response.response:
+                follower.ready.set()
+                if chunk.startswith(b'id: '):
+                    follower.received.set()
+                if follower.closed.is_set():
+                    return
+        finally:
+            response.close()
+
+    def _request(self, method, path, headers, body):
+        response = self.client.open(
+            path, method=method, headers=headers, data=body,
+            content_type='application/json')
+        response.get_data()
+        return response.status_code
+
+
+class ASGIWorker(object):
+    """Serves every connection through tinylog_server.asgi on one loop"""
+
+    def __init__(self, application):
+        self.application = application
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever)
+        self._thread.start()
+
+    def follow(self, path, headers):
+        follower = _Follower()
+        follower.future = asyncio.run_coroutine_threadsafe(
+            self._follow(follower, path, headers), self.loop)
+        return follower
+
+    def unfollow(self, follower):
+        follower.closed.set()
+
+    def request(self, method, path, headers, body, timeout):
+        future = asyncio.run_coroutine_threadsafe(
+            self._request(method, path, headers, body), self.loop)
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            return None
+
+    def close(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self.application.executor.shutdown()
+
+    async def _follow(self, follower, path, headers):
+        started = []
+
+        async def receive():
+            if not started:
+                started.append(True)
+                return {'type': 'http.request', 'body': b''}
+            while not follower.closed.is_set():
+                await asyncio.sleep(0.05)
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            if message['type'] == 'http.response.body':
+                follower.ready.set()
+                if message['body'].startswith(b'id: '):
+                    follower.received.set()
+
+        await self.application(
+            _scope('GET', path, headers), receive, send)
+
+    async def _request(self, method, path, headers, body):
+        messages = [{'type': 'http.request', 'body': body or b''}]
+        status = []
+
+        async def receive():
+            if messages:
+                return messages.pop()
+            await asyncio.sleep(3600)
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                status.append(message['status'])
+
+        await self.application(
+            _scope(method, path, dict(
+                headers, **{'Content-Type': 'application/json'})),
+            receive, send)
+        return status[0]
+
+
+def measure(worker, followers, dataset, args):
+    """Open followers on worker and time requests while they are open"""
+    headers = {'Authorization': 'tinylog ' + dataset.access_tokens[0]}
+    log_id = dataset.log_ids[0]
+    opened = [
+        worker.follow('/logs/{}/entries/stream'.format(log_id), headers)
+        for _ in range(followers)
+    ]
+    deadline = time.perf_counter() + args.timeout
+    for follower in opened:
+        follower.ready.wait(max(deadline - time.perf_counter(), 0))
+    held = [follower for follower in opened if follower.ready.is_set()]
+
+    latencies = []
+    timeouts = 0
+    for _ in range(args.requests):
+        started = time.perf_counter()
+        status = worker.request(
+            'GET', '/logs/{}/'.format(log_id), headers, None, args.timeout)
+        if status is None:
+            timeouts += 1
+        else:
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    worker.request(
+        'POST', '/logs/{}/entries/'.format(log_id), headers,
+        json.dumps({'title': 'Live', 'description': 'Benchmark'}).encode(
+            'utf-8'),
+        args.timeout)
+    for follower in held:
+        follower.received.wait(
+            max(started + args.timeout - time.perf_counter(), 0))
+    delivered = sum(1 for follower in held if follower.received.is_set())
+
+    for follower in opened:
+        worker.unfollow(follower)
+    concurrent.futures.wait(
+        [follower.future for follower in opened], timeout=args.timeout + 5)
+
+    return {
+        'followers': followers,
+        'held': len(held),
+        'delivered': delivered,
+        'requests': len(latencies),
+        'timeouts': timeouts,
+        'p50_ms': _ms(statistics.median(latencies)) if latencies else None,
+        'max_ms': _ms(max(latencies)) if latencies else None,
+    }
+
+
+def run(args):
+    """Seed a log and measure both workers at each follower count"""
+    database = tempfile.NamedTemporaryFile(suffix='.db', delete=False)
+    database.close()
+    try:
+        return _measure_seeded(args, database.name)
+    finally:
+        os.remove(database.name)
+
+
+def _measure_seeded(args, database_path):
+    os.environ['DATABASE_DSN'] = 'sqlite:///' + database_path
+    os.environ.setdefault('CAPTCHA_SECRET', 'benchmark')
+    os.environ.setdefault('CAPTCHA_CHALLENGE', 'benchmark')
+    os.environ['ASGI_THREADS'] = str(args.threads)
+    # Idle WSGI followers only notice they were closed on a heartbeat
+    os.environ['LIVE_HEARTBEAT'] = '1'
+    for limit in ('LOGIN', 'SIGNUP', 'WRITES'):
+        os.environ.setdefault('RATE_LIMIT_' + limit, '0/1')
+
+    from tinylog_server import asgi
+    from tinylog_server.app import app
+    from benchmarks.seed import seed
+
+    with app.app_context():
+        dataset = seed(10, 1, 100, 1)
+
+    rows = []
+    for name, make_worker in (
+            ('wsgi', lambda: WSGIWorker(app, args.threads)),
+            ('asgi', lambda: ASGIWorker(asgi.application))):
+        worker = make_worker()
+        try:
+            for followers in args.followers:
+                print('Measuring {} with {} followers...'.format(
+                    name, followers), file=sys.stderr)
+                rows.append(dict(
+                    measure(worker, followers, dataset, args), worker=name))
+        finally:
+            worker.close()
+    return rows
+
+
+def print_rows(rows, output=sys.stdout):
+    print('{:<6} {:>9} {:>6} {:>9} {:>9} {:>8} {:>10} {:>10}'.format(
+        'worker', 'followers', 'held', 'delivered', 'requests', 'timeouts',
+        'p50 ms', 'max ms'), file=output)
+    for row in rows:
+        print('{:<6} {:>9} {:>6} {:>9} {:>9} {:>8} {:>10} {:>10}'.format(
+            row['worker'], row['followers'], row['held'], row['delivered'],
+            row['requests'], row['timeouts'], _format_ms(row['p50_ms']),
+            _format_ms(row['max_ms'])), file=output)
+
+
+def _scope(method, path, headers):
+    return {
+        'type': 'http',
+        'http_version': '1.1',
+        'method': method,
+        'path': path,
+        'query_string': b'',
+        'headers': [
+            (name.lower().encode('latin-1'), value.encode('latin-1'))
+            for name, value in headers.items()
+        ],
+        'server': ('localhost', 80),
+    }
+
+
+def _ms(seconds):
+    return seconds * 1000
+
+
+def _format_ms(value):
+    return '-' if value is None else '{:.1f}'.format(value)
@@ -0,0 +1,106 @@
+"""Compare the size and encoding cost of a listing in each response format
+
+Seeds one log, fetches it with every entry embedded, then encodes the
+listing as the app would for each format and content coding:
+
+    python -m benchmarks encodings --entries 1000
+
+Brotli and MessagePack rows only appear when their packages are
+installed.
+"""
+
+import gzip
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+
+def codecs():
+    """Return (name, encode function) pairs for every available format"""
+    from flask import jsonify
+    from tinylog_server import encoding
+
+    def as_json(data):
+        return jsonify(data).get_data()
+
+    pairs = [('json', as_json)]
+    for level in (1, 6, 9):
+        pairs.append(('json+gzip-{}'.format(level), _then(
+            as_json, lambda body, level=level: gzip.compress(body, level))))
+    if encoding.brotli is not None:
+        for quality in (4, 6, 11):
+            pairs.append(('json+br-{}'.format(quality), _then(
+                as_json, lambda body, quality=quality:
+                encoding.brotli.compress(body, quality=quality))))
+    if encoding.msgpack is not None:
+        def as_msgpack(data):
+            return encoding.msgpack.packb(data, use_bin_type=True)
+        pairs.append(('msgpack', as_msgpack))
+        pairs.append(('msgpack+gzip-6', _then(
+            as_msgpack, lambda body: gzip.compress(body, 6))))
+    return pairs
+
+
+def measure(data, repeat):
+    """Return a row of size and median encoding time for every codec"""
+    rows = []
+    baseline = None
+    for name, encode in codecs():
+        timings = []
+        for _ in range(repeat):
+            started = time.process_time()
+            body = encode(data)
+            timings.append(time.process_time() - started)
+        if baseline is None:
+            baseline = len(body)
+        rows.append({
+            'format': name,
+            'bytes': len(body),
+            'ratio': len(body) / baseline,
+            'encode_ms': statistics.median(timings) * 1000,
+        })
+    return rows
+
+
+def run(args):
+    """Seed a log of args.entries entries and measure its encodings"""
+    database = tempfile.NamedTemporaryFile(suffix='.db', delete=False)
+    database.close()
+    try:
+        return _measure_seeded(args, database.name)
+    finally:
+        os.remove(database.name)
+
+
+def _measure_seeded(args, database_path):
+    os.environ['DATABASE_DSN'] = 'sqlite:///' + database_path
+    os.environ.setdefault('CAPTCHA_SECRET', 'benchmark')
+    os.environ.setdefault('CAPTCHA_CHALLENGE', 'benchmark')
+
+    from tinylog_server.app import app
+    from benchmarks.seed import seed
+
+    with app.app_context():
+        dataset = seed(10, 1, args.entries, 1)
+        response = app.test_client().get(
+            '/logs/{}/'.format(dataset.log_ids[0]),
+            headers={'Authorization': 'tinylog ' + dataset.access_tokens[0]},
+        )
+        data = json.loads(response.get_data(as_text=True))
+    with app.test_request_context(base_url='http://localhost/'):
+        return measure(data, args.repeat)
+
+
+def print_rows(rows, output=sys.stdout):
+    print('{:<16} {:>12} {:>8} {:>12}'.format(
+        'format', 'bytes', 'ratio', 'encode ms'), file=output)
+    for row in rows:
+        print('{format:<16} {bytes:>12} {ratio:>8.3f} {encode_ms:>12.2f}'
+              .format(**row), file=output)
+
+
+def _then(first, second):
+    return lambda data: second(first(data))
@@ -0,0 +1,503 @@
+"""Drive every route under concurrent load and report latency percentiles
+
+Run against a freshly seeded local database, with the app in-process:
+
+    python -m benchmarks --entries 5000 --concurrency 8 --output run.json
+
+or against a running server seeded the same way with --target. In-process
+runs accept every captcha token, so signup measures the app rather than
+the captcha service; a target server needs CAPTCHA_VERIFY_URL pointed at
+a stub that does the same. Each scenario reports p50/p95/p99 latency, throughput, errors and (in-process)
+SQL statements per request as JSON. Two result files can be compared
+with:
+
+    python -m benchmarks compare before.json after.json
+
+python -m benchmarks encodings compares response formats and compression,
+python -m benchmarks serialize times entry serialization, and python -m
+benchmarks connections compares the live followers WSGI and ASGI workers
+can hold.
+"""
+
+import argparse
+import datetime
+import itertools
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+SCENARIOS = [
+    'index',
+    'captcha_challenge',
+    'signup',
+    'login',
+    'logout',
+    'current_user',
+    'list_users',
+    'get_user',
+    'list_logs',
+    'get_log',
+    'list_entries',
+    'stream_entries',
+    'get_entry',
+    'all_entries',
+    'search',
+    'stats',
+    'export_log',
+    'import_log',
+    'create_log',
+    'post_entry',
+    'bulk_post_entries',
+    'metrics',
+]
+
+# Shared by every worker so created usernames and ids never collide
+_UNIQUE = itertools.count()
+
+
+# Request builders. Each returns (method, path, body), where body is JSON
+# data, raw bytes or None, optionally followed by headers replacing the
+# worker's.
+
+def _index(dataset, rng): #pylint: disable=W0613
+    return 'GET', '/', None
+
+def _captcha_challenge(dataset, rng): #pylint: disable=W0613
+    return 'GET', '/captcha-challenge/', None
+
+def _signup(dataset, rng): #pylint: disable=W0613
+    return 'POST', '/users/', {
+        'username': 'signup{:08d}'.format(next(_UNIQUE)),
+        'password': dataset.password,
+        'captcha_token': 'benchmark',
+    }
+
+def _login(dataset, rng):
+    return 'POST', '/login/', {
+        'username': rng.choice(dataset.usernames),
+        'password': dataset.password,
+    }
+
+def _logout(dataset, rng): #pylint: disable=W0613
+    # Each request ends a spare session of its own
+    access_token = dataset.spare_tokens.pop()
+    return 'POST', '/logout/', None, {
+        'Authorization': 'tinylog ' + access_token,
+    }
+
+def _current_user(dataset, rng): #pylint: disable=W0613
+    return 'GET', '/current-user/', None
+
+def _list_users(dataset, rng): #pylint: disable=W0613
+    return 'GET', '/users/?limit=100', None
+
+def _get_user(dataset, rng):
+    return 'GET', '/users/{}/'.format(rng.choice(dataset.usernames)), None
+
+def _list_logs(dataset, rng): #pylint: disable=W0613
+    return 'GET', '/logs/?limit=20', None
+
+def _get_log(dataset, rng):
+    return 'GET', '/logs/{}/'.format(rng.choice(dataset.log_ids)), None
+
+def _list_entries(dataset, rng):
+    return 'GET', '/logs/{}/entries/?limit=100'.format(
+        rng.choice(dataset.log_ids)), None
+
+def _stream_entries(dataset, rng):
+    return 'GET', '/logs/{}/entries/?stream=1'.format(
+        rng.choice(dataset.log_ids)), None
+
+def _get_entry(dataset, rng):
+    return 'GET', '/logs/{}/entries/{}/'.format(
+        *rng.choice(dataset.entries)), None
+
+def _all_entries(dataset, rng): #pylint: disable=W0613
+    return 'GET', '/entries/?limit=100', None
+
+def _search(dataset, rng): #pylint: disable=W0613
+    from benchmarks.seed import WORDS
+    return 'GET', '/search/?q={}&limit=20'.format(rng.choice(WORDS)), None
+
+def _stats(dataset, rng):
+    return 'GET', '/logs/{}/stats/'.format(rng.choice(dataset.log_ids)), None
+
+def _export_log(dataset, rng):
+    return 'GET', '/logs/{}/export/?format={}'.format(
+        rng.choice(dataset.log_ids), rng.choice(['ndjson', 'csv'])), None
+
+def _import_log(dataset, rng):
+    batch = next(_UNIQUE)
+    created_at = datetime.datetime.utcnow().isoformat()
+    records = [{'type': 'log', 'name': 'Imported {}'.format(batch)}]
+    records.extend(
+        {
+            'type': 'entry',
+            'id': 'import{:08d}-{:04d}'.format(batch, index),
+            'created_at': created_at,
+            'author': rng.choice(dataset.usernames),
+            'title': 'Benchmark',
+            'description': 'Imported under load',
+        }
+        for index in range(100)
+    )
+    return 'POST', '/logs/import/', ''.join(
+        json.dumps(record) + '\n' for record in records).encode('utf-8')
+
+def _create_log(dataset, rng): #pylint: disable=W0613
+    return 'POST', '/logs/', {
+        'name': 'Created {:08d}'.format(next(_UNIQUE)),
+        'description': 'Created under load',
+    }
+
+def _post_entry(dataset, rng):
+    return 'POST', '/logs/{}/entries/'.format(rng.choice(dataset.log_ids)), {
+        'title': 'Benchmark',
+        'description': 'Posted under load',
+    }
+
+def _bulk_post_entries(dataset, rng):
+    return 'POST', '/logs/{}/entries/bulk/'.format(
+        rng.choice(dataset.log_ids)), [
+            {'title': 'Benchmark', 'description': 'Bulk posted under load'}
+            for _ in range(100)
+        ]
+
+def _metrics(dataset, rng): #pylint: disable=W0613
+    return 'GET', '/metrics', None
+
+BUILDERS = {name: globals()['_' + name] for name in SCENARIOS}
+
+
+# Clients
+
+class InProcessClient(object):
+    """Sends requests through the Flask test client, counting SQL"""
+
+    def __init__(self, app, statement_counter):
+        self.client = app.test_client()
+        self.counter = statement_counter
+
+    def request(self, method, path, body, headers):
+        self.counter.reset()
+        if isinstance(body, bytes):
+            data, content_type = body, 'application/x-ndjson'
+        else:
+            data = None if body is None else json.dumps(body)
+            content_type = 'application/json'
+        response = self.client.open(
+            path,
+            method=method,
+            data=data,
+            content_type=content_type,
+            headers=headers,
+        )
+        response.get_data()
+        return response.status_code, self.counter.count
+
+
+class HTTPClient(object):
+    """Sends requests to a running server"""
+
+    def __init__(self, target):
+        import requests
+        self.target = target.rstrip('/')
+        self.session = requests.Session()
+
+    def request(self, method, path, body, headers):
+        if isinstance(body, bytes):
+            response = self.session.request(
+                method, self.target + path, data=body, headers=dict(
+                    headers, **{'Content-Type': 'application/x-ndjson'}))
+        else:
+            response = self.session.request(
+                method, self.target + path, json=body, headers=headers)
+        return response.status_code, None
+
+
+class StatementCounter(object):
+    """Counts SQL statements executed by the current thread"""
+
+    def __init__(self, engine):
+        from sqlalchemy import event
+        self._local = threading.local()
+        event.listen(engine, 'before_cursor_execute', self._record)
+
+    def _record(self, *args): #pylint: disable=W0613
+        self._local.count = self.count + 1
+
+    @property
+    def count(self):
+        return getattr(self._local, 'count', 0)
+
+    def reset(self):
+        self._local.count = 0
+
+
+# Measurement
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(int(math.ceil(fraction * len(sorted_values))), 1)
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def run_scenario(name, make_client, dataset, concurrency, requests_per_worker,
+                 seed_value=0):
+    """Run one scenario on concurrency threads and summarise the results"""
+    build = BUILDERS[name]
+    latencies = []
+    statements = []
+    errors = [0]
+    lock = threading.Lock()
+
+    def worker(index):
+        rng = random.Random('{}-{}-{}'.format(seed_value, name, index))
+        client = make_client()
+        access_token = dataset.access_tokens[
+            index % len(dataset.access_tokens)]
+        headers = {'Authorization': 'tinylog ' + access_token}
+        for _ in range(requests_per_worker):
+            method, path, body, *replaced = build(dataset, rng)
+            started = time.perf_counter()
+            status, count = client.request(
+                method, path, body, replaced[0] if replaced else headers)
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                if count is not None:
+                    statements.append(count)
+                if status >= 400:
+                    errors[0] += 1
+
+    threads = [
+        threading.Thread(target=worker, args=(index,))
+        for index in range(concurrency)
+    ]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall_time = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': errors[0],
+        'throughput_rps': len(latencies) / wall_time if wall_time else None,
+        'latency_ms': {
+            'p50': _ms(percentile(latencies, 0.50)),
+            'p95': _ms(percentile(latencies, 0.95)),
+            'p99': _ms(percentile(latencies, 0.99)),
+            'max': _ms(latencies[-1] if latencies else None),
+        },
+        'statements_per_request': (
+            sum(statements) / len(statements) if statements else None
+        ),
+    }
+
+
+def run(args):
+    """Seed a database, run the selected scenarios and return the report
+
+    In-process runs use a temporary SQLite database, removed afterwards.
+    """
+    if args.target is not None:
+        return _run(args)
+
+    database = tempfile.NamedTemporaryFile(suffix='.db', delete=False)
+    database.close()
+    try:
+        return _run(args, database.name)
+    finally:
+        os.remove(database.name)
+
+
+def _run(args, database_path=None):
+    if database_path is not None:
+        os.environ['DATABASE_DSN'] = 'sqlite:///' + database_path
+        os.environ.setdefault('CAPTCHA_SECRET', 'benchmark')
+        os.environ.setdefault('CAPTCHA_CHALLENGE', 'benchmark')
+        os.environ.setdefault('HASH_QUEUE_SIZE', str(args.concurrency * 4))
+        # Every simulated client shares one address, so only measure the
+        # rate limits when asked to
+        for limit in ('LOGIN', 'SIGNUP', 'WRITES'):
+            os.environ.setdefault('RATE_LIMIT_' + limit, '0/1')
+
+    from tinylog_server import recaptcha
+    from tinylog_server.app import app
+    from tinylog_server.db.models import DB
+    from benchmarks.seed import seed
+
+    spare_sessions = 0
+    if 'logout' in args.scenarios:
+        spare_sessions = args.concurrency * args.requests
+    with app.app_context():
+        dataset = seed(args.users, args.logs, args.entries, args.sessions,
+                       seed_value=args.seed, spare_sessions=spare_sessions)
+        if args.target is None:
+            recaptcha.set_verifier(recaptcha.StaticVerifier())
+            counter = StatementCounter(DB.engine)
+            make_client = lambda: InProcessClient(app, counter)
+        else:
+            make_client = lambda: HTTPClient(args.target)
+
+    results = {}
+    for name in args.scenarios:
+        print('Running {}...'.format(name), file=sys.stderr)
+        results[name] = run_scenario(
+            name, make_client, dataset, args.concurrency, args.requests,
+            seed_value=args.seed)
+
+    return {
+        'meta': {
+            'revision': _git_revision(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'target': args.target or 'in-process',
+            'python': sys.version.split()[0],
+            'parameters': {
+                'users': args.users,
+                'logs': args.logs,
+                'entries_per_log': args.entries,
+                'sessions': args.sessions,
+                'concurrency': args.concurrency,
+                'requests_per_worker': args.requests,
+                'seed': args.seed,
+            },
+        },
+        'results': results,
+    }
+
+
+def compare(before, after, threshold):
+    """Return (scenario, metric, before, after, change) rows and regressions"""
+    rows = []
+    regressions = []
+    for name, result in after['results'].items():
+        baseline = before['results'].get(name)
+        if baseline is None:
+            continue
+        for metric in ('p50', 'p95', 'p99'):
+            old = baseline['latency_ms'][metric]
+            new = result['latency_ms'][metric]
+            change = (new - old) / old if old else 0.0
+            rows.append((name, metric, old, new, change))
+            if metric == 'p95' and change > threshold:
+                regressions.append(name)
+    return rows, regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks')
+    subparsers = parser.add_subparsers(dest='command')
+
+    run_parser = subparsers.add_parser('run', help='run the load test')
+    run_parser.add_argument('--target', help='URL of a running server; '
+                            'defaults to running the app in-process')
+    run_parser.add_argument('--users', type=int, default=50)
+    run_parser.add_argument('--logs', type=int, default=10)
+    run_parser.add_argument('--entries', type=int, default=1000,
+                            help='entries per log')
+    run_parser.add_argument('--sessions', type=int, default=50)
+    run_parser.add_argument('--concurrency', type=int, default=4)
+    run_parser.add_argument('--requests', type=int, default=50,
+                            help='requests per worker thread per scenario')
+    run_parser.add_argument('--seed', type=int, default=0)
+    run_parser.add_argument('--scenarios', nargs='+', default=SCENARIOS,
+                            choices=SCENARIOS)
+    run_parser.add_argument('--output', help='write the JSON report here')
+
+    compare_parser = subparsers.add_parser(
+        'compare', help='compare two reports')
+    compare_parser.add_argument('before')
+    compare_parser.add_argument('after')
+    compare_parser.add_argument('--threshold', type=float, default=0.1,
+                                help='p95 slowdown that counts as a '
+                                'regression, as a fraction')
+
+    encodings_parser = subparsers.add_parser(
+        'encodings', help='compare response formats and compression')
+    encodings_parser.add_argument('--entries', type=int, default=1000,
+                                  help='entries in the encoded log')
+    encodings_parser.add_argument('--repeat', type=int, default=20)
+
+    serialize_parser = subparsers.add_parser(
+        'serialize', help='time entry serialization')
+    serialize_parser.add_argument('--entries', type=int, default=100000)
+    serialize_parser.add_argument('--authors', type=int, default=50)
+    serialize_parser.add_argument('--repeat', type=int, default=5)
+
+    connections_parser = subparsers.add_parser(
+        'connections', help='compare live followers held by WSGI and ASGI')
+    connections_parser.add_argument('--followers', type=int, nargs='+',
+                                    default=[0, 16, 32, 64, 256])
+    connections_parser.add_argument('--threads', type=int, default=32,
+                                    help='WSGI threads and ASGI_THREADS')
+    connections_parser.add_argument('--requests', type=int, default=10,
+                                    help='requests timed per follower count')
+    connections_parser.add_argument('--timeout', type=float, default=2.0)
+
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] not in (
+            'run', 'compare', 'encodings', 'serialize', 'connections',
+            '-h', '--help'):
+        argv = ['run'] + list(argv)
+    args = parser.parse_args(argv)
+
+    if args.command == 'compare':
+        with open(args.before) as before_file, open(args.after) as after_file:
+            rows, regressions = compare(
+                json.load(before_file), json.load(after_file), args.threshold)
+        for name, metric, old, new, change in rows:
+            print('{:<20} {:<4} {:>10.2f} -> {:>10.2f} ms {:>+8.1%}'.format(
+                name, metric, old, new, change))
+        if regressions:
+            print('p95 regressions: ' + ', '.join(regressions))
+            sys.exit(1)
+        return
+
+    if args.command == 'encodings':
+        from benchmarks import encodings
+        encodings.print_rows(encodings.run(args))
+        return
+
+    if args.command == 'connections':
+        from benchmarks import connections
+        connections.print_rows(connections.run(args))
+        return
+
+    if args.command == 'serialize':
+        from benchmarks import serialization
+        print(json.dumps(serialization.run(args), indent=2, sort_keys=True))
+        return
+
+    report = run(args)
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            output_file.write(output + '\n')
+    else:
+        print(output)
+
+
+def _ms(seconds):
+    return None if seconds is None else seconds * 1000
+
+
+def _git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'],
+            stderr=subprocess.DEVNULL,
+        ).decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
@@ -0,0 +1,89 @@
+"""Fill a database with reproducible data to benchmark against"""
+
+import collections
+import datetime
+import random
+
+from tinylog_server.db import rollups
+from tinylog_server.db.models import DB, PWD_CONTEXT, Entry, Log, Session, User
+
+PASSWORD = 'benchmark-password'
+WORDS = [
+    'evidence', 'deposition', 'settlement', 'appeal', 'witness', 'motion',
+    'hearing', 'discovery', 'verdict', 'client', 'partner', 'campaign',
+    'subpoena', 'contract', 'merger', 'filing', 'trial', 'judge',
+]
+
+Dataset = collections.namedtuple(
+    'Dataset', ['usernames', 'password', 'log_ids', 'entries',
+                'access_tokens', 'spare_tokens'])
+
+
+def seed(users, logs, entries_per_log, sessions, seed_value=0,
+         spare_sessions=0):
+    """Create users, logs, entries and sessions in the app's database
+
+    Must be called inside an app context. Every user shares one password,
+    hashed once, so seeding is not dominated by argon2. Spare sessions are
+    for scenarios that end them, such as logging out, and are listed
+    separately so the sessions other scenarios use stay valid.
+
+    Returns:
+        A Dataset describing what was created.
+    """
+    rng = random.Random(seed_value)
+    DB.create_all()
+
+    password_hash = PWD_CONTEXT.hash(PASSWORD)
+    new_users = [
+        User('bench{:05d}'.format(index), password_hash=password_hash)
+        for index in range(users)
+    ]
+    DB.session.bulk_save_objects(new_users)
+
+    new_logs = [
+        Log('Log {}'.format(index), 'Benchmark log {}'.format(index))
+        for index in range(logs)
+    ]
+    DB.session.bulk_save_objects(new_logs)
+
+    start = datetime.datetime.utcnow() - datetime.timedelta(days=365)
+    entries = []
+    for log_index, log in enumerate(new_logs):
+        DB.session.bulk_insert_mappings(Entry, [
+            {
+                'id': '{:08x}'.format(log_index * entries_per_log + index),
+                'title': ' '.join(rng.sample(WORDS, 2)),
+                'description': ' '.join(rng.sample(WORDS, 6)),
+                'log_id': log.id,
+                'user_id': rng.choice(new_users).id,
+                'created_at': start + datetime.timedelta(
+                    seconds=index * 365 * 86400 // max(entries_per_log, 1)),
+            }
+            for index in range(entries_per_log)
+        ])
+        entries.extend(
+            (log.id, '{:08x}'.format(log_index * entries_per_log + index))
+            for index in range(entries_per_log)
+        )
+
+    new_sessions = [
+        Session(rng.choice(new_users).id)
+        for _ in range(sessions + spare_sessions)
+    ]
+    DB.session.bulk_save_objects(new_sessions)
+    DB.session.commit()
+
+    with DB.engine.begin() as connection:
+        rollups.rebuild(connection)
+
+    return Dataset(
+        usernames=[user.username for user in new_users],
+        password=PASSWORD,
+        log_ids=[log.id for log in new_logs],
+        entries=entries,
+        access_tokens=[
+            session.access_token for session in new_sessions[:sessions]],
+        spare_tokens=[
+            session.access_token for session in new_sessions[sessions:]],
+    )
@@ -0,0 +1,54 @@
+"""Measure how fast entries are serialized for a response
+
+Builds entries in memory, with their authors attached as a listing
+query would load them, and times Entry.to_dict over all of them:
+
+    python -m benchmarks serialize --entries 100000
+
+No database is touched, so only serialization is measured.
+"""
+
+import os
+import time
+
+
+def run(args):
+    """Return the best time and throughput of serializing args.entries"""
+    os.environ.setdefault('DATABASE_DSN', 'sqlite://')
+    os.environ.setdefault('CAPTCHA_SECRET', 'benchmark')
+    os.environ.setdefault('CAPTCHA_CHALLENGE', 'benchmark')
+
+    from tinylog_server.app import app
+    from tinylog_server.db.models import Entry, User, url_builder
+
+    with app.app_context():
+        authors = [
+            User('bench{:05d}'.format(index), password_hash='unused')
+            for index in range(args.authors)
+        ]
+        entries = []
+        for index in range(args.entries):
+            author = authors[index % len(authors)]
+            entry = Entry(
+                title='Entry {}'.format(index),
+                description='Description {}'.format(index),
+                author_id=author.id,
+                log_id='{:08x}'.format(index % 10),
+            )
+            entry.author = author
+            entries.append(entry)
+
+        urls = url_builder('http://localhost/')
+        timings = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            for entry in entries:
+                entry.to_dict(urls)
+            timings.append(time.perf_counter() - started)
+
+    best = min(timings)
+    return {
+        'entries': args.entries,
+        'best_seconds': best,
+        'entries_per_second': args.entries / best,
+    }
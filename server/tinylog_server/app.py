@@ -1,15 +1,32 @@
 """Main application entrypoint for the TinyLog API"""
 
+import collections
+import datetime
 import functools
 import logging
-import os
+import math
+import time
+import zlib
 
+import click
 import envpy
-from flask import Flask, abort, jsonify, request
+from flask import (
+    Flask, Response, abort, g, json, jsonify, request, stream_with_context,
+)
 from flask_cors import CORS, cross_origin
+from werkzeug.urls import url_encode
 
-from tinylog_server import recaptcha
+from tinylog_server import (
+    cache, encoding, fieldsets, filters, hashing, live, metrics, pagination,
+    ratelimit, recaptcha, streaming, transfer,
+)
+from tinylog_server.db import archive as tiny_archive
+from tinylog_server.db import maintenance as tiny_maintenance
+from tinylog_server.db import migrations as tiny_migrations
 from tinylog_server.db import models as tiny_models
+from tinylog_server.db import rollups as tiny_rollups
+from tinylog_server.db import routing as tiny_routing
+from tinylog_server.db import search as tiny_search
 
 # This doesn't conform to PEP-8 but it is idiomatic for Flask
 app = Flask(__name__) #pylint: disable=C0103
@@ -23,6 +40,182 @@ CONFIG = envpy.get_config({
     "CAPTCHA_CHALLENGE": envpy.Schema(
         value_type=str,
     ),
+    "CAPTCHA_VERIFY_URL": envpy.Schema(
+        value_type=str,
+        default=recaptcha.captcha.RECAPTCHA_VALIDATION_URL,
+    ),
+    "CAPTCHA_CONNECT_TIMEOUT": envpy.Schema(
+        value_type=float,
+        default=3.05,
+    ),
+    "CAPTCHA_READ_TIMEOUT": envpy.Schema(
+        value_type=float,
+        default=5.0,
+    ),
+    "CAPTCHA_POOL_SIZE": envpy.Schema(
+        value_type=int,
+        default=10,
+    ),
+    "CAPTCHA_CACHE_TTL": envpy.Schema(
+        value_type=int,
+        default=0,
+    ),
+    "SESSION_CACHE_SIZE": envpy.Schema(
+        value_type=int,
+        default=10000,
+    ),
+    "SESSION_CACHE_TTL": envpy.Schema(
+        value_type=int,
+        default=60,
+    ),
+    "PAGE_SIZE": envpy.Schema(
+        value_type=int,
+        default=100,
+    ),
+    "MAX_PAGE_SIZE": envpy.Schema(
+        value_type=int,
+        default=1000,
+    ),
+    "STREAM_BATCH_SIZE": envpy.Schema(
+        value_type=int,
+        default=500,
+    ),
+    "BULK_MAX_ENTRIES": envpy.Schema(
+        value_type=int,
+        default=1000,
+    ),
+    "IMPORT_CHUNK_SIZE": envpy.Schema(
+        value_type=int,
+        default=5000,
+    ),
+    "HASH_WORKERS": envpy.Schema(
+        value_type=int,
+        default=2,
+    ),
+    "HASH_QUEUE_SIZE": envpy.Schema(
+        value_type=int,
+        default=16,
+    ),
+    "ARGON2_TIME_COST": envpy.Schema(
+        value_type=int,
+        default=None,
+    ),
+    "ARGON2_MEMORY_COST": envpy.Schema(
+        value_type=int,
+        default=None,
+    ),
+    "ARGON2_PARALLELISM": envpy.Schema(
+        value_type=int,
+        default=None,
+    ),
+    "LIVE_BACKEND": envpy.Schema(
+        value_type=str,
+        default="local",
+    ),
+    "LIVE_BUFFER_SIZE": envpy.Schema(
+        value_type=int,
+        default=256,
+    ),
+    "LIVE_HEARTBEAT": envpy.Schema(
+        value_type=int,
+        default=15,
+    ),
+    "LIVE_LOOKBACK": envpy.Schema(
+        value_type=float,
+        default=5.0,
+    ),
+    "ASGI_THREADS": envpy.Schema(
+        value_type=int,
+        default=32,
+    ),
+    "SESSION_SWEEP_INTERVAL": envpy.Schema(
+        value_type=int,
+        default=0,
+    ),
+    "SESSION_SWEEP_BATCH_SIZE": envpy.Schema(
+        value_type=int,
+        default=1000,
+    ),
+    "ARCHIVE_AFTER_DAYS": envpy.Schema(
+        value_type=int,
+        default=90,
+    ),
+    "ARCHIVE_BATCH_SIZE": envpy.Schema(
+        value_type=int,
+        default=5000,
+    ),
+    "DB_POOL_SIZE": envpy.Schema(
+        value_type=int,
+        default=None,
+    ),
+    "DB_MAX_OVERFLOW": envpy.Schema(
+        value_type=int,
+        default=None,
+    ),
+    "DB_POOL_TIMEOUT": envpy.Schema(
+        value_type=float,
+        default=None,
+    ),
+    "DB_POOL_RECYCLE": envpy.Schema(
+        value_type=int,
+        default=None,
+    ),
+    "DB_POOL_PRE_PING": envpy.Schema(
+        value_type=bool,
+        default=False,
+    ),
+    "READ_STICKINESS": envpy.Schema(
+        value_type=int,
+        default=5,
+    ),
+    "RESPONSE_CACHE_BACKEND": envpy.Schema(
+        value_type=str,
+        default="local",
+    ),
+    "RESPONSE_CACHE_TTL": envpy.Schema(
+        value_type=int,
+        default=30,
+    ),
+    "RESPONSE_CACHE_SIZE": envpy.Schema(
+        value_type=int,
+        default=1000,
+    ),
+    "COMPRESSION": envpy.Schema(
+        value_type=str,
+        default="br,gzip",
+    ),
+    "COMPRESSION_MIN_SIZE": envpy.Schema(
+        value_type=int,
+        default=1024,
+    ),
+    "COMPRESSION_LEVEL": envpy.Schema(
+        value_type=int,
+        default=6,
+    ),
+    "RATE_LIMIT_BACKEND": envpy.Schema(
+        value_type=str,
+        default="local",
+    ),
+    "RATE_LIMIT_SIZE": envpy.Schema(
+        value_type=int,
+        default=100000,
+    ),
+    "RATE_LIMIT_LOGIN": envpy.Schema(
+        value_type=str,
+        default="10/60",
+    ),
+    "RATE_LIMIT_SIGNUP": envpy.Schema(
+        value_type=str,
+        default="5/3600",
+    ),
+    "RATE_LIMIT_WRITES": envpy.Schema(
+        value_type=str,
+        default="120/60",
+    ),
+    "SLOW_REQUEST_THRESHOLD": envpy.Schema(
+        value_type=float,
+        default=0.0,
+    ),
 })
 
 SECRETS = envpy.get_config({
@@ -32,6 +225,18 @@ SECRETS = envpy.get_config({
     "DATABASE_DSN": envpy.Schema(
         value_type=str,
     ),
+    "DATABASE_REPLICA_DSNS": envpy.Schema(
+        value_type=str,
+        default=None,
+    ),
+    "RESPONSE_CACHE_URL": envpy.Schema(
+        value_type=str,
+        default=None,
+    ),
+    "RATE_LIMIT_URL": envpy.Schema(
+        value_type=str,
+        default=None,
+    ),
 })
 
 
@@ -50,11 +255,189 @@ def init():
 
     # Configure Flask App
     app.config['SQLALCHEMY_DATABASE_URI'] = SECRETS['DATABASE_DSN']
+    app.config['SQLALCHEMY_BINDS'] = tiny_routing.replica_binds(
+        SECRETS['DATABASE_REPLICA_DSNS'])
+
+    # Tune the connection pools, leaving unset options at their defaults
+    engine_options = {
+        'pool_size': CONFIG['DB_POOL_SIZE'],
+        'max_overflow': CONFIG['DB_MAX_OVERFLOW'],
+        'pool_timeout': CONFIG['DB_POOL_TIMEOUT'],
+        'pool_recycle': CONFIG['DB_POOL_RECYCLE'],
+    }
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+        name: value for name, value in engine_options.items()
+        if value is not None
+    }
+    if CONFIG['DB_POOL_PRE_PING']:
+        app.config['SQLALCHEMY_ENGINE_OPTIONS']['pool_pre_ping'] = True
 
     # Register app with SQLAlchemy
     tiny_models.DB.init_app(app)
+
+    # Configure captcha verification
+    verifier = recaptcha.HTTPVerifier(
+        url=CONFIG['CAPTCHA_VERIFY_URL'],
+        connect_timeout=CONFIG['CAPTCHA_CONNECT_TIMEOUT'],
+        read_timeout=CONFIG['CAPTCHA_READ_TIMEOUT'],
+        pool_size=CONFIG['CAPTCHA_POOL_SIZE'],
+    )
+    if CONFIG['CAPTCHA_CACHE_TTL'] > 0:
+        verifier = recaptcha.CachingVerifier(
+            verifier, ttl=CONFIG['CAPTCHA_CACHE_TTL'])
+    recaptcha.set_verifier(verifier)
+
+    # Tune password hashing for this hardware
+    tiny_models.configure_password_hashing(
+        time_cost=CONFIG['ARGON2_TIME_COST'],
+        memory_cost=CONFIG['ARGON2_MEMORY_COST'],
+        parallelism=CONFIG['ARGON2_PARALLELISM'],
+    )
 init()
 
+# Sweep expired sessions in the background if configured to. Deployments
+# with many workers can instead run 'flask sweep-sessions' from cron.
+if CONFIG['SESSION_SWEEP_INTERVAL'] > 0:
+    tiny_maintenance.SessionSweeper(
+        app,
+        interval=CONFIG['SESSION_SWEEP_INTERVAL'],
+        batch_size=CONFIG['SESSION_SWEEP_BATCH_SIZE'],
+    ).start()
+
+# Followers of live entry streams. With the postgres backend every worker
+# listens for NOTIFYs so entries posted to any worker reach its followers.
+# Set to None in the WSGI environ by tinylog_server.asgi. A view may
+# replace it with a coroutine function producing its response body on
+# the event loop, which is then sent instead of the body it returned.
+ASYNC_BODY = 'tinylog.async_body'
+
+LIVE = live.EntryBroadcaster(
+    buffer_size=CONFIG['LIVE_BUFFER_SIZE'],
+    lookback=datetime.timedelta(seconds=CONFIG['LIVE_LOOKBACK']),
+)
+if CONFIG['LIVE_BACKEND'] == 'postgres':
+    live.PostgresListener(app, LIVE).start()
+
+PASSWORD_POOL = hashing.HashingPool(
+    tiny_models.PWD_CONTEXT,
+    max_workers=CONFIG['HASH_WORKERS'],
+    max_pending=CONFIG['HASH_QUEUE_SIZE'],
+)
+
+# Request metrics, exposed with everything else in metrics.REGISTRY at
+# /metrics
+REQUEST_SECONDS = metrics.Histogram(
+    'tinylog_request_seconds',
+    'Time taken to handle a request, up to the start of a streamed body',
+    labels=('method', 'route', 'status'),
+)
+REQUEST_SQL_STATEMENTS = metrics.Histogram(
+    'tinylog_request_sql_statements',
+    'SQL statements executed while handling a request',
+    labels=('method', 'route'),
+    buckets=metrics.COUNT_BUCKETS,
+)
+REQUEST_SQL_SECONDS = metrics.Histogram(
+    'tinylog_request_sql_seconds',
+    'Time spent executing SQL while handling a request',
+    labels=('method', 'route'),
+)
+SLOW_REQUESTS = metrics.Counter(
+    'tinylog_slow_requests',
+    'Requests slower than SLOW_REQUEST_THRESHOLD',
+    labels=('method', 'route'),
+)
+metrics.CallbackGauge(
+    'tinylog_db_pool_connections',
+    'Database connections in the pool by state',
+    lambda: [
+        ((bind or 'primary', state), value)
+        for bind in [None] + tiny_routing.replica_keys(app)
+        for state, value in metrics.pool_usage(
+            tiny_models.DB.get_engine(app, bind=bind))
+    ],
+    labels=('database', 'state'),
+)
+metrics.CallbackGauge(
+    'tinylog_password_hash_pool',
+    'Password hashing operations running or queued on the pool',
+    lambda: [
+        (('in_flight',), PASSWORD_POOL.stats()['in_flight']),
+        (('queued',), PASSWORD_POOL.queue_depth),
+    ],
+    labels=('state',),
+)
+
+# Rendered listings of rarely changing collections. Views that change a
+# collection invalidate its namespace. With the local backend other
+# workers keep serving their copy for up to RESPONSE_CACHE_TTL seconds.
+if CONFIG['RESPONSE_CACHE_BACKEND'] == 'redis':
+    RESPONSE_CACHE_BACKEND = cache.RedisBackend(SECRETS['RESPONSE_CACHE_URL'])
+else:
+    RESPONSE_CACHE_BACKEND = cache.LocalBackend(
+        max_size=CONFIG['RESPONSE_CACHE_SIZE'])
+RESPONSE_CACHE = cache.ResponseCache(
+    RESPONSE_CACHE_BACKEND,
+    ttl=CONFIG['RESPONSE_CACHE_TTL'],
+    settle_time=CONFIG['READ_STICKINESS'],
+)
+RESPONSE_CACHE_REQUESTS = metrics.Counter(
+    'tinylog_response_cache_requests',
+    'Cacheable requests by namespace and whether they were served cached',
+    labels=('namespace', 'result'),
+)
+
+# Content codings used to compress responses, in order of preference
+COMPRESSION_ENCODINGS = encoding.available_encodings(CONFIG['COMPRESSION'])
+
+# Token buckets for the requests that are expensive to serve: logins and
+# signups by client address, writes by access token. With the local
+# store each worker enforces its own copy of every limit.
+if CONFIG['RATE_LIMIT_BACKEND'] == 'redis':
+    RATE_LIMIT_STORE = ratelimit.RedisStore(SECRETS['RATE_LIMIT_URL'])
+else:
+    RATE_LIMIT_STORE = ratelimit.LocalStore(
+        max_size=CONFIG['RATE_LIMIT_SIZE'])
+RATE_LIMITER = ratelimit.RateLimiter(RATE_LIMIT_STORE, {
+    'login': ratelimit.parse_limit(CONFIG['RATE_LIMIT_LOGIN']),
+    'signup': ratelimit.parse_limit(CONFIG['RATE_LIMIT_SIGNUP']),
+    'writes': ratelimit.parse_limit(CONFIG['RATE_LIMIT_WRITES']),
+})
+
+# Access tokens that made a write in the last READ_STICKINESS seconds.
+# Their reads go to the primary so they see their own writes even if the
+# replicas lag. Clients are also sent PRIMARY_COOKIE, which carries the
+# same promise to other workers.
+READ_METHODS = ('GET', 'HEAD', 'OPTIONS')
+PRIMARY_COOKIE = 'tinylog_read_primary'
+RECENT_WRITERS = cache.TTLCache(
+    max_size=CONFIG['SESSION_CACHE_SIZE'],
+    ttl=max(CONFIG['READ_STICKINESS'], 1),
+)
+
+# Validated sessions, keyed by access token. Entries never outlive the
+# session itself; the TTL bounds how long a logout on another worker can
+# go unnoticed by this one.
+SESSION_CACHE = cache.TTLCache(
+    max_size=CONFIG['SESSION_CACHE_SIZE'],
+    ttl=CONFIG['SESSION_CACHE_TTL'],
+)
+# Hit rate and occupancy, to size SESSION_CACHE_SIZE and SESSION_CACHE_TTL
+metrics.CallbackGauge(
+    'tinylog_session_cache',
+    'Session cache lookups, evictions and occupancy in this worker',
+    lambda: [((name,), value) for name, value in SESSION_CACHE.stats().items()],
+    labels=('stat',),
+)
+
+class CachedSession(collections.namedtuple(
+        'CachedSession', ['access_token', 'user_id', 'expires_at'])):
+    """Detached copy of a Session row that is safe to share between requests"""
+
+    @property
+    def is_valid(self):
+        return datetime.datetime.utcnow() < self.expires_at
+
 
 # Decorators
 
@@ -82,18 +465,302 @@ def authorized(view):
                 return jsonify('Unsupported auth type'), 400
 
         # Check session exists
-        session = tiny_models.Session.query.filter_by(
-            access_token=access_token).first()
+        session = get_session(access_token)
         if (
             session is None
             or not session.is_valid
         ):
             return jsonify('Invalid access token'), 403
 
+        # Let clients read their own recent writes
+        g.access_token = access_token
+        if RECENT_WRITERS.get(access_token):
+            tiny_routing.route_reads(tiny_models.DB.session(), False)
+
         return view(session, *args, **kwargs)
 
     return wrapper
 
+def rate_limited(name, per):
+    """Refuse a view's writes with a 429 once a client is over a limit
+
+    The check runs before the view, so a refused request does no work.
+    Reads are never limited.
+
+    Args:
+        name: The limit in RATE_LIMITER to check.
+        per: 'address' to count requests by client address, or 'token' to
+            count them by access token, for views that are @authorized.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method not in READ_METHODS:
+                if per == 'token':
+                    key = g.access_token
+                else:
+                    key = request.remote_addr or 'unknown'
+                RATE_LIMITER.check(name, key)
+            return view(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+def conditional_on_log(view):
+    """Answer conditional GETs on a log's resources from its version
+
+    The log's version and update time are read without loading any
+    entries. If the client's If-None-Match or If-Modified-Since shows its
+    copy is current a 304 is returned before the view runs, otherwise the
+    view's response is given ETag and Last-Modified headers.
+    If-Modified-Since only answers 304 for logs last updated no later
+    than the start of the second it names.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if request.method != 'GET':
+            return view(*args, **kwargs)
+
+        state = tiny_models.DB.session.query(
+            tiny_models.Log.version,
+            tiny_models.Log.updated_at,
+        ).filter_by(id=kwargs['log_id']).first()
+        if state is None:
+            return view(*args, **kwargs)
+
+        # Different pages, formats and encodings of the same log are
+        # different representations, so they get different tags
+        variant = zlib.crc32(
+            request.query_string
+            + request.headers.get('Accept', '').encode('utf-8')
+            + request.headers.get('Accept-Encoding', '').encode('utf-8')
+        )
+        etag = '{}-{}-{:x}'.format(kwargs['log_id'], state.version, variant)
+        last_modified = state.updated_at.replace(microsecond=0)
+
+        if request.if_none_match:
+            not_modified = request.if_none_match.contains(etag)
+        else:
+            # Last-Modified only has whole seconds, so a log updated after
+            # the start of the client's second may have changed since its
+            # copy was sent. Only the ETag can tell those apart.
+            not_modified = (
+                request.if_modified_since is not None
+                and state.updated_at <= request.if_modified_since
+            )
+
+        if not_modified:
+            response = Response(status=304)
+        else:
+            response = app.make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+        response.set_etag(etag)
+        response.last_modified = last_modified
+        return response
+
+    return wrapper
+
+
+# Request hooks
+
+@app.before_request
+def start_request_metrics():
+    """Start timing the request and counting the SQL it runs"""
+    g.request_started = time.perf_counter()
+    metrics.start_capture(
+        keep_statements=CONFIG['SLOW_REQUEST_THRESHOLD'] > 0)
+
+@app.after_request
+def record_request_metrics(response):
+    """Record the request's latency and SQL, and log it if it was slow
+
+    Streamed bodies are produced after this runs, so for them only the
+    time to the first byte and the SQL run before it are recorded.
+    """
+    capture = metrics.stop_capture()
+    started = g.get('request_started')
+    if started is None or capture is None:
+        return response
+    elapsed = time.perf_counter() - started
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+
+    REQUEST_SECONDS.labels(
+        request.method, route, response.status_code).observe(elapsed)
+    REQUEST_SQL_STATEMENTS.labels(request.method, route).observe(capture.count)
+    REQUEST_SQL_SECONDS.labels(request.method, route).observe(capture.seconds)
+
+    threshold = CONFIG['SLOW_REQUEST_THRESHOLD']
+    if threshold > 0 and elapsed >= threshold:
+        SLOW_REQUESTS.labels(request.method, route).inc()
+        app.logger.warning(
+            'Slow request: %s %s -> %s in %.1fms, %s SQL statements '
+            'in %.1fms%s',
+            request.method,
+            request.full_path.rstrip('?'),
+            response.status_code,
+            elapsed * 1000,
+            capture.count,
+            capture.seconds * 1000,
+            ''.join(
+                '\n  {:.1f}ms {}'.format(seconds * 1000, statement)
+                for statement, seconds in capture.statements
+            ),
+        )
+    return response
+
+
+@app.before_request
+def route_reads():
+    """Send the reads of safe requests to a replica, if there are any"""
+    tiny_routing.route_reads(
+        tiny_models.DB.session(),
+        request.method in READ_METHODS
+        and not request.cookies.get(PRIMARY_COOKIE),
+    )
+
+@app.after_request
+def stick_to_primary(response):
+    """Keep a client that just wrote on the primary for a short time"""
+    if (
+            request.method not in READ_METHODS
+            and response.status_code < 400
+            and CONFIG['READ_STICKINESS'] > 0
+            and tiny_routing.replica_keys(app)
+    ):
+        access_token = g.get('access_token')
+        if access_token is not None:
+            RECENT_WRITERS.set(access_token, True)
+        response.set_cookie(
+            PRIMARY_COOKIE, '1', max_age=CONFIG['READ_STICKINESS'])
+    return response
+
+
+def cached_response(namespace):
+    """Serve GETs of a collection from RESPONSE_CACHE
+
+    Responses are keyed by route, query parameters and root URL. Views
+    that change the collection must invalidate namespace.
+
+    Args:
+        namespace: The collection the view lists.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method != 'GET' or CONFIG['RESPONSE_CACHE_TTL'] <= 0:
+                return view(*args, **kwargs)
+
+            key = RESPONSE_CACHE.key(
+                namespace,
+                request.url_rule.rule,
+                list(request.args.items(multi=True)),
+                request.url_root,
+                variant=(
+                    encoding.MSGPACK_MIMETYPE
+                    if encoding.wants_msgpack(request.accept_mimetypes)
+                    else encoding.JSON_MIMETYPE
+                ),
+            )
+            cached = RESPONSE_CACHE.get(namespace, key)
+            if cached is not None:
+                RESPONSE_CACHE_REQUESTS.labels(namespace, 'hit').inc()
+                response = Response(
+                    cached.body,
+                    status=cached.status,
+                    content_type=cached.content_type,
+                )
+                for header in cached.vary:
+                    response.vary.add(header)
+                response.headers['X-Cache'] = 'HIT'
+                return response
+
+            RESPONSE_CACHE_REQUESTS.labels(namespace, 'miss').inc()
+            response = app.make_response(view(*args, **kwargs))
+            if response.status_code == 200 and not response.is_streamed:
+                RESPONSE_CACHE.set(
+                    namespace,
+                    key,
+                    cache.CachedResponse(
+                        response.status_code,
+                        response.content_type,
+                        response.get_data(),
+                        response.vary,
+                    ),
+                    from_replica=(
+                        tiny_models.DB.session().replica_reads
+                        and bool(tiny_routing.replica_keys(app))
+                    ),
+                )
+            response.headers['X-Cache'] = 'MISS'
+            return response
+
+        return wrapper
+    return decorator
+
+
+@app.after_request
+def compress(response):
+    """Compress large responses with an encoding the client accepts"""
+    return encoding.compress_response(
+        response,
+        request.accept_encodings,
+        COMPRESSION_ENCODINGS,
+        min_size=CONFIG['COMPRESSION_MIN_SIZE'],
+        level=CONFIG['COMPRESSION_LEVEL'],
+    )
+
+
+# Error handlers
+
+@app.errorhandler(pagination.PaginationError)
+def pagination_error(error):
+    """Reject requests with a malformed limit or cursor"""
+    return jsonify(str(error)), 400
+
+@app.errorhandler(filters.FilterError)
+def filter_error(error):
+    """Reject requests with malformed filter parameters"""
+    return jsonify(str(error)), 400
+
+@app.errorhandler(fieldsets.FieldsetError)
+def fieldset_error(error):
+    """Reject requests for fields a resource does not have"""
+    return jsonify(str(error)), 400
+
+@app.errorhandler(transfer.TransferError)
+def transfer_error(error):
+    """Reject imports that are malformed or clash with existing data"""
+    return jsonify(str(error)), 400
+
+@app.errorhandler(ratelimit.RateLimitExceeded)
+def rate_limit_exceeded(error):
+    """Tell clients over a rate limit when to try again"""
+    response = jsonify('Too many requests, please try again later')
+    response.status_code = 429
+    response.headers['Retry-After'] = str(
+        max(int(math.ceil(error.retry_after)), 1))
+    return response
+
+@app.errorhandler(recaptcha.VerificationError)
+def captcha_unavailable(error):
+    """Ask for a retry when the captcha service could not be reached"""
+    response = jsonify('Captcha verification is unavailable, please try '
+                       'again shortly')
+    response.status_code = 503
+    response.headers['Retry-After'] = '1'
+    return response
+
+@app.errorhandler(hashing.PoolSaturatedError)
+def hashing_pool_saturated(error):
+    """Turn requests away quickly while password hashing is backed up"""
+    response = jsonify('Server is busy, please try again shortly')
+    response.status_code = 503
+    response.headers['Retry-After'] = '1'
+    response.headers['X-Hash-Queue-Depth'] = str(error.queue_depth)
+    return response
+
 
 # Views
 
@@ -102,9 +769,12 @@ def authorized(view):
 @app.route('/')
 def index():
     """Return API Index"""
+    request_urls = urls()
     return jsonify({
-        'users': make_url(request, 'users'),
-        'logs': make_url(request, 'logs'),
+        'users': request_urls.path('users'),
+        'logs': request_urls.path('logs'),
+        'entries': request_urls.path('entries'),
+        'search': request_urls.path('search'),
     })
 
 @app.route('/captcha-challenge/')
@@ -113,12 +783,19 @@ def captcha_challenge():
     return jsonify(CONFIG['CAPTCHA_CHALLENGE'])
 
 @app.route('/users/', methods=['GET', 'POST'])
+@cached_response('users')
+@rate_limited('signup', per='address')
 def users():
     """View and manage users"""
     if request.method == 'GET':
-        all_users = tiny_models.User.query.all()
-        return jsonify({
-            'users': [user.to_dict(request.url_root) for user in all_users],
+        page, cursor = get_page(
+            tiny_models.User.query,
+            (tiny_models.User.username,),
+        )
+        request_urls = urls()
+        return render({
+            'users': [user.to_dict(request_urls) for user in page],
+            'next': page_url(request, cursor),
         })
 
     elif request.method == 'POST':
@@ -154,13 +831,14 @@ def users():
         # Create user in db
         new_user = tiny_models.User(
             username=username,
-            password=password,
+            password_hash=PASSWORD_POOL.hash(password),
             display_name=display_name,
         )
         tiny_models.DB.session.add(new_user)
         tiny_models.DB.session.commit()
+        RESPONSE_CACHE.invalidate('users')
 
-        return jsonify(new_user.to_dict(request.url_root)), 201
+        return jsonify(new_user.to_dict(urls())), 201
 
 @app.route('/users/<username>/', methods=['GET'])
 def user(username):
@@ -168,9 +846,10 @@ def user(username):
     selected_user = tiny_models.User.query.filter_by(username=username).first()
     if selected_user is None:
         abort(404, 'User does not exist.')
-    return jsonify(selected_user.to_dict(request.url_root))
+    return jsonify(selected_user.to_dict(urls()))
 
 @app.route('/login/', methods=['POST'])
+@rate_limited('login', per='address')
 def login():
     """Try to login using the given credentials"""
     request_data = request.json or {}
@@ -187,7 +866,7 @@ def login():
     selected_user = tiny_models.User.query.filter_by(username=username).first()
     good_creds = (
         selected_user is not None
-        and selected_user.is_correct_password(password)
+        and PASSWORD_POOL.verify(password, selected_user.password_hash)
     )
     if not good_creds:
         return jsonify('Incorrect username/password'), 403
@@ -196,6 +875,7 @@ def login():
     session = tiny_models.Session(selected_user.id)
     tiny_models.DB.session.add(session)
     tiny_models.DB.session.commit()
+    g.access_token = session.access_token
 
     return jsonify({
         'access_token': session.access_token,
@@ -205,7 +885,9 @@ def login():
 @authorized
 def logout(session):
     """Invalidate the given access token"""
-    tiny_models.DB.session.delete(session)
+    SESSION_CACHE.pop(session.access_token)
+    tiny_models.Session.query.filter_by(
+        access_token=session.access_token).delete()
     tiny_models.DB.session.commit()
     return jsonify("Logged out successfully")
 
@@ -214,20 +896,33 @@ def logout(session):
 def current_user(session):
     """Return the currently logged in user"""
     selected_user = tiny_models.User.query.filter_by(id=session.user_id).first()
-    return jsonify(selected_user.to_dict(request.url_root))
+    return jsonify(selected_user.to_dict(urls()))
 
 
 ## Log views
 
 @app.route('/logs/', methods=['GET', 'POST'])
 @authorized
+@rate_limited('writes', per='token')
+@cached_response('logs')
 def logs(_):
     """All logs available to the current user"""
     if request.method == 'GET':
         # Until we have permissions, all users can access all logs
-        all_logs = tiny_models.Log.query.all()
-        return jsonify({
-            'logs': [log.to_dict(request.url_root) for log in all_logs],
+        fieldset = fieldsets.parse(request.args, tiny_models.Log)
+        page, cursor = get_page(
+            tiny_models.Log.query.options(*fieldsets.log_options(fieldset)),
+            (tiny_models.Log.created_at, tiny_models.Log.id),
+        )
+        if 'entries' in fieldset.embed:
+            tiny_archive.load_archived_entries(page)
+        request_urls = urls()
+        return render({
+            'logs': [
+                log.to_dict(request_urls, fieldset.fields, fieldset.embed)
+                for log in page
+            ],
+            'next': page_url(request, cursor),
         })
 
     elif request.method == 'POST':
@@ -248,20 +943,29 @@ def logs(_):
         )
         tiny_models.DB.session.add(log)
         tiny_models.DB.session.commit()
+        RESPONSE_CACHE.invalidate('logs')
 
-        return jsonify(log.to_dict(request.url_root)), 201
+        return jsonify(log.to_dict(urls())), 201
 
 @app.route('/logs/<log_id>/', methods=['GET'])
 @authorized
+@conditional_on_log
 def log(_, log_id):
     """A specific log"""
-    selected_log = tiny_models.Log.query.filter_by(id=log_id).first()
+    fieldset = fieldsets.parse(request.args, tiny_models.Log)
+    selected_log = tiny_models.Log.query.options(
+        *fieldsets.log_options(fieldset)).filter_by(id=log_id).first()
     if selected_log is None:
-        jsonify('Log does not exist.'), 404
-    return jsonify(selected_log.to_dict(request.url_root))
+        return jsonify('Log does not exist.'), 404
+    if 'entries' in fieldset.embed:
+        tiny_archive.load_archived_entries([selected_log])
+    return render(selected_log.to_dict(
+        urls(), fieldset.fields, fieldset.embed))
 
 @app.route('/logs/<log_id>/entries/', methods=['GET', 'POST'])
 @authorized
+@rate_limited('writes', per='token')
+@conditional_on_log
 def entries(session, log_id):
     """All log entries for a given log"""
     log = tiny_models.Log.query.filter_by(id=log_id).first()
@@ -269,50 +973,583 @@ def entries(session, log_id):
         return jsonify('No such log'), 404
 
     if request.method == 'GET':
-        entries = tiny_models.Entry.query.filter_by(log_id=log_id)
-        return jsonify({
-            'entries': [entry.to_dict(request.url_root) for entry in entries],
+        fieldset = fieldsets.parse(request.args, tiny_models.Entry)
+        tiers = [
+            (
+                model.query.options(
+                    *fieldsets.entry_options(fieldset, model)
+                ).filter(
+                    model.log_id == log_id,
+                    *filters.entry_filters(request.args, model)
+                ),
+                (model.created_at, model.id),
+            )
+            for model in entry_tiers(log.archived_until)
+        ]
+
+        if wants_stream(request):
+            return stream_listing(
+                request, 'entries', tiers, fieldset.fields)
+
+        page, cursor = get_merged_page(tiers)
+        request_urls = urls()
+        return render({
+            'entries': [
+                entry.to_dict(request_urls, fieldset.fields)
+                for entry in page
+            ],
+            'next': page_url(request, cursor),
         })
 
     elif request.method == 'POST':
         request_data = request.json or {}
-        title = request_data.get('title')
-        description = request_data.get('description')
 
         # Validate input
-        if title is None:
-            return jsonify('Log Entry title is required'), 400
-        if description is None:
-            return jsonify('Log Entry description is required'), 400
+        error = validate_entry(request_data)
+        if error is not None:
+            return jsonify(error), 400
 
-        # Create Entry
+        # Create Entry. Serialise it before committing, which would expire
+        # it, with its author held in the identity map as in bulk_entries.
+        author = tiny_models.User.query.get(session.user_id)
         entry = tiny_models.Entry(
-            title=title,
-            description=description,
+            title=request_data['title'],
+            description=request_data['description'],
             log_id=log_id,
-            author_id=session.user_id,
+            author_id=author.id,
         )
         tiny_models.DB.session.add(entry)
+        tiny_models.DB.session.flush()
+        entry_dict = entry.to_dict(urls())
+        events = entry_events([entry])
+        entries_added(log_id, [entry])
         tiny_models.DB.session.commit()
+        # Log listings embed their entries
+        RESPONSE_CACHE.invalidate('logs')
+
+        publish_events(events)
+        return jsonify(entry_dict), 201
+
+@app.route('/logs/<log_id>/entries/stream', methods=['GET'])
+@authorized
+def entry_stream(_, log_id):
+    """Follow the new entries of a log as Server-Sent Events
 
-        return jsonify(entry.to_dict(request.url_root)), 201
+    A client reconnecting with the id of the last event it received as
+    Last-Event-ID is first sent every entry it missed. Entries created up
+    to LIVE_LOOKBACK seconds before that event may be sent again, since
+    they can commit in any order.
+    """
+    log = tiny_models.Log.query.filter_by(id=log_id).first()
+    if log is None:
+        return jsonify('No such log'), 404
+
+    last_event_id = request.headers.get('Last-Event-ID')
+    resume_key = None
+    if last_event_id:
+        resume_key = tuple(
+            pagination.decode_cursor(last_event_id, live.SORT_COLUMNS))
+
+    stream = live.EventStream(
+        app,
+        LIVE,
+        log_id,
+        urls(),
+        resume_key=resume_key,
+        heartbeat=CONFIG['LIVE_HEARTBEAT'],
+        batch_size=CONFIG['STREAM_BATCH_SIZE'],
+    )
+    # Served by tinylog_server.asgi, followers wait on the event loop
+    # instead of holding a thread each
+    if ASYNC_BODY in request.environ:
+        request.environ[ASYNC_BODY] = stream.async_events
+
+    return Response(
+        stream_with_context(stream.events()),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no',
+        },
+    )
+
+@app.route('/logs/<log_id>/entries/bulk/', methods=['POST'])
+@authorized
+@rate_limited('writes', per='token')
+def bulk_entries(session, log_id):
+    """Create a batch of log entries in a single transaction
+
+    The body is a JSON array of entries, or one entry per line when sent
+    as NDJSON. Either every entry is created or, if any of them is
+    invalid, none are.
+    """
+    log = tiny_models.Log.query.filter_by(id=log_id).first()
+    if log is None:
+        return jsonify('No such log'), 404
+
+    try:
+        items = read_entry_batch(request)
+    except ValueError as error:
+        return jsonify(str(error)), 400
+    if not items:
+        return jsonify('At least one entry is required'), 400
+    if len(items) > CONFIG['BULK_MAX_ENTRIES']:
+        return jsonify('At most {} entries can be created at once'.format(
+            CONFIG['BULK_MAX_ENTRIES'])), 413
+
+    # Validate input
+    errors = [validate_entry(item) for item in items]
+    if any(error is not None for error in errors):
+        return jsonify({
+            'results': [
+                {'status': 400, 'error': error} if error is not None
+                else {'status': 424, 'error': 'Another entry is invalid'}
+                for error in errors
+            ],
+        }), 400
+
+    # Create Entries. Holding the author keeps it in the identity map so
+    # serialising the new entries does not query for it again.
+    author = tiny_models.User.query.get(session.user_id)
+    new_entries = [
+        tiny_models.Entry(
+            title=item['title'],
+            description=item['description'],
+            log_id=log_id,
+            author_id=author.id,
+        )
+        for item in items
+    ]
+    tiny_models.DB.session.add_all(new_entries)
+    tiny_models.DB.session.flush()
+    request_urls = urls()
+    results = [
+        {'status': 201, 'entry': new_entry.to_dict(request_urls)}
+        for new_entry in new_entries
+    ]
+    events = entry_events(new_entries)
+    entries_added(log_id, new_entries)
+    tiny_models.DB.session.commit()
+    RESPONSE_CACHE.invalidate('logs')
+    publish_events(events)
+
+    return jsonify({'results': results}), 201
 
 @app.route('/logs/<log_id>/entries/<entry_id>/', methods=['GET'])
 @authorized
 def entry(_, log_id, entry_id):
     """A specific log entry"""
-    selected_entry = tiny_models.Entry.query.filter_by(id=entry_id).first()
+    fieldset = fieldsets.parse(request.args, tiny_models.Entry)
+    selected_entry = tiny_archive.find_entry(
+        entry_id, lambda model: fieldsets.entry_options(fieldset, model))
     if (
         selected_entry is None
-        or not selected_entry.log.id != log_id
+        or selected_entry.log_id != log_id
     ):
-        jsonify('Log Entry does not exist.'), 404
+        return jsonify('Log Entry does not exist.'), 404
+
+    return jsonify(selected_entry.to_dict(urls(), fieldset.fields))
+
+@app.route('/logs/<log_id>/export/', methods=['GET'])
+@authorized
+def export_log(_, log_id):
+    """Download a log and its entries as gzip compressed NDJSON or CSV"""
+    selected_log = tiny_models.Log.query.filter_by(id=log_id).first()
+    if selected_log is None:
+        return jsonify('Log does not exist.'), 404
+    export_format = request.args.get('format', 'ndjson')
+    if export_format not in transfer.FORMATS:
+        return jsonify('Unsupported export format'), 400
+
+    body = transfer.gzip_chunks(transfer.export_lines(
+        selected_log, export_format, CONFIG['STREAM_BATCH_SIZE']))
+    return Response(
+        stream_with_context(body),
+        mimetype='application/gzip',
+        headers={
+            'Content-Disposition': 'attachment; filename=log-{}.{}.gz'.format(
+                log_id, export_format),
+        },
+    )
+
+@app.route('/logs/import/', methods=['POST'])
+@authorized
+@rate_limited('writes', per='token')
+def import_log(_):
+    """Create a log from an export, keeping its entries' ids and times
+
+    The body is an export as produced by GET /logs/<log_id>/export/,
+    gzip compressed or not. The format, name and description args choose
+    the format and override the log's details.
+    """
+    import_format = request.args.get('format', 'ndjson')
+    if import_format not in transfer.FORMATS:
+        return jsonify('Unsupported import format'), 400
+
+    imported_log, count = transfer.import_log(
+        transfer.read_records(
+            transfer.decompressed_lines(request.stream), import_format),
+        name=request.args.get('name'),
+        description=request.args.get('description'),
+        chunk_size=CONFIG['IMPORT_CHUNK_SIZE'],
+    )
+    RESPONSE_CACHE.invalidate('logs')
+    return jsonify({
+        'log': imported_log.to_dict(urls(), embed=()),
+        'imported': count,
+    }), 201
+
+@app.route('/logs/<log_id>/stats/', methods=['GET'])
+@authorized
+@conditional_on_log
+def log_stats(_, log_id):
+    """Entry counts for a log, in total, per author and per day
+
+    The per-author and per-day counts can be limited to the days from
+    since (inclusive) to until (exclusive).
+    """
+    selected_log = tiny_models.Log.query.filter_by(id=log_id).first()
+    if selected_log is None:
+        return jsonify('Log does not exist.'), 404
+
+    since = until = None
+    if request.args.get('since'):
+        since = filters.parse_date('since', request.args['since'])
+    if request.args.get('until'):
+        until = filters.parse_date('until', request.args['until'])
+
+    request_urls = urls()
+    return jsonify({
+        'log': selected_log.url(request_urls),
+        'entry_count': selected_log.entry_count,
+        'authors': [
+            {'author': request_urls.user(username), 'count': count}
+            for username, count
+            in tiny_rollups.author_counts(log_id, since, until)
+        ],
+        'days': [
+            {'day': day.isoformat(), 'count': count}
+            for day, count in tiny_rollups.day_counts(log_id, since, until)
+        ],
+    })
+
+@app.route('/entries/', methods=['GET'])
+@authorized
+def all_entries(_):
+    """Entries across every log, optionally filtered by time and author"""
+    fieldset = fieldsets.parse(request.args, tiny_models.Entry)
+    tiers = [
+        (
+            model.query.options(
+                *fieldsets.entry_options(fieldset, model)
+            ).filter(*filters.entry_filters(request.args, model)),
+            (model.created_at, model.id),
+        )
+        for model in entry_tiers(tiny_archive.newest_cutoff())
+    ]
 
-    return jsonify(selected_entry.to_dict(request.url_root))
+    if wants_stream(request):
+        return stream_listing(
+            request, 'entries', tiers, fieldset.fields)
+
+    page, cursor = get_merged_page(tiers)
+    request_urls = urls()
+    return render({
+        'entries': [
+            entry.to_dict(request_urls, fieldset.fields) for entry in page
+        ],
+        'next': page_url(request, cursor),
+    })
+
+
+## Search views
+
+@app.route('/search/', methods=['GET'])
+@authorized
+def search(_):
+    """Entries whose title or description match the q parameter"""
+    text = (request.args.get('q') or '').strip()
+    if not text:
+        return jsonify('Search query is required'), 400
+
+    after = request.args.get('after')
+    offset = pagination.decode_offset(after) if after is not None else 0
+    try:
+        results, has_more = tiny_search.search_entries(
+            text,
+            get_limit(request),
+            offset=offset,
+            log_id=request.args.get('log'),
+        )
+    except tiny_search.SearchUnavailableError:
+        return jsonify('Search is not available'), 501
+
+    cursor = None
+    if has_more:
+        cursor = pagination.encode_offset(offset + len(results))
+    request_urls = urls()
+    return render({
+        'entries': [entry.to_dict(request_urls) for entry in results],
+        'next': page_url(request, cursor),
+    })
+
+
+## Operational views
+
+@app.route('/metrics', methods=['GET'])
+def metrics_view():
+    """Return this process's metrics in the Prometheus text format"""
+    return Response(
+        metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE)
+
+
+# Commands
+
+@app.cli.command('migrate-db')
+def migrate_db():
+    """Apply pending schema migrations to the configured database"""
+    applied = tiny_migrations.upgrade(tiny_models.DB.engine)
+    app.logger.info('Applied migrations: %s', applied or 'none')
+
+@app.cli.command('export-log')
+@click.argument('log_id')
+@click.argument('path', type=click.Path(dir_okay=False, writable=True))
+@click.option('--format', 'export_format', type=click.Choice(transfer.FORMATS),
+              default='ndjson')
+def export_log_command(log_id, path, export_format):
+    """Write a log and its entries to a gzip compressed file"""
+    selected_log = tiny_models.Log.query.filter_by(id=log_id).first()
+    if selected_log is None:
+        raise click.ClickException('Log does not exist.')
+    with open(path, 'wb') as output:
+        for chunk in transfer.gzip_chunks(transfer.export_lines(
+                selected_log, export_format, CONFIG['STREAM_BATCH_SIZE'])):
+            output.write(chunk)
+    app.logger.info('Exported log %s to %s', log_id, path)
+
+@app.cli.command('import-log')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'import_format', type=click.Choice(transfer.FORMATS),
+              default='ndjson')
+@click.option('--name', help='Name the log, overriding the export')
+@click.option('--description', help='Describe the log, overriding the export')
+def import_log_command(path, import_format, name, description):
+    """Create a log from an export file, gzip compressed or not"""
+    with open(path, 'rb') as source:
+        try:
+            imported_log, count = transfer.import_log(
+                transfer.read_records(
+                    transfer.decompressed_lines(source), import_format),
+                name=name,
+                description=description,
+                chunk_size=CONFIG['IMPORT_CHUNK_SIZE'],
+            )
+        except transfer.TransferError as error:
+            raise click.ClickException(str(error))
+    app.logger.info('Imported %s entries into log %s', count, imported_log.id)
+
+@app.cli.command('archive-entries')
+@click.option('--older-than', 'days', type=int,
+              help='Archive entries older than this many days, overriding '
+              'ARCHIVE_AFTER_DAYS')
+def archive_entries(days):
+    """Move old entries from the entry table into the archive"""
+    if days is None:
+        days = CONFIG['ARCHIVE_AFTER_DAYS']
+    if days <= 0:
+        raise click.ClickException('Archiving is disabled')
+    moved = tiny_archive.archive_older_than(
+        days, batch_size=CONFIG['ARCHIVE_BATCH_SIZE'])
+    # Embedded entries are now loaded from both tiers
+    RESPONSE_CACHE.invalidate('logs')
+    app.logger.info('Archived %s entries older than %s days', moved, days)
+
+@app.cli.command('sweep-sessions')
+def sweep_sessions():
+    """Delete expired sessions from the configured database"""
+    removed = tiny_maintenance.sweep_expired_sessions(
+        CONFIG['SESSION_SWEEP_BATCH_SIZE'])
+    app.logger.info('Swept %s expired sessions', removed)
 
 
 # Utilities
 
-def make_url(current_request, path):
-    """Generate an absolute URL from the request and relative path"""
-    return os.path.join(current_request.url_root, path)
+def entries_added(log_id, new_entries):
+    """Record in the current transaction that entries were added to a log"""
+    tiny_models.Log.touch(log_id, entries_added=len(new_entries))
+    tiny_rollups.record(new_entries)
+    if CONFIG['LIVE_BACKEND'] == 'postgres':
+        live.notify(log_id)
+
+def entry_events(new_entries):
+    """Return the events publish_events sends for new entries
+
+    Only the local backend publishes them. Other backends tell followers
+    through the database, so no events are built for them.
+    """
+    if CONFIG['LIVE_BACKEND'] != 'local':
+        return []
+    return [live.EntryEvent(new_entry) for new_entry in new_entries]
+
+def publish_events(events):
+    """Send committed entries to this worker's live followers"""
+    if events:
+        LIVE.publish(events)
+
+def validate_entry(request_data):
+    """Return why the given entry data is invalid, or None if it is valid"""
+    if not isinstance(request_data, dict):
+        return 'Log Entry must be an object'
+    if request_data.get('title') is None:
+        return 'Log Entry title is required'
+    if request_data.get('description') is None:
+        return 'Log Entry description is required'
+    return None
+
+def read_entry_batch(current_request):
+    """Parse a batch of entries from a JSON array or NDJSON request body"""
+    if current_request.mimetype == streaming.NDJSON_MIMETYPE:
+        try:
+            return [
+                json.loads(line)
+                for line in current_request.get_data(as_text=True).splitlines()
+                if line.strip()
+            ]
+        except ValueError:
+            raise ValueError('Invalid NDJSON body')
+
+    items = current_request.get_json(silent=True)
+    if not isinstance(items, list):
+        raise ValueError('Expected a JSON array of entries')
+    return items
+
+def render(data):
+    """Return a listing as MessagePack or JSON, as the client prefers"""
+    return encoding.render(data, request.accept_mimetypes)
+
+def get_limit(current_request):
+    """Return the page size requested by the limit arg"""
+    return pagination.parse_limit(
+        current_request.args.get('limit'),
+        default=CONFIG['PAGE_SIZE'],
+        maximum=CONFIG['MAX_PAGE_SIZE'],
+    )
+
+def get_page(query, columns):
+    """Return the page of query selected by the limit and after args"""
+    return pagination.paginate(
+        query,
+        columns,
+        get_limit(request),
+        after=request.args.get('after'),
+    )
+
+def get_merged_page(tiers):
+    """Return the page of (query, columns) tiers selected by the args"""
+    return pagination.paginate_merged(
+        tiers,
+        get_limit(request),
+        after=request.args.get('after'),
+    )
+
+def entry_tiers(cutoff):
+    """Return the entry models an entry listing must read
+
+    The archive is skipped when the since arg or the after cursor starts
+    the listing at or after cutoff, the time entries were archived up to.
+    """
+    start = pagination.cursor_start(
+        request.args.get('after'),
+        (tiny_models.Entry.created_at, tiny_models.Entry.id),
+    )
+    since = filters.since(request.args)
+    if start is None or (since is not None and since > start):
+        start = since
+    return tiny_archive.tiers(cutoff, start)
+
+def wants_ndjson(current_request):
+    """Whether the client prefers NDJSON over a single JSON document"""
+    best_match = current_request.accept_mimetypes.best_match(
+        [streaming.JSON_MIMETYPE, streaming.NDJSON_MIMETYPE])
+    return best_match == streaming.NDJSON_MIMETYPE
+
+def wants_stream(current_request):
+    """Whether the client asked for a streamed rather than paged listing"""
+    return (
+        current_request.args.get('stream') == '1'
+        or wants_ndjson(current_request)
+    )
+
+def stream_listing(current_request, key, tiers, fields=None):
+    """Stream every row of (query, columns) tiers after the optional cursor
+
+    The tiers' rows are merged into one order. Rows are sent as NDJSON if
+    the client accepts it, otherwise as a JSON document shaped like a
+    single page listing every row. fields is passed on to each row's
+    to_dict.
+    """
+    rows = pagination.merge_ordered(
+        [
+            streaming.iter_rows(
+                pagination.order_after(
+                    query,
+                    columns,
+                    after=current_request.args.get('after'),
+                ),
+                CONFIG['STREAM_BATCH_SIZE'],
+            )
+            for query, columns in tiers
+        ],
+        tiers[0][1],
+    )
+    request_urls = tiny_models.url_builder(current_request.url_root)
+    serialize = lambda row: row.to_dict(request_urls, fields)
+
+    if wants_ndjson(current_request):
+        body = streaming.ndjson_lines(rows, serialize)
+        mimetype = streaming.NDJSON_MIMETYPE
+    else:
+        body = streaming.json_document(key, rows, serialize)
+        mimetype = streaming.JSON_MIMETYPE
+
+    return Response(stream_with_context(body), mimetype=mimetype)
+
+def page_url(current_request, cursor):
+    """Return the URL of the page starting after cursor, if there is one"""
+    if cursor is None:
+        return None
+    args = current_request.args.copy()
+    args['after'] = cursor
+    return current_request.base_url + '?' + url_encode(args)
+
+def get_session(access_token):
+    """Look up a session by access token, consulting SESSION_CACHE first"""
+    session = SESSION_CACHE.get(access_token)
+    if session is not None:
+        return session
+
+    # Sessions are read from a replica when there is one. A session that
+    # has not reached it yet is looked up again on the primary.
+    with tiny_routing.replica_reads(tiny_models.DB.session()):
+        row = tiny_models.Session.query.filter_by(
+            access_token=access_token).first()
+    if row is None and tiny_routing.replica_keys(app):
+        with tiny_routing.replica_reads(tiny_models.DB.session(), False):
+            row = tiny_models.Session.query.filter_by(
+                access_token=access_token).first()
+    if row is None:
+        return None
+
+    session = CachedSession(row.access_token, row.user_id, row.expires_at)
+    if session.is_valid:
+        remaining = session.expires_at - datetime.datetime.utcnow()
+        SESSION_CACHE.set(
+            access_token,
+            session,
+            ttl=min(SESSION_CACHE.ttl, remaining.total_seconds()),
+        )
+    return session
+
+def urls():
+    """Return the UrlBuilder for links in the current request's responses"""
+    return tiny_models.url_builder(request.url_root)
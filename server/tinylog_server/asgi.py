@@ -0,0 +1,279 @@
+"""ASGI entrypoint for the TinyLog API
+
+Serve with any ASGI server, e.g.
+
+    uvicorn tinylog_server.asgi:application
+
+Connections, keep-alive and slow clients are handled by the server's
+event loop. Views, SQLAlchemy and the database driver are synchronous,
+so each request runs its view on a bounded pool of ASGI_THREADS threads.
+That includes the captcha check on signup, which calls the verification
+service from the view's thread. Password hashing runs on its own pool.
+
+The request body is not buffered. The view reads it from the event loop
+one message at a time, as it consumes wsgi.input, so streaming imports
+keep their constant memory use.
+
+A view can also send its response body from the event loop, by
+replacing environ[ASYNC_BODY] with a coroutine function as described in
+tinylog_server.app. Live entry streams do this, so a follower holds a
+pool thread only while its view runs and while it queries the
+database. An idle follower holds none.
+"""
+
+import asyncio
+import concurrent.futures
+import sys
+
+from tinylog_server.app import ASYNC_BODY, CONFIG, app
+
+
+class RequestBody(object):
+    """wsgi.input for an ASGI request, received as the view reads it
+
+    Reads run on a pool thread and wait for the event loop to receive the
+    next message, so at most one message is held in memory beyond what
+    the caller asked for.
+
+    Args:
+        receive: The ASGI receive callable.
+        loop: The event loop receive must be awaited on.
+    """
+
+    def __init__(self, receive, loop):
+        self._receive = receive
+        self._loop = loop
+        self._buffer = b''
+        self._more = True
+        self.disconnected = False
+
+    def read(self, size=-1):
+        while self._more and (size is None or size < 0
+                              or len(self._buffer) < size):
+            self._fill()
+        return self._take(len(self._buffer) if size is None or size < 0
+                          else size)
+
+    def readline(self, size=-1):
+        while self._more and b'\n' not in self._buffer and (
+                size is None or size < 0 or len(self._buffer) < size):
+            self._fill()
+        end = self._buffer.find(b'\n') + 1 or len(self._buffer)
+        if size is not None and size >= 0:
+            end = min(end, size)
+        return self._take(end)
+
+    def readlines(self, hint=-1): #pylint: disable=W0613
+        return list(self)
+
+    def __iter__(self):
+        line = self.readline()
+        while line:
+            yield line
+            line = self.readline()
+
+    def close(self):
+        """Stop receiving, e.g. once the view has returned"""
+        self._more = False
+        self._buffer = b''
+
+    def _fill(self):
+        message = asyncio.run_coroutine_threadsafe(
+            self._receive(), self._loop).result()
+        if message['type'] == 'http.disconnect':
+            self.disconnected = True
+            self._more = False
+            return
+        self._buffer += message.get('body', b'')
+        self._more = message.get('more_body', False)
+
+    def _take(self, size):
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+class WsgiToAsgi(object):
+    """Adapts a WSGI app to the ASGI HTTP protocol
+
+    Args:
+        wsgi_app: The WSGI callable to serve.
+        max_workers: The number of views run at once.
+    """
+
+    def __init__(self, wsgi_app, max_workers):
+        self.wsgi_app = wsgi_app
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix='tinylog-asgi',
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            raise ValueError('Unsupported ASGI scope: {}'.format(scope['type']))
+
+        loop = asyncio.get_running_loop()
+        body = RequestBody(receive, loop)
+        environ = build_environ(scope, body)
+        environ[ASYNC_BODY] = None
+
+        # Once the view has returned, watch for the client going away so
+        # long-lived responses, such as live entry streams, stop
+        view_returned = asyncio.Event()
+        disconnected = asyncio.Event()
+        async def watch_disconnect():
+            await view_returned.wait()
+            if not body.disconnected:
+                while (await receive())['type'] != 'http.disconnect':
+                    pass
+            disconnected.set()
+        watcher = asyncio.ensure_future(watch_disconnect())
+
+        try:
+            async_body = await loop.run_in_executor(
+                self.executor,
+                self._run,
+                environ,
+                send,
+                loop,
+                lambda: loop.call_soon_threadsafe(view_returned.set),
+                disconnected,
+            )
+            if async_body is not None:
+                await self._send_async_body(async_body, send, disconnected)
+        finally:
+            watcher.cancel()
+
+    def _run(self, environ, send, loop, returned, disconnected):
+        def call(message):
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        status_headers = []
+        def start_response(status, headers, exc_info=None): #pylint: disable=W0613
+            status_headers[:] = [status, headers]
+
+        try:
+            result = self.wsgi_app(environ, start_response)
+        finally:
+            environ['wsgi.input'].close()
+            returned()
+        try:
+            async_body = environ[ASYNC_BODY]
+            if async_body is not None:
+                call(_response_start(*status_headers))
+                return async_body
+
+            started = False
+            for chunk in result:
+                if disconnected.is_set():
+                    return None
+                if not started:
+                    call(_response_start(*status_headers))
+                    started = True
+                if chunk:
+                    call({
+                        'type': 'http.response.body',
+                        'body': chunk,
+                        'more_body': True,
+                    })
+            if not started:
+                call(_response_start(*status_headers))
+            call({'type': 'http.response.body', 'body': b''})
+            return None
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+
+    async def _send_async_body(self, async_body, send, disconnected):
+        async def run(function, *args):
+            return await asyncio.get_running_loop().run_in_executor(
+                self.executor, function, *args)
+
+        async def pump():
+            chunks = async_body(run)
+            try:
+                async for chunk in chunks:
+                    await send({
+                        'type': 'http.response.body',
+                        'body': chunk.encode('utf-8'),
+                        'more_body': True,
+                    })
+                await send({'type': 'http.response.body', 'body': b''})
+            finally:
+                await chunks.aclose()
+
+        sending = asyncio.ensure_future(pump())
+        waiting = asyncio.ensure_future(disconnected.wait())
+        try:
+            await asyncio.wait(
+                [sending, waiting], return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            waiting.cancel()
+            sending.cancel()
+            try:
+                await sending
+            except asyncio.CancelledError:
+                pass
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+def build_environ(scope, body):
+    """Build a WSGI environ for an ASGI HTTP scope"""
+    server_name, server_port = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8')
+                       .decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server_name,
+        'SERVER_PORT': str(server_port),
+        'SERVER_PROTOCOL': 'HTTP/{}'.format(scope.get('http_version', '1.1')),
+        'REMOTE_ADDR': (scope.get('client') or ('', 0))[0],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name == 'CONTENT_TYPE' or name == 'CONTENT_LENGTH':
+            key = name
+        else:
+            key = 'HTTP_' + name
+        if key in environ:
+            value = environ[key] + ',' + value
+        environ[key] = value
+    # The body ends where the ASGI server says it does, so a chunked body
+    # without a Content-Length can still be read to the end
+    environ['wsgi.input_terminated'] = True
+    return environ
+
+
+def _response_start(status, headers):
+    return {
+        'type': 'http.response.start',
+        'status': int(status.split(' ', 1)[0]),
+        'headers': [
+            (name.lower().encode('latin-1'), value.encode('latin-1'))
+            for name, value in headers
+        ],
+    }
+
+
+application = WsgiToAsgi(app, max_workers=CONFIG['ASGI_THREADS']) #pylint: disable=C0103
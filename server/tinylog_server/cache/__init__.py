@@ -0,0 +1,8 @@
+from tinylog_server.cache.lru import TTLCache
+from tinylog_server.cache.responses import (
+    Backend,
+    CachedResponse,
+    LocalBackend,
+    RedisBackend,
+    ResponseCache,
+)
@@ -0,0 +1,191 @@
+"""Caching of whole responses to read-heavy listing requests
+
+Cached responses are grouped into namespaces, one per collection. Each
+namespace has a generation number that is part of every key in it, so a
+write invalidates the whole collection by bumping the generation; the
+old entries are never read again and age out of the backend.
+
+Backends only need get, set and incr. LocalBackend keeps everything in
+the worker, so an invalidation is only seen by the worker that made it
+and other workers serve their copy until it expires. RedisBackend shares
+entries and generations between every worker.
+"""
+
+import hashlib
+import json
+import threading
+
+from tinylog_server.cache.lru import TTLCache
+
+
+class Backend(object):
+    """Base class for response cache storage"""
+
+    def get(self, key):
+        """Return the bytes stored under key, or None"""
+        raise NotImplementedError()
+
+    def set(self, key, value, ttl):
+        """Store bytes under key for ttl seconds"""
+        raise NotImplementedError()
+
+    def incr(self, key):
+        """Atomically add one to the counter under key and return it"""
+        raise NotImplementedError()
+
+    def get_counter(self, key):
+        """Return the counter under key, or 0"""
+        raise NotImplementedError()
+
+
+class LocalBackend(Backend):
+    """Keeps responses in this process, least recently used evicted first
+
+    Args:
+        max_size: The number of responses kept.
+    """
+
+    def __init__(self, max_size):
+        self.entries = TTLCache(max_size=max_size, ttl=0)
+        self._lock = threading.Lock()
+        self._counters = {}
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def set(self, key, value, ttl):
+        self.entries.set(key, value, ttl=ttl)
+
+    def incr(self, key):
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+            return self._counters[key]
+
+    def get_counter(self, key):
+        return self._counters.get(key, 0)
+
+
+class RedisBackend(Backend):
+    """Shares responses between workers through Redis
+
+    Requires the redis package.
+
+    Args:
+        url: The Redis URL, e.g. redis://localhost:6379/0.
+        prefix (optional): Prepended to every key.
+    """
+
+    def __init__(self, url, prefix='tinylog:'):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, key):
+        return self.client.get(self.prefix + key)
+
+    def set(self, key, value, ttl):
+        self.client.set(self.prefix + key, value, ex=max(int(ttl), 1))
+
+    def incr(self, key):
+        return self.client.incr(self.prefix + key)
+
+    def get_counter(self, key):
+        return int(self.client.get(self.prefix + key) or 0)
+
+
+class CachedResponse(object):
+    """The parts of a response that are kept in the cache
+
+    vary lists the request headers the response was chosen by, which a
+    hit must repeat so shared caches keep the variants apart.
+    """
+
+    def __init__(self, status, content_type, body, vary=()):
+        self.status = status
+        self.content_type = content_type
+        self.body = body
+        self.vary = list(vary)
+
+    def dumps(self):
+        header = json.dumps([self.status, self.content_type, self.vary])
+        return header.encode('utf-8') + b'\n' + self.body
+
+    @classmethod
+    def loads(cls, data):
+        header, body = data.split(b'\n', 1)
+        status, content_type, *vary = json.loads(header.decode('utf-8'))
+        return cls(status, content_type, body, *vary)
+
+
+class ResponseCache(object):
+    """Caches responses by namespace and request
+
+    Args:
+        backend: Where responses and generations are stored.
+        ttl: Seconds a response is served from the cache at most.
+        settle_time (optional): Seconds after an invalidation during which
+            responses read from a replica are not stored, as the replica
+            may not have the write yet.
+    """
+
+    def __init__(self, backend, ttl, settle_time=0):
+        self.backend = backend
+        self.ttl = ttl
+        self.settle_time = settle_time
+        self._lock = threading.Lock()
+        self.hits = {}
+        self.misses = {}
+
+    def key(self, namespace, route, args, url_root, variant=''):
+        """Return the key of a request's response in namespace
+
+        Args:
+            namespace: The collection the response lists.
+            route: The URL rule that matched the request.
+            args: The request's query parameters as (name, value) pairs.
+            url_root: The root URL the response's links are built from.
+            variant (optional): Anything else the response depends on,
+                such as its negotiated format.
+        """
+        generation = self.backend.get_counter('generation:' + namespace)
+        digest = hashlib.sha256(json.dumps(
+            [route, sorted(args), url_root, variant]).encode('utf-8')
+        ).hexdigest()
+        return 'response:{}:{}:{}'.format(namespace, generation, digest)
+
+    def get(self, namespace, key):
+        """Return the CachedResponse stored under key, or None"""
+        data = self.backend.get(key)
+        with self._lock:
+            counts = self.misses if data is None else self.hits
+            counts[namespace] = counts.get(namespace, 0) + 1
+        return None if data is None else CachedResponse.loads(data)
+
+    def set(self, namespace, key, response, from_replica=False):
+        """Store response under key unless it may be stale"""
+        if from_replica and self.backend.get('settling:' + namespace):
+            return
+        self.backend.set(key, response.dumps(), self.ttl)
+
+    def invalidate(self, *namespaces):
+        """Forget every cached response in namespaces"""
+        for namespace in namespaces:
+            self.backend.incr('generation:' + namespace)
+            if self.settle_time > 0:
+                self.backend.set('settling:' + namespace, b'1',
+                                 self.settle_time)
+
+    def stats(self):
+        """Return hits, misses and the hit rate of every namespace"""
+        with self._lock:
+            namespaces = set(self.hits) | set(self.misses)
+            return {
+                namespace: {
+                    'hits': self.hits.get(namespace, 0),
+                    'misses': self.misses.get(namespace, 0),
+                    'hit_rate': self.hits.get(namespace, 0) / (
+                        self.hits.get(namespace, 0)
+                        + self.misses.get(namespace, 0)),
+                }
+                for namespace in namespaces
+            }
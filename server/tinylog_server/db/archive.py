@@ -0,0 +1,130 @@
+"""Moving old entries out of the hot entry table into an archive
+
+Entries older than a cutoff are moved, in batches, from entry to
+archived_entry, which has the same columns. This keeps entry and its
+indexes small enough to stay in memory. Each log remembers the newest
+cutoff it was archived up to in archived_until. That cutoff tells
+readers whether a range of a log's entries can be in the archive at
+all.
+
+Listings read both tiers and merge them in (created_at, id) order.
+Ranges starting at or after a log's cutoff skip the archive, since every
+archived entry is older than that. Entries can still reach the entry
+table with older timestamps, e.g. by import, so the entry table is
+always read; it is small and indexed on the same key.
+"""
+
+import datetime
+
+import sqlalchemy
+from sqlalchemy import orm
+
+from tinylog_server.db.models import DB, ArchivedEntry, Entry, Log
+
+_COLUMNS = ('id', 'title', 'description', 'log_id', 'user_id', 'created_at')
+
+
+def archive_entries(cutoff, batch_size=5000):
+    """Move entries created before cutoff into the archive
+
+    Each batch is copied and deleted in one transaction, so readers see
+    every entry in exactly one of the tiers.
+
+    Args:
+        cutoff: Entries created before this naive UTC datetime are moved.
+        batch_size (optional): The number of entries moved per
+            transaction.
+
+    Returns:
+        The number of entries moved.
+    """
+    total = 0
+    while True:
+        rows = DB.session.query(Entry.id, Entry.log_id).filter(
+            Entry.created_at < cutoff,
+        ).order_by(Entry.created_at, Entry.id).limit(batch_size).all()
+        if not rows:
+            break
+
+        ids = [row.id for row in rows]
+        columns = [getattr(Entry, name) for name in _COLUMNS]
+        DB.session.execute(ArchivedEntry.__table__.insert().from_select(
+            list(_COLUMNS),
+            sqlalchemy.select(columns).where(Entry.id.in_(ids)),
+        ))
+        Entry.query.filter(Entry.id.in_(ids)).delete(
+            synchronize_session=False)
+        Log.query.filter(
+            Log.id.in_({row.log_id for row in rows}),
+            sqlalchemy.or_(
+                Log.archived_until.is_(None),
+                Log.archived_until < cutoff,
+            ),
+        ).update({Log.archived_until: cutoff}, synchronize_session=False)
+        DB.session.commit()
+
+        total += len(ids)
+        if len(ids) < batch_size:
+            break
+    return total
+
+
+def archive_older_than(days, batch_size=5000, now=None):
+    """Archive the entries created more than days ago"""
+    if now is None:
+        now = datetime.datetime.utcnow()
+    return archive_entries(now - datetime.timedelta(days=days), batch_size)
+
+
+def newest_cutoff():
+    """Return the newest cutoff any log was archived up to, or None"""
+    return DB.session.query(sqlalchemy.func.max(Log.archived_until)).scalar()
+
+
+def tiers(cutoff, start=None):
+    """Return the entry models a listing must read, oldest tier first
+
+    Args:
+        cutoff: The time entries were archived up to, or None if none were.
+        start (optional): The earliest creation time the listing can
+            return, from its filters or cursor. The archive is skipped
+            when this is at or after cutoff.
+    """
+    if cutoff is None or (start is not None and start >= cutoff):
+        return [Entry]
+    return [ArchivedEntry, Entry]
+
+
+def load_archived_entries(logs):
+    """Load the archived entries of logs, with their authors, in one query
+
+    Logs that were never archived are skipped, so embedding entries only
+    costs a query when some of them were.
+    """
+    archived = {log.id: log for log in logs if log.archived_until is not None}
+    if not archived:
+        return
+    by_log = {log_id: [] for log_id in archived}
+    for entry in ArchivedEntry.query_with_relations().filter(
+            ArchivedEntry.log_id.in_(list(archived)),
+    ).order_by(ArchivedEntry.created_at, ArchivedEntry.id):
+        by_log[entry.log_id].append(entry)
+    for log_id, log in archived.items():
+        orm.attributes.set_committed_value(
+            log, 'archived_entries', by_log[log_id])
+
+
+def find_entry(entry_id, options=lambda model: ()):
+    """Return the entry with entry_id from whichever tier holds it
+
+    Args:
+        entry_id: The entry's id.
+        options (optional): A function returning the loader options to
+            query a model with.
+    """
+    for model in (Entry, ArchivedEntry):
+        found = model.query.options(*options(model)).filter_by(
+            id=entry_id).first()
+        if found is not None:
+            return found
+    return None
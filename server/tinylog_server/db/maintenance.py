@@ -0,0 +1,72 @@
+"""Housekeeping jobs that keep the database tables small"""
+
+import datetime
+import threading
+
+from tinylog_server.db.models import DB, Session
+
+
+def sweep_expired_sessions(batch_size=1000, now=None):
+    """Delete expired sessions, batch_size rows per transaction
+
+    Each batch selects its rows through the index on expires_at and
+    commits on its own, so the sweep never holds long locks on the
+    session table.
+
+    Returns:
+        The number of sessions deleted.
+    """
+    if now is None:
+        now = datetime.datetime.utcnow()
+
+    total = 0
+    while True:
+        tokens = [
+            row.access_token
+            for row in DB.session.query(Session.access_token)
+            .filter(Session.expires_at < now)
+            .limit(batch_size)
+        ]
+        if not tokens:
+            break
+        Session.query.filter(Session.access_token.in_(tokens)).delete(
+            synchronize_session=False)
+        DB.session.commit()
+        total += len(tokens)
+        if len(tokens) < batch_size:
+            break
+    return total
+
+
+class SessionSweeper(threading.Thread):
+    """Background thread that sweeps expired sessions on an interval
+
+    Args:
+        app: The Flask app whose database is swept.
+        interval: Seconds to wait between sweeps.
+        batch_size: Rows deleted per transaction.
+    """
+
+    def __init__(self, app, interval, batch_size):
+        super().__init__(name='tinylog-session-sweeper', daemon=True)
+        self.app = app
+        self.interval = interval
+        self.batch_size = batch_size
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            self.sweep()
+
+    def sweep(self):
+        """Run one sweep, reporting its outcome through the app's logger"""
+        try:
+            with self.app.app_context():
+                removed = sweep_expired_sessions(self.batch_size)
+            self.app.logger.info('Swept %s expired sessions', removed)
+        except Exception: #pylint: disable=W0703
+            self.app.logger.exception('Session sweep failed')
+
+    def stop(self):
+        """Stop sweeping once the current run has finished"""
+        self._stopped.set()
@@ -0,0 +1,187 @@
+"""Schema migrations for databases created by an earlier release
+
+New databases get the current schema from DB.create_all() and are then
+stamped as fully migrated. Existing databases run each migration they
+have not yet applied, in version order, with the applied versions kept
+in the schema_migration table.
+
+Migrations must leave the database usable by both the old and new code
+so they can run while the service is up. Indexes are built with
+CREATE INDEX CONCURRENTLY on PostgreSQL so writes are not blocked.
+"""
+
+import datetime
+import logging
+
+import sqlalchemy
+
+from tinylog_server.db import rollups, search
+from tinylog_server.db.models import ArchivedEntry, EntryRollup
+
+LOGGER = logging.getLogger(__name__)
+
+_METADATA = sqlalchemy.MetaData()
+SCHEMA_MIGRATION = sqlalchemy.Table(
+    'schema_migration',
+    _METADATA,
+    sqlalchemy.Column('version', sqlalchemy.Integer, primary_key=True),
+    sqlalchemy.Column('description', sqlalchemy.String(255)),
+    sqlalchemy.Column('applied_at', sqlalchemy.DateTime),
+)
+
+MIGRATIONS = []
+
+
+def migration(version, description):
+    """Register the decorated function as the migration for version
+
+    The function is called with a connection and should be safe to run
+    against a database where the change has already been made.
+    """
+    def register(function):
+        MIGRATIONS.append((version, description, function))
+        MIGRATIONS.sort(key=lambda item: item[0])
+        return function
+    return register
+
+
+def pending_migrations(engine):
+    """Return the migrations that have not been applied to engine"""
+    SCHEMA_MIGRATION.create(bind=engine, checkfirst=True)
+    applied = {
+        row.version
+        for row in engine.execute(sqlalchemy.select([SCHEMA_MIGRATION]))
+    }
+    return [item for item in MIGRATIONS if item[0] not in applied]
+
+
+def upgrade(engine):
+    """Apply every pending migration, returning the versions applied"""
+    applied = []
+    for version, description, function in pending_migrations(engine):
+        LOGGER.info('Applying migration %s: %s', version, description)
+        # Concurrent index builds cannot run inside a transaction
+        with engine.connect() as connection:
+            if engine.dialect.name == 'postgresql':
+                connection = connection.execution_options(
+                    isolation_level='AUTOCOMMIT')
+            function(connection)
+        _record(engine, version, description)
+        applied.append(version)
+    return applied
+
+
+def stamp(engine):
+    """Mark every migration as applied, for databases made by create_all"""
+    for version, description, _ in pending_migrations(engine):
+        _record(engine, version, description)
+
+
+def create_index(connection, name, table, columns):
+    """Create an index unless one with the same name already exists"""
+    quote = connection.dialect.identifier_preparer.quote
+    concurrently = (
+        'CONCURRENTLY ' if connection.dialect.name == 'postgresql' else ''
+    )
+    connection.execute('CREATE INDEX {}IF NOT EXISTS {} ON {} ({})'.format(
+        concurrently,
+        quote(name),
+        quote(table),
+        ', '.join(quote(column) for column in columns),
+    ))
+
+
+def drop_index(connection, name):
+    """Drop an index if it exists"""
+    concurrently = (
+        'CONCURRENTLY ' if connection.dialect.name == 'postgresql' else ''
+    )
+    connection.execute('DROP INDEX {}IF EXISTS {}'.format(
+        concurrently, connection.dialect.identifier_preparer.quote(name)))
+
+
+def add_column(connection, table, column):
+    """Add column to table unless the table already has it"""
+    existing = {
+        info['name']
+        for info in sqlalchemy.inspect(connection).get_columns(table)
+    }
+    if column.name in existing:
+        return
+    quote = connection.dialect.identifier_preparer.quote
+    definition = '{} {}'.format(
+        quote(column.name), column.type.compile(dialect=connection.dialect))
+    if column.server_default is not None:
+        definition += ' DEFAULT {}'.format(column.server_default.arg)
+    if not column.nullable:
+        definition += ' NOT NULL'
+    connection.execute('ALTER TABLE {} ADD COLUMN {}'.format(
+        quote(table), definition))
+
+
+def _record(engine, version, description):
+    engine.execute(SCHEMA_MIGRATION.insert().values(
+        version=version,
+        description=description,
+        applied_at=datetime.datetime.utcnow(),
+    ))
+
+
+# Migrations
+
+@migration(1, 'Index hot lookup columns on entry, session and log')
+def index_lookup_columns(connection):
+    create_index(connection, 'ix_entry_log_id_created_at', 'entry',
+                 ['log_id', 'created_at', 'id'])
+    create_index(connection, 'ix_entry_created_at', 'entry', ['created_at'])
+    create_index(connection, 'ix_entry_user_id', 'entry', ['user_id'])
+    create_index(connection, 'ix_session_user_id', 'session', ['user_id'])
+    create_index(connection, 'ix_session_expires_at', 'session',
+                 ['expires_at'])
+    create_index(connection, 'ix_log_created_at', 'log', ['created_at', 'id'])
+
+
+@migration(2, 'Track a version and last update time on each log')
+def add_log_version(connection):
+    add_column(connection, 'log', sqlalchemy.Column(
+        'version', sqlalchemy.Integer, nullable=False, server_default='0'))
+    add_column(connection, 'log', sqlalchemy.Column(
+        'updated_at', sqlalchemy.DateTime))
+    connection.execute(
+        'UPDATE log SET updated_at = COALESCE('
+        '(SELECT MAX(entry.created_at) FROM entry'
+        ' WHERE entry.log_id = log.id), log.created_at) '
+        'WHERE updated_at IS NULL'
+    )
+
+
+@migration(3, 'Add a full-text index over entry titles and descriptions')
+def add_entry_search_index(connection):
+    search.install(connection, concurrently=True)
+
+
+@migration(4, 'Index entries by author and creation time')
+def index_entries_by_author(connection):
+    create_index(connection, 'ix_entry_user_id_created_at', 'entry',
+                 ['user_id', 'created_at', 'id'])
+    drop_index(connection, 'ix_entry_user_id')
+
+
+@migration(5, 'Maintain entry counts per log, author and day')
+def add_entry_rollups(connection):
+    add_column(connection, 'log', sqlalchemy.Column(
+        'entry_count', sqlalchemy.Integer, nullable=False, server_default='0'))
+    EntryRollup.__table__.create(bind=connection, checkfirst=True)
+    rollups.rebuild(connection)
+
+
+@migration(6, 'Add an archive table for old entries')
+def add_entry_archive(connection):
+    add_column(connection, 'log', sqlalchemy.Column(
+        'archived_until', sqlalchemy.DateTime))
+    ArchivedEntry.__table__.create(bind=connection, checkfirst=True)
+
+
+@migration(7, 'Add a full-text index over archived entries')
+def add_archived_entry_search_index(connection):
+    search.install(connection, concurrently=True, table='archived_entry')
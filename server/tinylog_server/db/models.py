@@ -1,13 +1,14 @@
 """Database models for TinyLog"""
 
 import datetime
-import os
+import functools
 import uuid
 
-from flask_sqlalchemy import SQLAlchemy
 from passlib.context import CryptContext
 
-DB = SQLAlchemy()
+from tinylog_server.db.routing import RoutingSQLAlchemy
+
+DB = RoutingSQLAlchemy()
 PWD_CONTEXT = CryptContext(
     schemes=["argon2", "pbkdf2_sha256", "des_crypt"],
     deprecated="auto",
@@ -21,21 +22,22 @@ class User(DB.Model):
     display_name = DB.Column(DB.String(30))
     password_hash = DB.Column(DB.String(255))
 
-    def __init__(self, username, password, display_name=None):
+    def __init__(self, username, password=None, display_name=None,
+                 password_hash=None):
         self.id = make_random_id()
         self.username = username
         self.display_name = display_name or username
-        self.password_hash = PWD_CONTEXT.hash(password)
+        self.password_hash = password_hash or PWD_CONTEXT.hash(password)
 
     def __repr__(self):
         return '<User {}>'.format(self.username)
 
-    def url(self, url_root):
-        return make_url(url_root, 'users/' + self.username)
+    def url(self, urls):
+        return urls.user(self.username)
 
-    def to_dict(self, url_root):
+    def to_dict(self, urls):
         return {
-            '_link': self.url(url_root),
+            '_link': self.url(urls),
             'username': self.username,
             'display_name': self.display_name,
         }
@@ -46,9 +48,9 @@ class User(DB.Model):
 
 class Session(DB.Model):
     access_token = DB.Column(DB.String(36), primary_key=True)
-    user_id = DB.Column(DB.String, DB.ForeignKey('user.id'))
+    user_id = DB.Column(DB.String, DB.ForeignKey('user.id'), index=True)
     created_at = DB.Column(DB.DateTime)
-    expires_at = DB.Column(DB.DateTime)
+    expires_at = DB.Column(DB.DateTime, index=True)
 
     def __init__(self, user_id):
         self.access_token = str(uuid.uuid4())
@@ -70,39 +72,144 @@ class Log(DB.Model):
     description = DB.Column(DB.String(255))
     created_at = DB.Column(DB.DateTime)
 
+    # Bumped whenever the log or its entries change, so clients can
+    # revalidate cached copies without any entries being loaded
+    version = DB.Column(DB.Integer, nullable=False, default=0)
+    updated_at = DB.Column(DB.DateTime)
+    entry_count = DB.Column(DB.Integer, nullable=False, default=0)
+
+    # Entries created before this time may have been moved to
+    # archived_entry; None if none ever were
+    archived_until = DB.Column(DB.DateTime)
+
     entries = DB.relationship("Entry", backref="log")
+    archived_entries = DB.relationship("ArchivedEntry")
+
+    __table_args__ = (
+        DB.Index('ix_log_created_at', 'created_at', 'id'),
+    )
+
+    # What to_dict can include, and the columns each field is read from
+    FIELDS = {
+        'name': ('name',),
+        'description': ('description',),
+        'entry_count': ('entry_count',),
+    }
+    EMBEDS = ('entries',)
 
     def __init__(self, name, description):
         self.id = make_random_id()
         self.name = name
         self.description = description
         self.created_at = datetime.datetime.utcnow()
+        self.version = 0
+        self.updated_at = self.created_at
+        self.entry_count = 0
 
     def __repr__(self):
         return '<Log {}, {}>'.format(self.name, self.id)
 
-    def url(self, url_root):
-        return make_url(url_root, 'logs/' + self.id)
+    @classmethod
+    def touch(cls, log_id, entries_added=0):
+        """Bump a log's version as part of the current transaction"""
+        cls.query.filter_by(id=log_id).update(
+            {
+                cls.version: cls.version + 1,
+                cls.updated_at: datetime.datetime.utcnow(),
+                cls.entry_count: cls.entry_count + entries_added,
+            },
+            synchronize_session=False,
+        )
+
+    def url(self, urls):
+        return urls.log(self.id)
+
+    def to_dict(self, urls, fields=None, embed=EMBEDS):
+        """Serialize the log
+
+        Args:
+            urls: The UrlBuilder links are built with.
+            fields (optional): The fields to include, defaults to all.
+            embed (optional): The related resources to include, defaults to
+                the log's entries, archived ones first.
+        """
+        data = {'_link': self.url(urls)}
+        for name in self.FIELDS:
+            if fields is None or name in fields:
+                data[name] = getattr(self, name)
+        if 'entries' in embed:
+            archived = (
+                self.archived_entries if self.archived_until is not None
+                else []
+            )
+            data['entries'] = [
+                entry.to_dict(urls) for entry in archived + self.entries]
+        return data
+
+
+class EntryMixin(object):
+    """Serialization shared by hot and archived entries"""
+
+    # What to_dict can include, and the columns each field is read from
+    FIELDS = {
+        'title': ('title',),
+        'description': ('description',),
+        'log': ('log_id',),
+        'author': ('user_id',),
+    }
+    EMBEDS = ()
+
+    @classmethod
+    def query_with_relations(cls):
+        """Query entries with the author to_dict needs joined in"""
+        return cls.query.options(DB.joinedload(cls.author))
+
+    def url(self, urls):
+        return urls.entry(self.log_id, self.id)
 
-    def to_dict(self, url_root):
-        return {
-            '_link': self.url(url_root),
-            'name': self.name,
-            'description': self.description,
-            'entries': [entry.to_dict(url_root) for entry in self.entries],
-        }
-
-
-class Entry(DB.Model):
+    def __repr__(self):
+        return '<{} {}, {}>'.format(type(self).__name__, self.title, self.id)
+
+    def to_dict(self, urls, fields=None):
+        """Serialize the entry
+
+        Links are built from the entry's own columns, except the author's,
+        which needs the username: load the author along with the entry
+        when its field is included, as query_with_relations does.
+
+        Args:
+            urls: The UrlBuilder links are built with.
+            fields (optional): The fields to include, defaults to all.
+        """
+        data = {'_link': urls.entry(self.log_id, self.id)}
+        if fields is None or 'title' in fields:
+            data['title'] = self.title
+        if fields is None or 'description' in fields:
+            data['description'] = self.description
+        if fields is None or 'log' in fields:
+            data['log'] = urls.log(self.log_id)
+        if fields is None or 'author' in fields:
+            data['author'] = urls.user(self.author.username)
+        return data
+
+
+class Entry(EntryMixin, DB.Model):
     id = DB.Column(DB.String(36), primary_key=True)
     title = DB.Column(DB.String(30))
     description = DB.Column(DB.String(255))
     log_id = DB.Column(DB.String, DB.ForeignKey('log.id'))
-    created_at = DB.Column(DB.DateTime)
+    created_at = DB.Column(DB.DateTime, index=True)
 
     user_id = DB.Column(DB.String, DB.ForeignKey('user.id'))
     author = DB.relationship("User")
 
+    # Serve lookups by log or author as well as keyset pages and time
+    # ranges within them
+    __table_args__ = (
+        DB.Index('ix_entry_log_id_created_at', 'log_id', 'created_at', 'id'),
+        DB.Index('ix_entry_user_id_created_at', 'user_id', 'created_at', 'id'),
+    )
+
     def __init__(self, title, description, author_id, log_id):
         self.id = make_random_id()
         self.title = title
@@ -111,26 +218,96 @@ class Entry(DB.Model):
         self.log_id = log_id
         self.created_at = datetime.datetime.utcnow()
 
-    def url(self, url_root):
-        return make_url(url_root, 'logs/' + self.log.id + '/entries/' + self.id)
 
-    def __repr__(self):
-        return '<Entry {}, {}>'.format(self.title, self.id)
+class ArchivedEntry(EntryMixin, DB.Model):
+    """An entry moved out of the entry table once it grew old
 
-    def to_dict(self, url_root):
-        return {
-            '_link': self.url(url_root),
-            'title': self.title,
-            'description': self.description,
-            'log': self.log.url(url_root),
-            'author': self.author.url(url_root),
-        }
+    Rows are moved unchanged, keeping their ids, and are only ever read
+    or deleted along with their log. The archive has a full-text index
+    of its own, so archived entries stay searchable.
+    """
+    id = DB.Column(DB.String(36), primary_key=True)
+    title = DB.Column(DB.String(30))
+    description = DB.Column(DB.String(255))
+    log_id = DB.Column(DB.String, DB.ForeignKey('log.id'))
+    created_at = DB.Column(DB.DateTime)
+
+    user_id = DB.Column(DB.String, DB.ForeignKey('user.id'))
+    author = DB.relationship("User")
+
+    __table_args__ = (
+        DB.Index('ix_archived_entry_log_id_created_at',
+                 'log_id', 'created_at', 'id'),
+        DB.Index('ix_archived_entry_created_at', 'created_at', 'id'),
+        DB.Index('ix_archived_entry_user_id_created_at',
+                 'user_id', 'created_at', 'id'),
+    )
+
+
+class EntryRollup(DB.Model):
+    """The number of entries an author added to a log on one (UTC) day"""
+    log_id = DB.Column(DB.String, DB.ForeignKey('log.id'), primary_key=True)
+    day = DB.Column(DB.Date, primary_key=True)
+    user_id = DB.Column(DB.String, DB.ForeignKey('user.id'), primary_key=True)
+    count = DB.Column(DB.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return '<EntryRollup {}, {}, {}>'.format(
+            self.log_id, self.day, self.count)
 
 
 # Utilities
 
-def make_url(url_root, path):
-    return os.path.join(url_root, path)
+def configure_password_hashing(time_cost=None, memory_cost=None,
+                               parallelism=None):
+    """Override the argon2 cost parameters used for new password hashes
+
+    Parameters left as None keep passlib's defaults. Existing hashes carry
+    their own parameters, so they still verify after a change.
+    """
+    settings = {
+        'argon2__time_cost': time_cost,
+        'argon2__memory_cost': memory_cost,
+        'argon2__parallelism': parallelism,
+    }
+    PWD_CONTEXT.update(**{
+        key: value for key, value in settings.items() if value is not None
+    })
+
+class UrlBuilder(object):
+    """Builds resource links under one root URL
+
+    The prefix of every kind of resource is worked out once, so a link is
+    a single concatenation of column values.
+
+    Args:
+        url_root: The root URL links are built under, e.g. a request's
+            url_root.
+    """
+
+    def __init__(self, url_root):
+        if not url_root.endswith('/'):
+            url_root += '/'
+        self.root = url_root
+        self._users = url_root + 'users/'
+        self._logs = url_root + 'logs/'
+
+    def path(self, path):
+        return self.root + path
+
+    def user(self, username):
+        return self._users + username
+
+    def log(self, log_id):
+        return self._logs + log_id
+
+    def entry(self, log_id, entry_id):
+        return self._logs + log_id + '/entries/' + entry_id
+
+@functools.lru_cache(maxsize=64)
+def url_builder(url_root):
+    """Return the UrlBuilder for url_root, reused between requests"""
+    return UrlBuilder(url_root)
 
 def make_random_id():
     return str(uuid.uuid4())[:8]
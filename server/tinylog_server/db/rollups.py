@@ -0,0 +1,96 @@
+"""Incrementally maintained entry counts per log, author and day
+
+Counts are updated in the same transaction as the entries they count, so
+reading a total or a histogram touches one row per day and author
+instead of every entry.
+"""
+
+import collections
+
+import sqlalchemy
+
+from tinylog_server.db.models import DB, EntryRollup, User
+
+_UPSERT = sqlalchemy.text(
+    'INSERT INTO entry_rollup (log_id, day, user_id, count) '
+    'VALUES (:log_id, :day, :user_id, :count) '
+    'ON CONFLICT (log_id, day, user_id) '
+    'DO UPDATE SET count = entry_rollup.count + excluded.count'
+)
+
+
+def record(new_entries):
+    """Count new entries in the rollups as part of the current transaction"""
+    counts = collections.Counter(
+        (entry.log_id, entry.created_at.date(), entry.user_id)
+        for entry in new_entries
+    )
+    rows = [
+        {'log_id': log_id, 'day': day, 'user_id': user_id, 'count': count}
+        for (log_id, day, user_id), count in counts.items()
+    ]
+    if not rows:
+        return
+
+    if DB.session.get_bind().dialect.name in ('sqlite', 'postgresql'):
+        DB.session.execute(_UPSERT, rows)
+        return
+
+    for row in rows:
+        updated = EntryRollup.query.filter_by(
+            log_id=row['log_id'], day=row['day'], user_id=row['user_id'],
+        ).update(
+            {EntryRollup.count: EntryRollup.count + row['count']},
+            synchronize_session=False,
+        )
+        if not updated:
+            DB.session.add(EntryRollup(**row))
+
+
+def rebuild(connection):
+    """Recompute every count from the entry table and its archive"""
+    entries = 'entry'
+    if 'archived_entry' in sqlalchemy.inspect(connection).get_table_names():
+        entries = (
+            '(SELECT log_id, created_at, user_id FROM entry UNION ALL '
+            'SELECT log_id, created_at, user_id FROM archived_entry)'
+        )
+    connection.execute('DELETE FROM entry_rollup')
+    connection.execute(
+        'INSERT INTO entry_rollup (log_id, day, user_id, count) '
+        'SELECT log_id, DATE(created_at), user_id, COUNT(*) '
+        'FROM {} AS entries '
+        'GROUP BY log_id, DATE(created_at), user_id'.format(entries)
+    )
+    connection.execute(
+        'UPDATE log SET entry_count = (SELECT COUNT(*) FROM {} AS entries '
+        'WHERE entries.log_id = log.id)'.format(entries)
+    )
+
+
+def author_counts(log_id, since=None, until=None):
+    """Return (username, count) pairs for a log, busiest author first"""
+    total = sqlalchemy.func.sum(EntryRollup.count)
+    query = DB.session.query(User.username, total).join(
+        EntryRollup, EntryRollup.user_id == User.id,
+    ).filter(EntryRollup.log_id == log_id)
+    query = _within(query, since, until)
+    return query.group_by(User.username).order_by(
+        total.desc(), User.username).all()
+
+
+def day_counts(log_id, since=None, until=None):
+    """Return (day, count) pairs for a log in date order"""
+    total = sqlalchemy.func.sum(EntryRollup.count)
+    query = DB.session.query(EntryRollup.day, total).filter(
+        EntryRollup.log_id == log_id)
+    query = _within(query, since, until)
+    return query.group_by(EntryRollup.day).order_by(EntryRollup.day).all()
+
+
+def _within(query, since, until):
+    if since is not None:
+        query = query.filter(EntryRollup.day >= since)
+    if until is not None:
+        query = query.filter(EntryRollup.day < until)
+    return query
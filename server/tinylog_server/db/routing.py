@@ -0,0 +1,86 @@
+"""Send the reads of read-only requests to database replicas
+
+Replicas are configured as Flask-SQLAlchemy binds named replica_0,
+replica_1 and so on. A session only reads from a replica once it has
+been told to with route_reads(), and then uses one replica, picked at
+random, for the rest of its life so every query of a request sees the
+same snapshot. Flushes, explicit writes and sessions that were not told
+to read from a replica all use the primary.
+"""
+
+import contextlib
+import random
+
+from flask_sqlalchemy import SignallingSession, SQLAlchemy
+from sqlalchemy import orm
+from sqlalchemy.sql.dml import UpdateBase
+
+REPLICA_BIND_PREFIX = 'replica_'
+
+
+def replica_binds(dsns):
+    """Return SQLALCHEMY_BINDS entries for a comma separated list of DSNs"""
+    return {
+        '{}{}'.format(REPLICA_BIND_PREFIX, index): dsn.strip()
+        for index, dsn in enumerate((dsns or '').split(','))
+        if dsn.strip()
+    }
+
+
+def replica_keys(app):
+    """Return the bind keys of app's replicas"""
+    return sorted(
+        key for key in app.config.get('SQLALCHEMY_BINDS') or {}
+        if key.startswith(REPLICA_BIND_PREFIX)
+    )
+
+
+class RoutingSession(SignallingSession):
+    """A session that can read from a replica while writing to the primary"""
+
+    def __init__(self, db, **options):
+        super().__init__(db, **options)
+        self.db = db
+        self.replica_reads = False
+        self._replica = None
+
+    def get_bind(self, mapper=None, clause=None):
+        if (
+                self.replica_reads
+                and not self._flushing
+                and not isinstance(clause, UpdateBase)
+        ):
+            replica = self._get_replica()
+            if replica is not None:
+                return replica
+        return super().get_bind(mapper, clause)
+
+    def _get_replica(self):
+        if self._replica is None:
+            keys = replica_keys(self.app)
+            self._replica = keys and self.db.get_engine(
+                self.app, bind=random.choice(keys))
+        return self._replica or None
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    """Flask-SQLAlchemy with sessions that can read from replicas"""
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+
+def route_reads(session, to_replica):
+    """Send session's reads to a replica, or back to the primary"""
+    session.replica_reads = to_replica
+
+
+@contextlib.contextmanager
+def replica_reads(session, to_replica=True):
+    """Route session's reads as route_reads() does inside the with block"""
+    previous = session.replica_reads
+    session.replica_reads = to_replica
+    try:
+        yield
+    finally:
+        session.replica_reads = previous
@@ -0,0 +1,190 @@
+"""Full-text search over log entry titles and descriptions
+
+Search is backed by the database's own inverted index: an FTS5 table
+kept in sync with entry by triggers on SQLite, and a GIN expression
+index over a tsvector on PostgreSQL. Both are updated as part of every
+insert, so new entries are searchable as soon as they are committed.
+
+Archived entries have an index of their own, built the same way, and
+every search reads both tiers. Archiving moves an entry from one index
+to the other in the same transaction.
+"""
+
+import sqlalchemy
+
+from tinylog_server.db.models import DB, ArchivedEntry, Entry
+
+
+class SearchUnavailableError(Exception):
+    """Raised when the database has no supported full-text index"""
+    pass
+
+
+# Formatted with the name of the indexed table
+_SQLITE_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS {0}_fts USING fts5("
+    "title, description, content='{0}', content_rowid='rowid')",
+    "CREATE TRIGGER IF NOT EXISTS {0}_fts_insert AFTER INSERT ON {0} "
+    "BEGIN "
+    "INSERT INTO {0}_fts(rowid, title, description) "
+    "VALUES (new.rowid, new.title, new.description); "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS {0}_fts_delete AFTER DELETE ON {0} "
+    "BEGIN "
+    "INSERT INTO {0}_fts({0}_fts, rowid, title, description) "
+    "VALUES ('delete', old.rowid, old.title, old.description); "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS {0}_fts_update AFTER UPDATE ON {0} "
+    "BEGIN "
+    "INSERT INTO {0}_fts({0}_fts, rowid, title, description) "
+    "VALUES ('delete', old.rowid, old.title, old.description); "
+    "INSERT INTO {0}_fts(rowid, title, description) "
+    "VALUES (new.rowid, new.title, new.description); "
+    "END",
+]
+
+# The indexed entry models, searched together
+_TIERS = (Entry, ArchivedEntry)
+
+_POSTGRES_DOCUMENT = (
+    "to_tsvector('english', "
+    "coalesce(title, '') || ' ' || coalesce(description, ''))"
+)
+
+
+def install(connection, concurrently=False, table='entry'):
+    """Create the full-text index for entries if it does not exist
+
+    Args:
+        connection: The connection to create the index on.
+        concurrently (optional): Build the PostgreSQL index without
+            blocking writes. This must not run inside a transaction.
+        table (optional): The entry table to index, entry or
+            archived_entry.
+    """
+    dialect = connection.dialect.name
+    if dialect == 'sqlite':
+        for statement in _SQLITE_DDL:
+            connection.execute(statement.format(table))
+        connection.execute(
+            "INSERT INTO {0}_fts({0}_fts) VALUES('rebuild')".format(table))
+    elif dialect == 'postgresql':
+        connection.execute(
+            'CREATE INDEX {}IF NOT EXISTS ix_{}_search ON {} '
+            'USING GIN ({})'.format(
+                'CONCURRENTLY ' if concurrently else '',
+                table,
+                table,
+                _POSTGRES_DOCUMENT,
+            )
+        )
+
+
+def uninstall(connection, table='entry'):
+    """Drop the full-text index for entries"""
+    dialect = connection.dialect.name
+    if dialect == 'sqlite':
+        connection.execute('DROP TABLE IF EXISTS {}_fts'.format(table))
+    elif dialect == 'postgresql':
+        connection.execute('DROP INDEX IF EXISTS ix_{}_search'.format(table))
+
+
+def search_entries(text, limit, offset=0, log_id=None):
+    """Return entries matching text in either tier, most relevant first
+
+    On SQLite each tier's matches are ranked against that tier's own
+    index, so ranks across the tiers are only roughly comparable.
+
+    Args:
+        text: The words to search for. Every word must match.
+        limit: The maximum number of entries to return.
+        offset (optional): The number of matches to skip.
+        log_id (optional): Only search the entries of this log.
+
+    Returns:
+        A tuple of the matching entries and whether there are more.
+    """
+    dialect = DB.session.get_bind().dialect.name
+    if dialect == 'sqlite':
+        tier_statement = (
+            'SELECT {0}.id AS id, {1} AS tier, bm25({0}_fts) AS rank '
+            'FROM {0}_fts JOIN {0} ON {0}.rowid = {0}_fts.rowid '
+            'WHERE {0}_fts MATCH :query {2}'
+        )
+        order = 'rank, id'
+        query = _fts5_query(text)
+    elif dialect == 'postgresql':
+        tier_statement = (
+            'SELECT {0}.id AS id, {1} AS tier, '
+            'ts_rank(' + _POSTGRES_DOCUMENT + ', q) AS rank '
+            'FROM {0}, plainto_tsquery(\'english\', :query) q '
+            'WHERE ' + _POSTGRES_DOCUMENT + ' @@ q {2}'
+        )
+        order = 'rank DESC, id'
+        query = text
+    else:
+        raise SearchUnavailableError(dialect)
+
+    params = {'query': query, 'limit': limit + 1, 'offset': offset}
+    if log_id is not None:
+        params['log_id'] = log_id
+    statement = (
+        'SELECT id, tier FROM ({}) AS matches '
+        'ORDER BY {} LIMIT :limit OFFSET :offset'
+    ).format(
+        ' UNION ALL '.join(
+            tier_statement.format(
+                model.__tablename__,
+                tier,
+                '' if log_id is None else 'AND {}.log_id = :log_id'.format(
+                    model.__tablename__),
+            )
+            for tier, model in enumerate(_TIERS)
+        ),
+        order,
+    )
+
+    rows = DB.session.execute(sqlalchemy.text(statement), params).fetchall()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if not rows:
+        return [], has_more
+
+    by_id = {}
+    for tier, model in enumerate(_TIERS):
+        ids = [row.id for row in rows if row.tier == tier]
+        if ids:
+            by_id.update(
+                (entry.id, entry)
+                for entry in model.query_with_relations().filter(
+                    model.id.in_(ids))
+            )
+    return [by_id[row.id] for row in rows if row.id in by_id], has_more
+
+
+def _fts5_query(text):
+    # Quote every word so punctuation in user input is matched literally
+    # rather than parsed as FTS5 query syntax
+    return ' '.join(
+        '"{}"'.format(word.replace('"', '""')) for word in text.split()
+    )
+
+
+@sqlalchemy.event.listens_for(Entry.__table__, 'after_create')
+def _after_entry_create(target, connection, **kwargs): #pylint: disable=W0613
+    install(connection)
+
+
+@sqlalchemy.event.listens_for(Entry.__table__, 'before_drop')
+def _before_entry_drop(target, connection, **kwargs): #pylint: disable=W0613
+    uninstall(connection)
+
+
+@sqlalchemy.event.listens_for(ArchivedEntry.__table__, 'after_create')
+def _after_archived_entry_create(target, connection, **kwargs): #pylint: disable=W0613
+    install(connection, table=target.name)
+
+
+@sqlalchemy.event.listens_for(ArchivedEntry.__table__, 'before_drop')
+def _before_archived_entry_drop(target, connection, **kwargs): #pylint: disable=W0613
+    uninstall(connection, table=target.name)
@@ -0,0 +1,106 @@
+"""Negotiated response compression and binary encodings
+
+Responses over a size threshold are compressed with the best encoding
+both sides support: brotli if the brotli package is installed and the
+client accepts br, otherwise gzip. Streamed responses are left alone so
+their first bytes are not held back.
+
+Listings can also be sent as MessagePack, when the msgpack package is
+installed and the client prefers application/msgpack over JSON.
+"""
+
+import gzip
+
+from flask import Response, jsonify
+
+try:
+    import brotli
+except ImportError:
+    brotli = None #pylint: disable=C0103
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None #pylint: disable=C0103
+
+JSON_MIMETYPE = 'application/json'
+MSGPACK_MIMETYPE = 'application/msgpack'
+
+COMPRESSIBLE_MIMETYPES = (
+    JSON_MIMETYPE,
+    MSGPACK_MIMETYPE,
+    'application/x-ndjson',
+    'text/plain',
+    'text/csv',
+)
+
+
+def available_encodings(configured):
+    """Return the configured content codings that can be produced here
+
+    Args:
+        configured: A comma separated list such as 'br,gzip', in order of
+            preference.
+    """
+    encodings = []
+    for name in (configured or '').split(','):
+        name = name.strip()
+        if name == 'gzip' or (name == 'br' and brotli is not None):
+            encodings.append(name)
+    return encodings
+
+
+def compress_response(response, accept_encodings, encodings, min_size,
+                      level=6):
+    """Compress response in place if it is worth it and the client agrees
+
+    Args:
+        response: The response to compress.
+        accept_encodings: The request's parsed Accept-Encoding header.
+        encodings: The codings to choose from, in order of preference.
+        min_size: The smallest body, in bytes, that is compressed.
+        level (optional): The compression level for gzip; brotli uses
+            the equivalent quality.
+    """
+    response.vary.add('Accept-Encoding')
+    if (
+            response.is_streamed
+            or response.direct_passthrough
+            or 'Content-Encoding' in response.headers
+            or not 200 <= response.status_code < 300
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES
+    ):
+        return response
+
+    encoding = next(
+        (name for name in encodings if accept_encodings[name]), None)
+    if encoding is None:
+        return response
+    body = response.get_data()
+    if len(body) < min_size:
+        return response
+
+    if encoding == 'br':
+        body = brotli.compress(body, quality=min(level, 11))
+    else:
+        body = gzip.compress(body, compresslevel=level)
+    response.set_data(body)
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def wants_msgpack(accept_mimetypes):
+    """Whether the client prefers MessagePack and it can be produced"""
+    return msgpack is not None and accept_mimetypes.best_match(
+        [JSON_MIMETYPE, MSGPACK_MIMETYPE]) == MSGPACK_MIMETYPE
+
+
+def render(data, accept_mimetypes):
+    """Return data as MessagePack if the client prefers it, otherwise JSON"""
+    if wants_msgpack(accept_mimetypes):
+        response = Response(
+            msgpack.packb(data, use_bin_type=True), mimetype=MSGPACK_MIMETYPE)
+    else:
+        response = jsonify(data)
+    response.vary.add('Accept')
+    return response
@@ -0,0 +1,89 @@
+"""Sparse fieldsets and embedded resources chosen by query parameters
+
+fields= is a comma separated list of the fields a client wants and
+embed= a list of the related resources to include. Only the columns
+behind the chosen fields are selected and only the chosen relationships
+are loaded. Without either parameter resources keep their full shape;
+once fields= is given, related resources are only embedded on request.
+"""
+
+from tinylog_server.db.models import DB, ArchivedEntry, Entry, Log
+
+# Read for every resource, to build its link and page cursor
+_KEY_COLUMNS = {
+    Log: ('id', 'created_at', 'archived_until'),
+    Entry: ('id', 'log_id', 'created_at'),
+    ArchivedEntry: ('id', 'log_id', 'created_at'),
+}
+
+
+class FieldsetError(ValueError):
+    """Raised when the fields or embed parameter names an unknown field"""
+    pass
+
+
+class Fieldset(object):
+    """The fields and related resources chosen for a model
+
+    Args:
+        fields: The names of the fields to include, or None for all.
+        embed: The names of the related resources to include.
+    """
+
+    def __init__(self, fields, embed):
+        self.fields = fields
+        self.embed = embed
+
+
+def parse(args, model):
+    """Return the Fieldset chosen by the fields and embed args for model"""
+    fields = _parse_names(args, 'fields', model.FIELDS)
+    embed = _parse_names(args, 'embed', model.EMBEDS)
+    if embed is None:
+        embed = model.EMBEDS if fields is None else ()
+    return Fieldset(fields, embed)
+
+
+def log_options(fieldset):
+    """Return the loader options a Log query needs for fieldset"""
+    options = []
+    if fieldset.fields is not None:
+        options.append(DB.load_only(*_columns(Log, fieldset.fields)))
+    if 'entries' in fieldset.embed:
+        options.append(
+            DB.selectinload(Log.entries).joinedload(Entry.author))
+    return options
+
+
+def entry_options(fieldset, model=Entry):
+    """Return the loader options an entry query needs for fieldset
+
+    Args:
+        fieldset: The chosen Fieldset.
+        model (optional): The entry model queried, Entry or ArchivedEntry.
+    """
+    options = []
+    if fieldset.fields is not None:
+        options.append(DB.load_only(*_columns(model, fieldset.fields)))
+    if fieldset.fields is None or 'author' in fieldset.fields:
+        options.append(DB.joinedload(model.author))
+    return options
+
+
+def _columns(model, fields):
+    columns = list(_KEY_COLUMNS[model])
+    for name in fields:
+        columns.extend(model.FIELDS[name])
+    return columns
+
+
+def _parse_names(args, parameter, allowed):
+    value = args.get(parameter)
+    if value is None:
+        return None
+    names = tuple(name.strip() for name in value.split(',') if name.strip())
+    unknown = [name for name in names if name not in allowed]
+    if unknown:
+        raise FieldsetError('Unknown {}: {}. Choose from: {}'.format(
+            parameter, ', '.join(unknown), ', '.join(allowed)))
+    return names
@@ -0,0 +1,65 @@
+"""Query parameter filters for entry listings
+
+Filters become SQL predicates on indexed entry columns, so the cost of
+a filtered listing follows the size of the matching window rather than
+the size of the whole table.
+"""
+
+import datetime
+
+from tinylog_server.db.models import DB, Entry, User
+
+
+class FilterError(ValueError):
+    """Raised when a filter parameter given by the client is invalid"""
+    pass
+
+
+def parse_timestamp(name, value):
+    """Parse an ISO 8601 date or datetime as a naive UTC datetime"""
+    try:
+        timestamp = datetime.datetime.fromisoformat(value)
+    except ValueError:
+        raise FilterError('Invalid {} timestamp'.format(name))
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(datetime.timezone.utc).replace(
+            tzinfo=None)
+    return timestamp
+
+
+def parse_date(name, value):
+    """Parse an ISO 8601 date"""
+    try:
+        return datetime.date.fromisoformat(value)
+    except ValueError:
+        raise FilterError('Invalid {} date'.format(name))
+
+
+def entry_filters(args, model=Entry):
+    """Return the SQL criteria selected by the since, until and author args
+
+    Args:
+        args: The request's query parameters. since is inclusive and until
+            is exclusive; author is a username.
+        model (optional): The entry model to filter, Entry or
+            ArchivedEntry.
+    """
+    criteria = []
+    if args.get('since'):
+        criteria.append(
+            model.created_at >= parse_timestamp('since', args['since']))
+    if args.get('until'):
+        criteria.append(
+            model.created_at < parse_timestamp('until', args['until']))
+    if args.get('author'):
+        author_id = DB.session.query(User.id).filter(
+            User.username == args['author']).subquery()
+        criteria.append(model.user_id.in_(author_id))
+    return criteria
+
+
+def since(args):
+    """Return the time selected by the since arg, or None"""
+    if not args.get('since'):
+        return None
+    return parse_timestamp('since', args['since'])
@@ -0,0 +1,101 @@
+"""Bounded worker pool for password hashing and verification
+
+argon2 is deliberately expensive in both CPU and memory. Running it on a
+small dedicated pool caps how many hashes are computed at once, and
+turning requests away when the pool's queue is full stops a burst of
+logins from tying up every request worker. argon2-cffi releases the GIL
+while hashing, so threads are enough to keep it off the request thread.
+"""
+
+import concurrent.futures
+import threading
+
+from tinylog_server import metrics
+
+HASH_SECONDS = metrics.Histogram(
+    'tinylog_password_hash_seconds',
+    'Time spent computing argon2 hashes and verifications on the pool',
+    labels=('operation',),
+)
+
+
+class PoolSaturatedError(Exception):
+    """Raised when the pool already has as much work as it will accept
+
+    Args:
+        queue_depth: The number of operations waiting for a worker.
+    """
+
+    def __init__(self, queue_depth):
+        super().__init__('Password hashing pool is saturated')
+        self.queue_depth = queue_depth
+
+
+class HashingPool(object):
+    """Runs CryptContext operations on a fixed number of worker threads
+
+    Args:
+        context: The passlib CryptContext used to hash and verify.
+        max_workers: The number of operations that run concurrently.
+        max_pending: The number of operations allowed to wait for a worker
+            before new ones are rejected with PoolSaturatedError.
+    """
+
+    def __init__(self, context, max_workers, max_pending):
+        self.context = context
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix='tinylog-hash',
+        )
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+
+    @property
+    def queue_depth(self):
+        """The number of accepted operations still waiting for a worker"""
+        return max(0, self._in_flight - self.max_workers)
+
+    def hash(self, password):
+        """Hash password on the pool and wait for the result"""
+        return self._run('hash', self.context.hash, password)
+
+    def verify(self, password, password_hash):
+        """Check password against password_hash on the pool"""
+        return self._run(
+            'verify', self.context.verify, password, password_hash)
+
+    def stats(self):
+        """Return the pool's occupancy and counters"""
+        with self._lock:
+            return {
+                'in_flight': self._in_flight,
+                'queue_depth': self.queue_depth,
+                'max_workers': self.max_workers,
+                'max_pending': self.max_pending,
+                'completed': self.completed,
+                'rejected': self.rejected,
+            }
+
+    def _run(self, operation, function, *args):
+        with self._lock:
+            if self._in_flight >= self.max_workers + self.max_pending:
+                self.rejected += 1
+                raise PoolSaturatedError(self.queue_depth)
+            self._in_flight += 1
+
+        try:
+            return self._executor.submit(
+                _timed, operation, function, *args).result()
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+                self.completed += 1
+
+
+def _timed(operation, function, *args):
+    with HASH_SECONDS.time(operation):
+        return function(*args)
@@ -0,0 +1,475 @@
+"""Fan-out of newly created entries to live followers of a log
+
+Followers of a log share one channel. A new entry is recorded once in
+the channel's bounded buffer and every follower waiting on the channel
+is woken to read it, so the cost of a notification does not depend on
+how many followers receive it. Idle followers are blocked on a condition
+variable and use no CPU.
+
+Within a single process entries are published straight after they are
+committed. With several workers on PostgreSQL each worker instead runs
+a PostgresListener, and commits send a NOTIFY that every listener turns
+into one query for the new entries, whatever the number of followers.
+
+An EventStream turns a subscription into one follower's Server-Sent
+Events. It can block a thread per follower, as a WSGI response body, or
+wait on an event loop, where an idle follower holds no thread at all.
+
+An entry's created_at is set before it is committed, so entries can
+commit out of (created_at, id) order. Followers and catch-up queries
+therefore never skip an entry for sorting before the newest one seen.
+Instead they read back a lookback window before it and drop the entries
+they already sent by id, using RecentIds.
+"""
+
+import asyncio
+import collections
+import datetime
+import heapq
+import json
+import logging
+import select
+import threading
+
+import sqlalchemy
+
+from tinylog_server import pagination, streaming
+from tinylog_server.db.models import DB, Entry
+
+LOGGER = logging.getLogger(__name__)
+
+NOTIFY_CHANNEL = 'tinylog_entries'
+SORT_COLUMNS = (Entry.created_at, Entry.id)
+RETRY = 'retry: 3000\n\n'
+KEEP_ALIVE = ': keep-alive\n\n'
+
+
+class EntryEvent(object):
+    """A snapshot of a new entry that can be sent to any follower"""
+
+    def __init__(self, entry):
+        self.key = (entry.created_at, entry.id)
+        self.log_id = entry.log_id
+        self.title = entry.title
+        self.description = entry.description
+        self.author = entry.author.username
+
+    @property
+    def cursor(self):
+        """The entry's position, usable as an after cursor or event id"""
+        return pagination.encode_cursor(self.key)
+
+    def to_dict(self, urls):
+        return {
+            '_link': urls.entry(self.log_id, self.key[1]),
+            'title': self.title,
+            'description': self.description,
+            'log': urls.log(self.log_id),
+            'author': urls.user(self.author),
+        }
+
+
+class RecentIds(object):
+    """The ids of entries seen within a lookback window of the newest one
+
+    Entries created more than window before the newest seen entry are
+    forgotten, so the window must be longer than any entry takes to
+    commit.
+
+    Args:
+        window: A timedelta.
+    """
+
+    def __init__(self, window):
+        self.window = window
+        self.newest = None
+        self._ids = set()
+        self._keys = []
+
+    @property
+    def floor(self):
+        """The earliest creation time an unseen entry can still be told
+        apart from a seen one, or None if nothing was seen"""
+        return None if self.newest is None else self.newest - self.window
+
+    def advance(self, created_at):
+        """Treat entries created before created_at's window as seen"""
+        if self.newest is None or created_at > self.newest:
+            self.newest = created_at
+            floor = self.floor
+            while self._keys and self._keys[0][0] < floor:
+                self._ids.discard(heapq.heappop(self._keys)[1])
+
+    def add(self, key):
+        """Record an entry's (created_at, id) key
+
+        Returns:
+            False if the entry was already seen, otherwise True.
+        """
+        created_at, entry_id = key
+        if entry_id in self._ids:
+            return False
+        self._ids.add(entry_id)
+        heapq.heappush(self._keys, (created_at, entry_id))
+        self.advance(created_at)
+        return True
+
+
+class _Channel(object):
+    def __init__(self, buffer_size, lookback):
+        self.condition = threading.Condition()
+        self.events = collections.deque(maxlen=buffer_size)
+        self.sequence = 0
+        self.followers = 0
+        self.started = False
+        self.recent = RecentIds(lookback)
+        # (event loop, asyncio.Event) pairs of followers waiting on a loop
+        self.waiters = set()
+
+
+class Subscription(object):
+    """A follower's view of a log's channel; use as a context manager"""
+
+    def __init__(self, broadcaster, log_id, channel):
+        self._broadcaster = broadcaster
+        self.log_id = log_id
+        self._channel = channel
+        self._sequence = channel.sequence
+
+    def start_at(self, key):
+        """Let the channel catch up from key's lookback window
+
+        Until a follower has done so the channel is not caught up, so it
+        cannot be sent the log's whole history.
+
+        Args:
+            key: The key of the log's newest entry the follower has, or
+                None if the log has no entries.
+        """
+        with self._channel.condition:
+            self._channel.started = True
+            if key is not None:
+                self._channel.recent.advance(key[0])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def wait(self, timeout):
+        """Wait up to timeout seconds for entries published since last call
+
+        Returns:
+            A tuple of the new events and whether any events were dropped
+            from the buffer before this follower could read them.
+        """
+        channel = self._channel
+        with channel.condition:
+            channel.condition.wait_for(
+                lambda: channel.sequence > self._sequence, timeout)
+            unread = channel.sequence - self._sequence
+            events = list(channel.events)[-unread:] if unread else []
+            self._sequence = channel.sequence
+        return events, unread > len(events)
+
+    async def wait_async(self, timeout):
+        """Like wait, but waits on the running event loop, not a thread"""
+        channel = self._channel
+        waiter = (asyncio.get_running_loop(), asyncio.Event())
+        with channel.condition:
+            if channel.sequence > self._sequence:
+                waiter[1].set()
+            else:
+                channel.waiters.add(waiter)
+        try:
+            await asyncio.wait_for(waiter[1].wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with channel.condition:
+                channel.waiters.discard(waiter)
+        return self.wait(0)
+
+    def close(self):
+        """Stop following the log"""
+        self._broadcaster._unsubscribe(self.log_id)
+
+
+class EntryBroadcaster(object):
+    """Keeps a channel per followed log and publishes entries to them
+
+    Args:
+        buffer_size (optional): Events kept per channel for followers that
+            are busy writing when an entry is published.
+        lookback (optional): The window, as a timedelta, within which
+            entries are expected to commit after newer ones.
+    """
+
+    def __init__(self, buffer_size=256,
+                 lookback=datetime.timedelta(seconds=5)):
+        self.buffer_size = buffer_size
+        self.lookback = lookback
+        self._lock = threading.Lock()
+        self._channels = {}
+
+    def subscribe(self, log_id):
+        """Start following a log
+
+        Entries published from now on reach the subscription, so a
+        follower should subscribe before reading where to start from.
+        """
+        with self._lock:
+            channel = self._channels.get(log_id)
+            if channel is None:
+                channel = self._channels[log_id] = _Channel(
+                    self.buffer_size, self.lookback)
+            channel.followers += 1
+        return Subscription(self, log_id, channel)
+
+    def publish(self, events):
+        """Send events to the followers of their logs
+
+        Events already published to a log's channel are dropped, so
+        catch-up queries may overlap.
+        """
+        for event in events:
+            channel = self._channels.get(event.log_id)
+            if channel is None:
+                continue
+            with channel.condition:
+                if not channel.recent.add(event.key):
+                    continue
+                channel.events.append(event)
+                channel.sequence += 1
+                channel.condition.notify_all()
+                for loop, woken in channel.waiters:
+                    loop.call_soon_threadsafe(woken.set)
+
+    def followed_logs(self):
+        """Return the catch-up start time of every log with followers"""
+        with self._lock:
+            return {
+                log_id: channel.recent.floor
+                for log_id, channel in self._channels.items()
+                if channel.started
+            }
+
+    def stats(self):
+        """Return the number of followed logs and followers"""
+        with self._lock:
+            return {
+                'logs': len(self._channels),
+                'followers': sum(
+                    channel.followers for channel in self._channels.values()),
+            }
+
+    def _unsubscribe(self, log_id):
+        with self._lock:
+            channel = self._channels.get(log_id)
+            if channel is None:
+                return
+            channel.followers -= 1
+            if channel.followers <= 0:
+                del self._channels[log_id]
+
+
+def entries_since(log_id, since):
+    """Query the entries of a log created at or after since, if given"""
+    query = Entry.query.options(DB.joinedload(Entry.author)).filter(
+        Entry.log_id == log_id)
+    if since is not None:
+        query = query.filter(Entry.created_at >= since)
+    return query.order_by(*SORT_COLUMNS)
+
+
+def events_since(log_id, since, after_key=None, limit=None):
+    """Return events for the entries of a log created at or after since
+
+    Args:
+        log_id: The log.
+        since: The earliest creation time, or None for every entry.
+        after_key (optional): Only return entries sorting after this key,
+            to fetch the entries in batches.
+        limit (optional): The maximum number of events returned.
+    """
+    query = entries_since(log_id, since)
+    if after_key is not None:
+        query = query.filter(pagination.after_key(SORT_COLUMNS, after_key))
+    if limit is not None:
+        query = query.limit(limit)
+    return [EntryEvent(entry) for entry in query]
+
+
+def newest_key(log_id):
+    """Return the (created_at, id) key of a log's newest entry, if any"""
+    row = DB.session.query(*SORT_COLUMNS).filter(
+        Entry.log_id == log_id).order_by(
+            Entry.created_at.desc(), Entry.id.desc()).first()
+    return None if row is None else tuple(row)
+
+
+def notify(log_id):
+    """Queue a NOTIFY for log_id that is delivered when the session commits"""
+    DB.session.execute(
+        sqlalchemy.text('SELECT pg_notify(:channel, :log_id)'),
+        {'channel': NOTIFY_CHANNEL, 'log_id': log_id},
+    )
+
+
+def format_event(event_id, data):
+    """Format one Server-Sent Event"""
+    return 'id: {}\ndata: {}\n\n'.format(event_id, data)
+
+
+class EventStream(object):
+    """The Server-Sent Events of one live follower of a log
+
+    Both events and async_events subscribe before reading the log's
+    newest entry, so entries committed in between are published to the
+    subscription.
+
+    Args:
+        app: The Flask app whose context queries run in on an event loop.
+        broadcaster: The EntryBroadcaster to subscribe to.
+        log_id: The log to follow.
+        urls: The UrlBuilder event links are built with.
+        resume_key (optional): The key of the last entry the client
+            received. The entries it missed are sent first.
+        heartbeat (optional): Seconds between keep-alive comments.
+        batch_size (optional): Entries fetched per catch-up query.
+    """
+
+    def __init__(self, app, broadcaster, log_id, urls, resume_key=None,
+                 heartbeat=15, batch_size=1000):
+        self.app = app
+        self.broadcaster = broadcaster
+        self.log_id = log_id
+        self.urls = urls
+        self.resume_key = resume_key
+        self.heartbeat = heartbeat
+        self.batch_size = batch_size
+
+    def events(self):
+        """Follow the log on this thread, which must be in a request"""
+        with self.broadcaster.subscribe(self.log_id) as subscription:
+            sent = self._start(subscription)
+            yield RETRY
+            if self.resume_key is not None:
+                for entry in streaming.iter_rows(
+                        entries_since(self.log_id, sent.floor),
+                        self.batch_size):
+                    yield from self._format([EntryEvent(entry)], sent)
+            # Don't hold a database connection while idle
+            DB.session.remove()
+
+            while True:
+                events, missed = subscription.wait(self.heartbeat)
+                if missed:
+                    events = events_since(self.log_id, sent.floor)
+                    DB.session.remove()
+                if not events:
+                    yield KEEP_ALIVE
+                yield from self._format(events, sent)
+
+    async def async_events(self, run):
+        """Follow the log on the running event loop
+
+        Args:
+            run: A coroutine function called with a function and its
+                arguments, that calls it on a thread pool and returns
+                its result. Only database queries are run this way.
+        """
+        with self.broadcaster.subscribe(self.log_id) as subscription:
+            sent = await run(self._in_app, self._start, subscription)
+            yield RETRY
+            if self.resume_key is not None:
+                after_key = None
+                while True:
+                    events = await run(
+                        self._in_app, events_since, self.log_id, sent.floor,
+                        after_key, self.batch_size)
+                    for chunk in self._format(events, sent):
+                        yield chunk
+                    if len(events) < self.batch_size:
+                        break
+                    after_key = events[-1].key
+
+            while True:
+                events, missed = await subscription.wait_async(self.heartbeat)
+                if missed:
+                    events = await run(
+                        self._in_app, events_since, self.log_id, sent.floor)
+                if not events:
+                    yield KEEP_ALIVE
+                for chunk in self._format(events, sent):
+                    yield chunk
+
+    def _start(self, subscription):
+        start_key = self.resume_key or newest_key(self.log_id)
+        subscription.start_at(start_key)
+        sent = RecentIds(self.broadcaster.lookback)
+        if self.resume_key is not None:
+            sent.add(self.resume_key)
+        elif start_key is not None:
+            sent.advance(start_key[0])
+        return sent
+
+    def _format(self, events, sent):
+        return [
+            format_event(event.cursor, json.dumps(event.to_dict(self.urls)))
+            for event in events if sent.add(event.key)
+        ]
+
+    def _in_app(self, function, *args):
+        with self.app.app_context():
+            return function(*args)
+
+
+class PostgresListener(threading.Thread):
+    """Turns NOTIFYs from any worker into entries for this worker's followers
+
+    Args:
+        app: The Flask app whose database is listened to.
+        broadcaster: The broadcaster the new entries are published to.
+    """
+
+    def __init__(self, app, broadcaster):
+        super().__init__(name='tinylog-live-listener', daemon=True)
+        self.app = app
+        self.broadcaster = broadcaster
+
+    def run(self):
+        while True:
+            try:
+                with self.app.app_context():
+                    self._listen()
+            except Exception: #pylint: disable=W0703
+                LOGGER.exception('Live listener failed, reconnecting')
+                threading.Event().wait(1)
+
+    def _listen(self):
+        connection = DB.engine.raw_connection()
+        try:
+            raw = connection.connection
+            raw.set_isolation_level(0)
+            raw.cursor().execute('LISTEN {}'.format(NOTIFY_CHANNEL))
+            while True:
+                if select.select([raw], [], [], 60) == ([], [], []):
+                    continue
+                raw.poll()
+                log_ids = {notice.payload for notice in raw.notifies}
+                del raw.notifies[:]
+                self._catch_up(log_ids)
+        finally:
+            connection.close()
+
+    def _catch_up(self, log_ids):
+        followed = self.broadcaster.followed_logs()
+        for log_id in log_ids:
+            if log_id not in followed:
+                continue
+            self.broadcaster.publish(
+                EntryEvent(entry)
+                for entry in entries_since(log_id, followed[log_id]))
+        DB.session.remove()
@@ -0,0 +1,305 @@
+"""Process-wide metrics in the Prometheus text exposition format
+
+Metrics are declared next to the code they measure, register themselves
+in REGISTRY and are rendered by the /metrics view. Values are kept per
+process, so with several workers each one is scraped separately.
+
+SQL statements are counted and timed for the request running on the
+current thread by listening to every SQLAlchemy engine. The statements
+themselves are only kept when a request asks for them, for the slow
+request log.
+"""
+
+import collections
+import contextlib
+import math
+import threading
+import time
+
+import sqlalchemy
+from sqlalchemy.engine import Engine
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+COUNT_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100, 200)
+
+
+class Registry(object):
+    """The metrics rendered together by one endpoint"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = collections.OrderedDict()
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError('Duplicate metric: {}'.format(metric.name))
+            self._metrics[metric.name] = metric
+        return metric
+
+    def unregister(self, name):
+        with self._lock:
+            self._metrics.pop(name, None)
+
+    def render(self):
+        """Return every metric in the Prometheus text format"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append('# HELP {} {}'.format(metric.name, metric.documentation))
+            lines.append('# TYPE {} {}'.format(metric.name, metric.kind))
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+class _Metric(object):
+    kind = None
+
+    def __init__(self, name, documentation, labels=(), registry=REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+        self._children = collections.OrderedDict()
+        if registry is not None:
+            registry.register(self)
+
+    def labels(self, *values):
+        """Return the child metric for the given label values"""
+        if len(values) != len(self.label_names):
+            raise ValueError('Expected labels {}'.format(self.label_names))
+        values = tuple(str(value) for value in values)
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def samples(self):
+        with self._lock:
+            children = list(self._children.items())
+        for values, child in children:
+            for suffix, extra, value in child.values():
+                yield '{}{}{} {}'.format(
+                    self.name,
+                    suffix,
+                    _format_labels(
+                        list(zip(self.label_names, values)) + extra),
+                    _format_value(value),
+                )
+
+    def _new_child(self):
+        raise NotImplementedError()
+
+
+class _CounterChild(object):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def values(self):
+        return [('_total', [], self.value)]
+
+
+class Counter(_Metric):
+    """A count that only goes up"""
+    kind = 'counter'
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def _new_child(self):
+        return _CounterChild()
+
+
+class _HistogramChild(object):
+    def __init__(self, buckets):
+        self._lock = threading.Lock()
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        with self._lock:
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.counts[index] += 1
+            self.count += 1
+            self.sum += value
+
+    def values(self):
+        with self._lock:
+            cumulative = [
+                ('_bucket', [('le', _format_value(bound))], count)
+                for bound, count in zip(self.buckets, self.counts)
+            ]
+            return cumulative + [
+                ('_bucket', [('le', '+Inf')], self.count),
+                ('_count', [], self.count),
+                ('_sum', [], self.sum),
+            ]
+
+
+class Histogram(_Metric):
+    """Observations counted into cumulative buckets
+
+    Args:
+        buckets (optional): The upper bounds of the buckets, ascending.
+    """
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(),
+                 buckets=LATENCY_BUCKETS, registry=REGISTRY):
+        self.buckets = tuple(buckets)
+        super().__init__(name, documentation, labels, registry)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    @contextlib.contextmanager
+    def time(self, *label_values):
+        """Observe how long the with block takes, in seconds"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.labels(*label_values).observe(time.perf_counter() - started)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+
+class CallbackGauge(_Metric):
+    """A value read from elsewhere whenever the metrics are rendered
+
+    Args:
+        function: Returns an iterable of (label values, value) pairs.
+    """
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, function, labels=(),
+                 registry=REGISTRY):
+        self.function = function
+        super().__init__(name, documentation, labels, registry)
+
+    def samples(self):
+        for values, value in self.function():
+            yield '{}{} {}'.format(
+                self.name,
+                _format_labels(list(zip(self.label_names, values))),
+                _format_value(value),
+            )
+
+
+def pool_usage(engine):
+    """Return the connections of engine's pool by state
+
+    Pools that do not keep a fixed number of connections, such as
+    SQLite's, report only what they support.
+    """
+    pool = engine.pool
+    usage = []
+    for state in ('size', 'checkedout', 'checkedin', 'overflow'):
+        method = getattr(pool, state, None)
+        if method is not None:
+            try:
+                usage.append((state, method()))
+            except (AttributeError, NotImplementedError):
+                pass
+    return usage
+
+
+# Per-request SQL capture
+
+class QueryCapture(object):
+    """The SQL statements run on one thread while it handles a request
+
+    Args:
+        keep_statements (optional): Also keep each statement's text and
+            duration, not just the totals.
+    """
+
+    def __init__(self, keep_statements=False):
+        self.keep_statements = keep_statements
+        self.count = 0
+        self.seconds = 0.0
+        self.statements = []
+
+    def record(self, statement, seconds):
+        self.count += 1
+        self.seconds += seconds
+        if self.keep_statements:
+            self.statements.append((statement, seconds))
+
+
+_CAPTURE = threading.local()
+
+
+def start_capture(keep_statements=False):
+    """Begin capturing the SQL run by the current thread"""
+    _CAPTURE.current = QueryCapture(keep_statements)
+    return _CAPTURE.current
+
+
+def stop_capture():
+    """Stop capturing the current thread's SQL and return what was captured"""
+    capture = getattr(_CAPTURE, 'current', None)
+    _CAPTURE.current = None
+    return capture
+
+
+@sqlalchemy.event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context,
+                           executemany): #pylint: disable=W0613
+    conn.info.setdefault('tinylog_query_start', []).append(time.perf_counter())
+
+
+@sqlalchemy.event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany): #pylint: disable=W0613
+    started = conn.info['tinylog_query_start'].pop()
+    capture = getattr(_CAPTURE, 'current', None)
+    if capture is not None:
+        capture.record(statement, time.perf_counter() - started)
+
+
+@sqlalchemy.event.listens_for(Engine, 'handle_error')
+def _handle_error(exception_context):
+    # A failed statement never reaches after_cursor_execute
+    connection = exception_context.connection
+    if connection is not None and connection.info.get('tinylog_query_start'):
+        connection.info['tinylog_query_start'].pop()
+
+
+def _format_labels(pairs):
+    if not pairs:
+        return ''
+    return '{' + ','.join(
+        '{}="{}"'.format(
+            name,
+            value.replace('\\', '\\\\').replace('"', '\\"')
+            .replace('\n', '\\n'),
+        )
+        for name, value in pairs
+    ) + '}'
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        if math.isinf(value):
+            return '+Inf' if value > 0 else '-Inf'
+        return repr(value)
+    return str(value)
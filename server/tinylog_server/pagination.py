@@ -0,0 +1,183 @@
+"""Keyset (cursor based) pagination for ordered queries
+
+Pages are selected with a WHERE clause on the sort key of the last row
+already seen rather than with OFFSET, so the database can seek straight
+to the start of a page using an index and deep pages cost the same as
+the first one.
+"""
+
+import base64
+import datetime
+import heapq
+import itertools
+import json
+
+from sqlalchemy import and_, or_
+
+
+class PaginationError(ValueError):
+    """Raised when the limit or cursor given by the client is invalid"""
+    pass
+
+
+def parse_limit(value, default, maximum):
+    """Parse the limit query parameter, clamping it to maximum"""
+    if value is None:
+        return default
+    try:
+        limit = int(value)
+    except ValueError:
+        raise PaginationError('Invalid limit')
+    if limit < 1:
+        raise PaginationError('Invalid limit')
+    return min(limit, maximum)
+
+
+def encode_cursor(values):
+    """Encode the sort key of a row as an opaque cursor string"""
+    serialisable = [
+        value.isoformat() if isinstance(value, datetime.datetime) else value
+        for value in values
+    ]
+    raw = json.dumps(serialisable, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, columns):
+    """Decode a cursor created by encode_cursor for the given sort columns"""
+    try:
+        values = _decode(cursor)
+        if len(values) != len(columns):
+            raise ValueError()
+        return [
+            _parse_value(column, value)
+            for column, value in zip(columns, values)
+        ]
+    except (ValueError, TypeError):
+        raise PaginationError('Invalid cursor')
+
+
+def encode_offset(offset):
+    """Encode a result offset as a cursor, for results with no stable key"""
+    return encode_cursor([offset])
+
+
+def decode_offset(cursor):
+    """Decode a cursor created by encode_offset"""
+    try:
+        values = _decode(cursor)
+        if (
+            len(values) != 1
+            or not isinstance(values[0], int)
+            or values[0] < 0
+        ):
+            raise ValueError()
+        return values[0]
+    except (ValueError, TypeError):
+        raise PaginationError('Invalid cursor')
+
+
+def after_key(columns, values):
+    """Build the predicate selecting rows that sort after the given key
+
+    For columns (a, b) and values (x, y) this is
+    a > x OR (a = x AND b > y), which databases can satisfy with a range
+    scan on an index over the same columns.
+    """
+    clauses = []
+    for index, column in enumerate(columns):
+        equal_prefix = [
+            columns[prefix] == values[prefix] for prefix in range(index)
+        ]
+        clauses.append(and_(*(equal_prefix + [column > values[index]])))
+    return or_(*clauses)
+
+
+def row_key(row, columns):
+    """Return the sort key of a row for the given columns"""
+    return [getattr(row, column.key) for column in columns]
+
+
+def order_after(query, columns, after=None):
+    """Order query by columns, starting after the row identified by cursor"""
+    if after is not None:
+        query = query.filter(after_key(columns, decode_cursor(after, columns)))
+    return query.order_by(*columns)
+
+
+def paginate(query, columns, limit, after=None):
+    """Return one page of query ordered by columns
+
+    Args:
+        query: The query to page through.
+        columns: The ORM attributes that define the order. Together they
+            must be unique, e.g. (created_at, id).
+        limit: The maximum number of rows to return.
+        after (optional): The cursor returned with the previous page.
+
+    Returns:
+        A tuple of the rows on this page and the cursor for the next page,
+        or None if this is the last page.
+    """
+    rows = order_after(query, columns, after).limit(limit + 1).all()
+
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(row_key(rows[-1], columns))
+
+
+def paginate_merged(tiers, limit, after=None):
+    """Return one page of several queries merged into one order
+
+    Each query is paged on its own, and only the first limit + 1 rows of
+    each are merged, so the cost is the same as paging each of them.
+
+    Args:
+        tiers: (query, columns) pairs. The columns of every query must
+            have the same names, and keys must be unique across queries.
+        limit: The maximum number of rows to return.
+        after (optional): The cursor returned with the previous page.
+
+    Returns:
+        As for paginate.
+    """
+    columns = tiers[0][1]
+    pages = [
+        order_after(query, query_columns, after).limit(limit + 1).all()
+        for query, query_columns in tiers
+    ]
+    rows = list(itertools.islice(merge_ordered(pages, columns), limit + 1))
+
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(row_key(rows[-1], columns))
+
+
+def merge_ordered(iterables, columns):
+    """Lazily merge iterables of rows that are each sorted by columns"""
+    if len(iterables) == 1:
+        return iter(iterables[0])
+    return heapq.merge(
+        *iterables, key=lambda row: row_key(row, columns))
+
+
+def cursor_start(after, columns):
+    """Return the first sort column's value in cursor after, or None"""
+    if after is None:
+        return None
+    return decode_cursor(after, columns)[0]
+
+
+def _decode(cursor):
+    padded = cursor + '=' * (-len(cursor) % 4)
+    return json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+
+
+def _parse_value(column, value):
+    if value is None:
+        return None
+    if issubclass(column.type.python_type, datetime.datetime):
+        return datetime.datetime.fromisoformat(value)
+    return value
@@ -0,0 +1,195 @@
+"""Token bucket rate limiting keyed by client address or access token
+
+Each key gets a bucket that holds up to a limit's count of tokens and
+refills continuously at count tokens per period. A request takes a token,
+or is refused with the time until one will be available.
+
+LocalStore keeps buckets in the worker, so a client spreading requests
+over several workers gets each worker's allowance. RedisStore shares
+buckets between every worker.
+"""
+
+import collections
+import threading
+import time
+
+from tinylog_server import metrics
+
+RATE_LIMITED = metrics.Counter(
+    'tinylog_rate_limited_requests',
+    'Requests refused by a rate limit',
+    labels=('limit',),
+)
+
+
+class Limit(collections.namedtuple('Limit', ['count', 'period'])):
+    """At most count requests per period seconds, which may come in a burst"""
+
+    @property
+    def rate(self):
+        """Tokens added to a bucket per second"""
+        return self.count / self.period
+
+
+def parse_limit(value):
+    """Parse a limit written as 'count/seconds', e.g. '10/60'
+
+    Returns:
+        A Limit, or None if value is empty or its count is 0, which
+        disables the limit.
+    """
+    if not value or not value.strip():
+        return None
+    try:
+        count, period = value.split('/')
+        limit = Limit(int(count), float(period))
+    except ValueError:
+        raise ValueError(
+            "Invalid rate limit {!r}, expected 'count/seconds'".format(value))
+    if limit.count <= 0:
+        return None
+    if limit.period <= 0:
+        raise ValueError(
+            'Invalid rate limit {!r}, the period must be positive'.format(
+                value))
+    return limit
+
+
+class RateLimitExceeded(Exception):
+    """Raised when a request is over a limit
+
+    Args:
+        name: The name of the limit.
+        retry_after: Seconds until the request would be allowed.
+    """
+
+    def __init__(self, name, retry_after):
+        super().__init__('Rate limit {} exceeded'.format(name))
+        self.name = name
+        self.retry_after = retry_after
+
+
+class Store(object):
+    """Base class for token bucket storage"""
+
+    def take(self, key, limit):
+        """Take a token from key's bucket
+
+        Returns:
+            0 if a token was taken, otherwise the seconds until one will
+            be available.
+        """
+        raise NotImplementedError()
+
+
+class LocalStore(Store):
+    """Keeps buckets in this process, least recently used dropped first
+
+    A dropped bucket starts again full, so max_size should comfortably
+    exceed the number of clients active within a limit's period.
+
+    Args:
+        max_size: The number of buckets kept.
+        clock (optional): A callable returning the current time in seconds,
+            defaults to time.monotonic.
+    """
+
+    def __init__(self, max_size, clock=time.monotonic):
+        self.max_size = max_size
+        self._clock = clock
+        self._buckets = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def take(self, key, limit):
+        with self._lock:
+            now = self._clock()
+            tokens, updated_at = self._buckets.get(key, (limit.count, now))
+            tokens = min(
+                limit.count, tokens + (now - updated_at) * limit.rate)
+            if tokens >= 1:
+                tokens -= 1
+                retry_after = 0
+            else:
+                retry_after = (1 - tokens) / limit.rate
+
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_size:
+                self._buckets.popitem(last=False)
+            return retry_after
+
+
+class RedisStore(Store):
+    """Shares buckets between workers through Redis
+
+    Requires the redis package. Buckets are updated atomically by a Lua
+    script and expire once they would be full again. Workers' clocks are
+    used to refill buckets, so they should be kept in sync.
+
+    Args:
+        url: The Redis URL, e.g. redis://localhost:6379/0.
+        prefix (optional): Prepended to every key.
+    """
+
+    SCRIPT = """
+local count = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at')
+local tokens = tonumber(bucket[1]) or count
+local updated_at = tonumber(bucket[2]) or now
+tokens = math.min(count, tokens + math.max(0, now - updated_at) * rate)
+local retry_after = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    retry_after = (1 - tokens) / rate
+end
+redis.call('HMSET', KEYS[1], 'tokens', tostring(tokens),
+           'updated_at', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(count / rate) + 1)
+return tostring(retry_after)
+"""
+
+    def __init__(self, url, prefix='tinylog:ratelimit:'):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self._take = self.client.register_script(self.SCRIPT)
+
+    def take(self, key, limit):
+        return float(self._take(
+            keys=[self.prefix + key],
+            args=[limit.count, limit.rate, time.time()],
+        ))
+
+
+class RateLimiter(object):
+    """Checks requests against named limits
+
+    Args:
+        store: Where buckets are kept.
+        limits: A dict of limit names to Limits. Limits that are missing
+            or None are not enforced.
+    """
+
+    def __init__(self, store, limits):
+        self.store = store
+        self.limits = limits
+
+    def check(self, name, key):
+        """Take a token for key under the named limit
+
+        Raises:
+            RateLimitExceeded: If key has no tokens left.
+        """
+        limit = self.limits.get(name)
+        if limit is None:
+            return
+        retry_after = self.store.take(name + ':' + key, limit)
+        if retry_after > 0:
+            RATE_LIMITED.labels(name).inc()
+            raise RateLimitExceeded(name, retry_after)
@@ -1 +1,10 @@
-from tinylog_server.recaptcha.captcha import valid_captcha_token
+from tinylog_server.recaptcha.captcha import (
+    CachingVerifier,
+    HTTPVerifier,
+    StaticVerifier,
+    VerificationError,
+    Verifier,
+    get_verifier,
+    set_verifier,
+    valid_captcha_token,
+)
@@ -2,15 +2,144 @@
 
 RECAPTCHA_VALIDATION_URL = "https://www.google.com/recaptcha/api/siteverify"
 
+import hashlib
+import logging
+import time
+
 import requests
+from requests.adapters import HTTPAdapter
+
+from tinylog_server import metrics
+from tinylog_server.cache import TTLCache
+
+LOGGER = logging.getLogger(__name__)
+
+VERIFY_SECONDS = metrics.Histogram(
+    'tinylog_captcha_verify_seconds',
+    'Time spent waiting for the captcha verification endpoint',
+    labels=('outcome',),
+)
+
+
+class VerificationError(Exception):
+    """Raised when a verifier could not get an answer for a response"""
+    pass
+
+
+class Verifier(object):
+    """Base class for captcha verification backends"""
+
+    def verify(self, secret, response):
+        """Return whether the captcha response is valid for secret
+
+        Raises:
+            VerificationError: If no answer could be had, e.g. because
+                the upstream timed out.
+        """
+        raise NotImplementedError()
+
+
+class HTTPVerifier(Verifier):
+    """Verifies responses against a siteverify compatible HTTP endpoint
+
+    Connections are kept alive in a pool shared by every request, and
+    both connecting and reading are bounded so a slow upstream cannot hold
+    a worker indefinitely. Any failure to get an answer raises
+    VerificationError, so it is not mistaken for an invalid response.
+
+    Args:
+        url (optional): The verification endpoint, defaults to Google's.
+            Point this at a local stub server for tests and benchmarks.
+        connect_timeout (optional): Seconds allowed to open a connection.
+        read_timeout (optional): Seconds allowed between bytes received.
+        pool_size (optional): The number of connections kept alive.
+    """
+
+    def __init__(self, url=RECAPTCHA_VALIDATION_URL, connect_timeout=3.05,
+                 read_timeout=5, pool_size=10):
+        self.url = url
+        self.timeout = (connect_timeout, read_timeout)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def verify(self, secret, response):
+        started = time.perf_counter()
+        outcome = 'error'
+        try:
+            validation_response = self.session.post(
+                self.url,
+                data={
+                    'secret': secret,
+                    'response': response,
+                },
+                timeout=self.timeout,
+            )
+            validation_response.raise_for_status()
+            valid = validation_response.json().get('success', False) is True
+            outcome = 'valid' if valid else 'invalid'
+            return valid
+        except (requests.RequestException, ValueError) as error:
+            LOGGER.warning('Captcha verification failed', exc_info=True)
+            raise VerificationError(str(error))
+        finally:
+            VERIFY_SECONDS.labels(outcome).observe(
+                time.perf_counter() - started)
+
+
+class CachingVerifier(Verifier):
+    """Remembers the answers of another verifier for a short time
+
+    reCAPTCHA only accepts a response once, so this lets a client retry a
+    rejected signup (e.g. because the username was taken) with the same
+    solved captcha instead of failing as a duplicate. Only real answers
+    are remembered; a VerificationError is passed on and the response is
+    checked again on the next attempt.
+
+    Args:
+        verifier: The verifier whose answers are cached.
+        ttl: Seconds an answer is remembered for.
+        max_size (optional): The number of answers remembered.
+    """
+
+    def __init__(self, verifier, ttl, max_size=1024):
+        self.verifier = verifier
+        self.cache = TTLCache(max_size=max_size, ttl=ttl)
+
+    def verify(self, secret, response):
+        key = hashlib.sha256(
+            '{}\0{}'.format(secret, response).encode('utf-8')).hexdigest()
+        result = self.cache.get(key)
+        if result is None:
+            result = self.verifier.verify(secret, response)
+            self.cache.set(key, result)
+        return result
+
+
+class StaticVerifier(Verifier):
+    """Gives the same answer for every response, for local development"""
+
+    def __init__(self, result=True):
+        self.result = result
+
+    def verify(self, secret, response):
+        return self.result
+
+
+_VERIFIER = HTTPVerifier()
+
+
+def set_verifier(verifier):
+    """Replace the backend used by valid_captcha_token"""
+    global _VERIFIER #pylint: disable=W0603
+    _VERIFIER = verifier
+
+
+def get_verifier():
+    """Return the backend used by valid_captcha_token"""
+    return _VERIFIER
 
 
 def valid_captcha_token(secret, response):
-    validation_response = requests.post(
-        RECAPTCHA_VALIDATION_URL,
-        data={
-            'secret': secret,
-            'response': response,
-        },
-    )
-    return validation_response.json().get('success', False)
+    return _VERIFIER.verify(secret, response)
@@ -0,0 +1,36 @@
+"""Incremental JSON and NDJSON encoding of large result sets
+
+Rows are read from a server-side cursor in batches and serialised one at
+a time, so memory use and time-to-first-byte do not depend on how many
+rows the query matches.
+"""
+
+from flask import json
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+JSON_MIMETYPE = 'application/json'
+
+
+def iter_rows(query, batch_size):
+    """Yield the results of query, fetching batch_size rows at a time"""
+    return query.execution_options(stream_results=True).yield_per(batch_size)
+
+
+def ndjson_lines(rows, serialize):
+    """Yield one JSON document per line for each row"""
+    for row in rows:
+        yield json.dumps(serialize(row)) + '\n'
+
+
+def json_document(key, rows, serialize):
+    """Yield a JSON object with the serialised rows listed under key
+
+    The output has the same shape as a non-streamed listing, with a null
+    next link since the stream always runs to the end of the results.
+    """
+    yield '{' + json.dumps(key) + ': ['
+    separator = ''
+    for row in rows:
+        yield separator + json.dumps(serialize(row))
+        separator = ', '
+    yield '], "next": null}\n'
@@ -0,0 +1,355 @@
+"""Export and import of whole logs as gzip compressed NDJSON or CSV
+
+Exports read entries from a server-side cursor and compress them as they
+go, so memory use does not depend on the size of the log. NDJSON exports
+start with a line describing the log, followed by one line per entry;
+CSV exports hold only the entries.
+
+Imports read the same formats line by line and insert entries in chunks,
+one transaction per chunk, keeping their original ids and creation
+times. Authors are matched by username and must already exist. If an
+import fails part way, the entries it added are removed again.
+"""
+
+import collections
+import csv
+import datetime
+import io
+import json
+import zlib
+
+import sqlalchemy
+
+from tinylog_server import pagination, streaming
+from tinylog_server.db import archive, rollups
+from tinylog_server.db.models import (
+    DB, ArchivedEntry, Entry, Log, User, make_random_id)
+
+FORMATS = ('ndjson', 'csv')
+MIMETYPES = {'ndjson': streaming.NDJSON_MIMETYPE, 'csv': 'text/csv'}
+CSV_COLUMNS = ('id', 'created_at', 'author', 'title', 'description')
+GZIP_MAGIC = b'\x1f\x8b'
+
+_ImportedEntry = collections.namedtuple(
+    '_ImportedEntry',
+    ['id', 'log_id', 'user_id', 'title', 'description', 'created_at'],
+)
+
+
+class TransferError(ValueError):
+    """Raised when an import is malformed or conflicts with existing data"""
+    pass
+
+
+# Export
+
+def export_lines(log, export_format, batch_size):
+    """Yield a log and its entries as lines of NDJSON or CSV text
+
+    Args:
+        log: The Log to export.
+        export_format: 'ndjson' or 'csv'.
+        batch_size: The number of entries fetched per round trip.
+    """
+    # Archived entries are exported too, merged into the same order
+    rows = pagination.merge_ordered(
+        [
+            streaming.iter_rows(
+                DB.session.query(
+                    model.id,
+                    model.created_at,
+                    User.username,
+                    model.title,
+                    model.description,
+                ).join(User, model.user_id == User.id).filter(
+                    model.log_id == log.id,
+                ).order_by(model.created_at, model.id),
+                batch_size,
+            )
+            for model in archive.tiers(log.archived_until)
+        ],
+        (Entry.created_at, Entry.id),
+    )
+
+    if export_format == 'csv':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(CSV_COLUMNS)
+        for entry_id, created_at, author, title, description in rows:
+            writer.writerow(
+                [entry_id, created_at.isoformat(), author, title, description])
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        yield buffer.getvalue()
+        return
+
+    yield json.dumps({
+        'type': 'log',
+        'id': log.id,
+        'name': log.name,
+        'description': log.description,
+        'created_at': log.created_at.isoformat(),
+    }) + '\n'
+    for entry_id, created_at, author, title, description in rows:
+        yield json.dumps({
+            'type': 'entry',
+            'id': entry_id,
+            'created_at': created_at.isoformat(),
+            'author': author,
+            'title': title,
+            'description': description,
+        }) + '\n'
+
+
+def gzip_chunks(lines, chunk_size=64 * 1024):
+    """Compress lines of text into gzip chunks of about chunk_size bytes"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    pending = []
+    pending_size = 0
+    for line in lines:
+        data = line.encode('utf-8')
+        pending.append(data)
+        pending_size += len(data)
+        if pending_size >= chunk_size:
+            chunk = compressor.compress(b''.join(pending))
+            pending = []
+            pending_size = 0
+            if chunk:
+                yield chunk
+    yield compressor.compress(b''.join(pending)) + compressor.flush()
+
+
+# Import
+
+def read_records(binary_lines, import_format):
+    """Yield (line number, record dict) pairs from lines of an export
+
+    Args:
+        binary_lines: An iterable of the export's lines as bytes.
+        import_format: 'ndjson' or 'csv'.
+    """
+    lines = _decoded(binary_lines)
+    if import_format == 'csv':
+        reader = csv.DictReader(lines)
+        missing = set(CSV_COLUMNS) - set(reader.fieldnames or ())
+        if missing:
+            raise TransferError('CSV is missing columns: {}'.format(
+                ', '.join(sorted(missing))))
+        for record in reader:
+            yield reader.line_num, dict(record, type='entry')
+        return
+
+    for line_number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            raise TransferError('Line {}: invalid JSON'.format(line_number))
+        if not isinstance(record, dict):
+            raise TransferError(
+                'Line {}: expected an object'.format(line_number))
+        yield line_number, record
+
+
+def decompressed_lines(stream):
+    """Return an iterator over the lines of stream, gunzipping if needed
+
+    Args:
+        stream: A binary file object.
+    """
+    # Don't rely on peek or seek, which request streams lack
+    head = stream.read(2)
+    chunks = _chunks(stream, head)
+    if head == GZIP_MAGIC:
+        chunks = _gunzip(chunks)
+    return _lines(chunks)
+
+
+def import_log(records, name=None, description=None, chunk_size=5000):
+    """Create a log from the records of an export, committing in chunks
+
+    Args:
+        records: (line number, record) pairs as given by read_records.
+            An NDJSON export's first record describes the log. Its id is
+            kept, so the import is refused if that log already exists.
+        name (optional): The log's name, overriding the export's.
+        description (optional): The log's description, overriding the
+            export's.
+        chunk_size (optional): The number of entries per transaction.
+
+    Returns:
+        The new log and the number of entries imported.
+    """
+    records = iter(records)
+    first = next(records, None)
+    header_line, header = 0, {}
+    if first is not None and first[1].get('type') == 'log':
+        header_line, header = first
+        first = None
+
+    log_id = header.get('id') or make_random_id()
+    if Log.query.filter_by(id=log_id).first() is not None:
+        raise TransferError('Log {} already exists'.format(log_id))
+    log = Log(
+        name=name or header.get('name') or 'Imported log',
+        description=description or header.get('description') or '',
+    )
+    log.id = log_id
+    if header.get('created_at'):
+        log.created_at = _parse_timestamp(
+            header_line, header['created_at'])
+    DB.session.add(log)
+    DB.session.commit()
+
+    if first is not None:
+        records = _prepend(first, records)
+    imported = 0
+    authors = {}
+    try:
+        chunk = []
+        for line_number, record in records:
+            chunk.append((line_number, record))
+            if len(chunk) >= chunk_size:
+                imported += _import_chunk(log_id, chunk, authors)
+                chunk = []
+        if chunk:
+            imported += _import_chunk(log_id, chunk, authors)
+    except Exception:
+        DB.session.rollback()
+        discard_log(log_id)
+        raise
+
+    return Log.query.get(log_id), imported
+
+
+def discard_log(log_id):
+    """Delete a log, its entries in both tiers and its rollups"""
+    log_filter = {'log_id': log_id}
+    DB.session.execute(
+        sqlalchemy.text('DELETE FROM entry_rollup WHERE log_id = :log_id'),
+        log_filter)
+    DB.session.execute(
+        sqlalchemy.text('DELETE FROM entry WHERE log_id = :log_id'),
+        log_filter)
+    DB.session.execute(
+        sqlalchemy.text('DELETE FROM archived_entry WHERE log_id = :log_id'),
+        log_filter)
+    DB.session.execute(
+        sqlalchemy.text('DELETE FROM log WHERE id = :log_id'), log_filter)
+    DB.session.commit()
+
+
+def _import_chunk(log_id, chunk, authors):
+    usernames = {
+        record.get('author') for _, record in chunk
+        if record.get('author') not in authors
+    }
+    if usernames:
+        authors.update(DB.session.query(User.username, User.id).filter(
+            User.username.in_(usernames)))
+
+    entries = []
+    for line_number, record in chunk:
+        if record.get('type', 'entry') != 'entry':
+            raise TransferError('Line {}: unexpected {} record'.format(
+                line_number, record.get('type')))
+        for field in CSV_COLUMNS:
+            if record.get(field) is None:
+                raise TransferError('Line {}: {} is required'.format(
+                    line_number, field))
+        if record['author'] not in authors:
+            raise TransferError('Line {}: no user named {}'.format(
+                line_number, record['author']))
+        entries.append(_ImportedEntry(
+            id=record['id'],
+            log_id=log_id,
+            user_id=authors[record['author']],
+            title=record['title'],
+            description=record['description'],
+            created_at=_parse_timestamp(line_number, record['created_at']),
+        ))
+
+    # The entry table's key catches clashes there, but not with the archive
+    archived = DB.session.query(ArchivedEntry.id).filter(
+        ArchivedEntry.id.in_([entry.id for entry in entries])).first()
+    if archived is not None:
+        raise _id_clash(chunk)
+    try:
+        DB.session.execute(
+            Entry.__table__.insert(),
+            [entry._asdict() for entry in entries],
+        )
+        rollups.record(entries)
+        Log.touch(log_id, entries_added=len(entries))
+        DB.session.commit()
+    except sqlalchemy.exc.IntegrityError:
+        DB.session.rollback()
+        raise _id_clash(chunk)
+    return len(entries)
+
+
+def _id_clash(chunk):
+    return TransferError('Lines {}-{}: an entry id already exists'.format(
+        chunk[0][0], chunk[-1][0]))
+
+
+def _parse_timestamp(line_number, value):
+    try:
+        timestamp = datetime.datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise TransferError('Line {}: invalid created_at'.format(line_number))
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(datetime.timezone.utc).replace(
+            tzinfo=None)
+    return timestamp
+
+
+def _prepend(item, iterator):
+    yield item
+    yield from iterator
+
+
+def _chunks(stream, head, size=64 * 1024):
+    data = head
+    while data:
+        yield data
+        data = stream.read(size)
+
+
+def _gunzip(chunks):
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = decompressor.decompress(chunk)
+        if data:
+            yield data
+    if not decompressor.eof:
+        raise zlib.error('compressed data ended early')
+
+
+def _lines(chunks):
+    # Corrupt gzip data surfaces while reading chunks, so report it against
+    # the first line that could not be read
+    partial = b''
+    line_number = 0
+    try:
+        for chunk in chunks:
+            lines = (partial + chunk).split(b'\n')
+            partial = lines.pop()
+            for line in lines:
+                line_number += 1
+                yield line + b'\n'
+    except zlib.error:
+        raise TransferError(
+            'Line {}: invalid gzip data'.format(line_number + 1))
+    if partial:
+        yield partial
+
+
+def _decoded(binary_lines):
+    for line_number, line in enumerate(binary_lines, 1):
+        try:
+            yield line.decode('utf-8')
+        except UnicodeDecodeError:
+            raise TransferError('Line {}: invalid UTF-8'.format(line_number))
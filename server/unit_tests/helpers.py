@@ -0,0 +1,102 @@
+"""Shared fixtures for the unit tests"""
+
+import contextlib
+import json
+import os
+import unittest
+
+os.environ.setdefault('DATABASE_DSN', 'sqlite://')
+os.environ.setdefault('CAPTCHA_SECRET', 'test-secret')
+os.environ.setdefault('CAPTCHA_CHALLENGE', 'test-challenge')
+
+from sqlalchemy import event #pylint: disable=C0413
+
+from tinylog_server import app as tiny_app #pylint: disable=C0413
+from tinylog_server.cache import ( #pylint: disable=C0413
+    LocalBackend, ResponseCache, TTLCache,
+)
+from tinylog_server.db import models as tiny_models #pylint: disable=C0413
+from tinylog_server.ratelimit import LocalStore #pylint: disable=C0413
+
+
+class AppTestCase(unittest.TestCase):
+    """Runs each test against a fresh in-memory database"""
+
+    def setUp(self):
+        self.app = tiny_app.app
+        self.client = self.app.test_client()
+        self.context = self.app.app_context()
+        self.context.push()
+        tiny_models.DB.create_all()
+        tiny_app.SESSION_CACHE = TTLCache(
+            max_size=tiny_app.CONFIG['SESSION_CACHE_SIZE'],
+            ttl=tiny_app.CONFIG['SESSION_CACHE_TTL'],
+        )
+        tiny_app.RATE_LIMITER.store = LocalStore(
+            max_size=tiny_app.CONFIG['RATE_LIMIT_SIZE'])
+        tiny_app.RESPONSE_CACHE = ResponseCache(
+            LocalBackend(max_size=tiny_app.CONFIG['RESPONSE_CACHE_SIZE']),
+            ttl=tiny_app.CONFIG['RESPONSE_CACHE_TTL'],
+        )
+
+    def tearDown(self):
+        tiny_models.DB.session.remove()
+        tiny_models.DB.drop_all()
+        self.context.pop()
+
+    def create_user(self, username='aflorrick', password='password'):
+        user = tiny_models.User(username, password)
+        tiny_models.DB.session.add(user)
+        tiny_models.DB.session.commit()
+        return user
+
+    def create_log(self, name='Case History', description='Cases'):
+        log = tiny_models.Log(name=name, description=description)
+        tiny_models.DB.session.add(log)
+        tiny_models.DB.session.commit()
+        return log
+
+    def create_entries(self, log, author, count):
+        entries = [
+            tiny_models.Entry(
+                title='Entry {}'.format(index),
+                description='Description {}'.format(index),
+                author_id=author.id,
+                log_id=log.id,
+            )
+            for index in range(count)
+        ]
+        tiny_models.DB.session.add_all(entries)
+        tiny_models.DB.session.commit()
+        return entries
+
+    @contextlib.contextmanager
+    def count_queries(self):
+        """Collect the SQL statements issued inside the block"""
+        statements = []
+        def record(conn, cursor, statement, *args): #pylint: disable=W0613
+            statements.append(statement)
+        engine = tiny_models.DB.engine
+        event.listen(engine, 'before_cursor_execute', record)
+        try:
+            yield statements
+        finally:
+            event.remove(engine, 'before_cursor_execute', record)
+
+    def login(self, username='aflorrick', password='password'):
+        response = self.post_json('/login/', {
+            'username': username,
+            'password': password,
+        })
+        return json.loads(response.data)['access_token']
+
+    def post_json(self, url, payload, headers=None):
+        return self.client.post(
+            url,
+            data=json.dumps(payload),
+            content_type='application/json',
+            headers=headers,
+        )
+
+    def auth_header(self, access_token):
+        return {'Authorization': 'tinylog ' + access_token}
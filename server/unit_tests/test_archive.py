@@ -0,0 +1,110 @@
+"""Tests for archiving old entries and reading across both tiers"""
+
+import datetime
+import gzip
+import json
+
+from helpers import AppTestCase, tiny_models
+
+from tinylog_server.db import archive, rollups
+
+START = datetime.datetime(2017, 9, 1)
+CUTOFF = START + datetime.timedelta(days=3)
+
+
+class TestArchive(AppTestCase):
+    def setUp(self):
+        super().setUp()
+        author = self.create_user()
+        self.log_id = self.create_log().id
+        # One entry a day; the first three are older than CUTOFF
+        for index in range(6):
+            entry = tiny_models.Entry(
+                'Entry {}'.format(index), 'Filed', author.id, self.log_id)
+            entry.created_at = START + datetime.timedelta(days=index)
+            tiny_models.DB.session.add(entry)
+        tiny_models.DB.session.commit()
+        self.headers = self.auth_header(self.login())
+
+    def get(self, url):
+        response = self.client.get(url, headers=self.headers)
+        assert response.status_code == 200, response.data
+        return json.loads(response.data)
+
+    def titles(self, entries):
+        return [entry['title'] for entry in entries]
+
+    def test_old_entries_move_to_the_archive(self):
+        assert archive.archive_entries(CUTOFF, batch_size=2) == 3
+        assert tiny_models.Entry.query.count() == 3
+        assert tiny_models.ArchivedEntry.query.count() == 3
+        assert tiny_models.Log.query.get(self.log_id).archived_until == CUTOFF
+        assert archive.archive_entries(CUTOFF) == 0
+
+    def test_listings_merge_both_tiers(self):
+        archive.archive_entries(CUTOFF)
+        url = '/logs/{}/entries/?limit=2'.format(self.log_id)
+        seen = []
+        while url:
+            page = self.get(url)
+            seen.extend(self.titles(page['entries']))
+            url = page['next']
+        assert seen == ['Entry {}'.format(index) for index in range(6)]
+
+        body = self.get('/entries/')
+        assert self.titles(body['entries']) == seen
+
+    def test_streams_merge_both_tiers(self):
+        archive.archive_entries(CUTOFF)
+        body = self.get('/logs/{}/entries/?stream=1'.format(self.log_id))
+        assert self.titles(body['entries']) == [
+            'Entry {}'.format(index) for index in range(6)]
+
+    def test_ranges_after_the_cutoff_skip_the_archive(self):
+        archive.archive_entries(CUTOFF)
+        url = '/logs/{}/entries/?since={}'.format(
+            self.log_id, CUTOFF.isoformat())
+        with self.count_queries() as statements:
+            body = self.get(url)
+        assert self.titles(body['entries']) == [
+            'Entry 3', 'Entry 4', 'Entry 5']
+        assert not any('archived_entry' in s for s in statements)
+
+        body = self.get('/logs/{}/entries/?until={}'.format(
+            self.log_id, CUTOFF.isoformat()))
+        assert self.titles(body['entries']) == [
+            'Entry 0', 'Entry 1', 'Entry 2']
+
+    def test_archived_entries_are_found_and_embedded(self):
+        archived_id = tiny_models.Entry.query.filter_by(
+            title='Entry 0').one().id
+        archive.archive_entries(CUTOFF)
+
+        body = self.get('/logs/{}/entries/{}/'.format(
+            self.log_id, archived_id))
+        assert body['title'] == 'Entry 0'
+
+        body = self.get('/logs/{}/'.format(self.log_id))
+        assert self.titles(body['entries']) == [
+            'Entry {}'.format(index) for index in range(6)]
+
+    def test_archived_entries_stay_searchable(self):
+        archive.archive_entries(CUTOFF)
+        body = self.get('/search/?q=filed')
+        assert sorted(self.titles(body['entries'])) == [
+            'Entry {}'.format(index) for index in range(6)]
+
+        body = self.get('/search/?q=entry+0&log={}'.format(self.log_id))
+        assert self.titles(body['entries']) == ['Entry 0']
+
+    def test_exports_and_counts_include_the_archive(self):
+        archive.archive_entries(CUTOFF)
+        response = self.client.get(
+            '/logs/{}/export/'.format(self.log_id), headers=self.headers)
+        lines = gzip.decompress(response.data).decode('utf-8').splitlines()
+        assert [json.loads(line)['title'] for line in lines[1:]] == [
+            'Entry {}'.format(index) for index in range(6)]
+
+        with tiny_models.DB.engine.begin() as connection:
+            rollups.rebuild(connection)
+        assert tiny_models.Log.query.get(self.log_id).entry_count == 6
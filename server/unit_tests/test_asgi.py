@@ -0,0 +1,175 @@
+"""Tests for the ASGI entrypoint"""
+
+import asyncio
+import json
+
+from helpers import AppTestCase, tiny_app
+
+from tinylog_server import asgi, transfer
+
+
+def make_scope(method, path, headers=()):
+    return {
+        'type': 'http',
+        'http_version': '1.1',
+        'method': method,
+        'path': path,
+        'query_string': b'',
+        'headers': [
+            (name.encode('latin-1'), value.encode('latin-1'))
+            for name, value in headers
+        ],
+        'server': ('testserver', 80),
+    }
+
+
+class TestWsgiToAsgi(AppTestCase):
+    def call(self, method, path, body=b'', headers=(), chunk_size=None):
+        """Run one request through the ASGI app and collect the response"""
+        chunk_size = chunk_size or max(len(body), 1)
+        chunks = [
+            body[start:start + chunk_size]
+            for start in range(0, max(len(body), 1), chunk_size)
+        ]
+        messages = [
+            {'type': 'http.request', 'body': chunk, 'more_body': True}
+            for chunk in chunks
+        ]
+        messages[-1]['more_body'] = False
+        sent = []
+
+        async def receive():
+            if messages:
+                return messages.pop(0)
+            await asyncio.sleep(3600)
+
+        async def send(message):
+            sent.append(message)
+
+        asyncio.run(asgi.application(
+            make_scope(method, path, headers), receive, send))
+        status = sent[0]['status']
+        response_body = b''.join(m.get('body', b'') for m in sent[1:])
+        return status, response_body
+
+    def test_get(self):
+        status, body = self.call('GET', '/')
+        assert status == 200
+        assert json.loads(body)['users'] == 'http://testserver/users'
+
+    def test_post_with_body(self):
+        self.create_user()
+        status, body = self.call(
+            'POST',
+            '/login/',
+            body=json.dumps({
+                'username': 'aflorrick',
+                'password': 'password',
+            }).encode('utf-8'),
+            headers=[('content-type', 'application/json')],
+        )
+        assert status == 200
+        assert 'access_token' in json.loads(body)
+
+    def test_chunked_body_is_streamed_to_the_view(self):
+        author = self.create_user()
+        log = self.create_log()
+        self.create_entries(log, author, 50)
+        export = b''.join(transfer.gzip_chunks(transfer.export_lines(
+            log, 'ndjson', batch_size=10)))
+        transfer.discard_log(log.id)
+
+        # No Content-Length, as with Transfer-Encoding: chunked
+        status, body = self.call(
+            'POST',
+            '/logs/import/',
+            body=export,
+            headers=[
+                ('authorization', 'tinylog ' + self.login()),
+                ('content-type', 'application/gzip'),
+            ],
+            chunk_size=64,
+        )
+        assert status == 201, body
+        assert json.loads(body)['imported'] == 50
+
+    def test_request_body_is_read_as_the_view_consumes_it(self):
+        messages = [
+            {'type': 'http.request', 'body': b'one\ntw', 'more_body': True},
+            {'type': 'http.request', 'body': b'o\nthree', 'more_body': True},
+            {'type': 'http.request', 'body': b'', 'more_body': False},
+        ]
+        received = []
+
+        async def receive():
+            received.append(messages[len(received)])
+            return received[-1]
+
+        async def read():
+            loop = asyncio.get_running_loop()
+            body = asgi.RequestBody(receive, loop)
+            first = await loop.run_in_executor(None, body.readline)
+            assert len(received) == 1
+            rest = await loop.run_in_executor(None, body.readlines)
+            return [first] + rest
+
+        assert asyncio.run(read()) == [b'one\n', b'two\n', b'three']
+
+    def test_live_streams_hold_no_thread_while_idle(self):
+        self.create_user()
+        log_id = self.create_log().id
+        access_token = self.login()
+        headers = [('authorization', 'tinylog ' + access_token)]
+        # A single thread, which an idle follower must not hold
+        application = asgi.WsgiToAsgi(tiny_app.app, max_workers=1)
+
+        async def follow():
+            disconnect = asyncio.Event()
+            received = asyncio.Queue()
+
+            async def receive():
+                if not hasattr(receive, 'sent'):
+                    receive.sent = True
+                    return {'type': 'http.request', 'body': b'',
+                            'more_body': False}
+                await disconnect.wait()
+                return {'type': 'http.disconnect'}
+
+            async def send(message):
+                await received.put(message)
+
+            async def request(method, path, body=b''):
+                sent = []
+                messages = [{'type': 'http.request', 'body': body,
+                             'more_body': False}]
+                async def request_receive():
+                    if messages:
+                        return messages.pop(0)
+                    await asyncio.sleep(3600)
+                async def request_send(message):
+                    sent.append(message)
+                await application(make_scope(method, path, headers + [
+                    ('content-type', 'application/json')]),
+                    request_receive, request_send)
+                return sent[0]['status']
+
+            follower = asyncio.ensure_future(application(make_scope(
+                'GET', '/logs/{}/entries/stream'.format(log_id), headers),
+                receive, send))
+            assert (await received.get())['status'] == 200
+            assert (await received.get())['body'].startswith(b'retry')
+
+            assert await asyncio.wait_for(request('GET', '/'), 5) == 200
+            assert await asyncio.wait_for(request(
+                'POST', '/logs/{}/entries/'.format(log_id),
+                json.dumps({'title': 'Live', 'description': 'Pushed'})
+                .encode('utf-8')), 5) == 201
+            event = await asyncio.wait_for(received.get(), 5)
+            assert b'"title": "Live"' in event['body']
+
+            disconnect.set()
+            await asyncio.wait_for(follower, 5)
+
+        asyncio.run(follow())
+        assert tiny_app.LIVE.stats()['followers'] == 0
+        application.executor.shutdown()
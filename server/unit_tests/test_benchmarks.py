@@ -0,0 +1,71 @@
+"""Tests for the benchmark report helpers"""
+
+import argparse
+import unittest
+
+from helpers import AppTestCase, tiny_app
+
+from benchmarks import runner
+from benchmarks.seed import Dataset
+
+
+def report(p50, p95, p99):
+    return {'results': {'list_logs': {
+        'latency_ms': {'p50': p50, 'p95': p95, 'p99': p99},
+    }}}
+
+
+class TestBenchmarkReports(unittest.TestCase):
+    def test_percentile_uses_nearest_rank(self):
+        values = list(range(1, 101))
+        self.assertEqual(runner.percentile(values, 0.50), 50)
+        self.assertEqual(runner.percentile(values, 0.95), 95)
+        self.assertEqual(runner.percentile(values, 0.99), 99)
+        self.assertIsNone(runner.percentile([], 0.5))
+
+    def test_compare_flags_p95_regressions(self):
+        rows, regressions = runner.compare(
+            report(10, 20, 30), report(10, 25, 30), threshold=0.1)
+        self.assertEqual(regressions, ['list_logs'])
+        self.assertIn(('list_logs', 'p95', 20, 25, 0.25), rows)
+
+    def test_compare_ignores_small_changes(self):
+        _, regressions = runner.compare(
+            report(10, 20, 30), report(11, 21, 31), threshold=0.1)
+        self.assertEqual(regressions, [])
+
+    def test_encodings_are_measured_against_json(self):
+        from benchmarks import encodings
+        with tiny_app.app.test_request_context():
+            rows = encodings.measure({'entries': [{'id': 'a'}] * 100}, 1)
+        self.assertEqual(rows[0]['format'], 'json')
+        self.assertEqual(rows[0]['ratio'], 1.0)
+        self.assertIn('json+gzip-6', [row['format'] for row in rows])
+
+    def test_every_scenario_has_a_builder(self):
+        self.assertEqual(set(runner.BUILDERS), set(runner.SCENARIOS))
+        for name in ('index', 'captcha_challenge', 'signup', 'logout',
+                     'get_entry', 'get_user', 'all_entries', 'export_log',
+                     'import_log', 'create_log', 'metrics'):
+            self.assertIn(name, runner.SCENARIOS)
+
+
+class TestConnectionsBenchmark(AppTestCase):
+    def test_asgi_followers_leave_threads_free(self):
+        from benchmarks import connections
+        from tinylog_server import asgi
+        self.create_user()
+        dataset = Dataset(
+            usernames=['aflorrick'], password='password',
+            log_ids=[self.create_log().id], entries=[],
+            access_tokens=[self.login()], spare_tokens=[])
+        worker = connections.ASGIWorker(
+            asgi.WsgiToAsgi(tiny_app.app, max_workers=2))
+        try:
+            row = connections.measure(worker, 4, dataset, argparse.Namespace(
+                requests=2, timeout=5))
+        finally:
+            worker.close()
+        assert row['held'] == 4
+        assert row['delivered'] == 4
+        assert row['timeouts'] == 0
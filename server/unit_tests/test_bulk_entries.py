@@ -0,0 +1,71 @@
+"""Tests for the bulk entry ingestion endpoint"""
+
+import json
+
+from helpers import AppTestCase, tiny_models
+
+
+class TestBulkEntries(AppTestCase):
+    def setUp(self):
+        super().setUp()
+        self.create_user()
+        self.log = self.create_log()
+        self.url = '/logs/{}/entries/bulk/'.format(self.log.id)
+        self.headers = self.auth_header(self.login())
+        self.client.get('/current-user/', headers=self.headers)
+
+    def make_batch(self, count):
+        return [
+            {'title': 'Entry {}'.format(index), 'description': 'Bulk'}
+            for index in range(count)
+        ]
+
+    def test_batch_is_created(self):
+        response = self.post_json(self.url, self.make_batch(20), self.headers)
+        assert response.status_code == 201
+        results = json.loads(response.data)['results']
+        assert [result['status'] for result in results] == [201] * 20
+        assert results[3]['entry']['title'] == 'Entry 3'
+        assert tiny_models.Entry.query.count() == 20
+
+    def test_statement_count_does_not_grow_with_batch_size(self):
+        counts = []
+        for size in (2, 40):
+            with self.count_queries() as statements:
+                self.post_json(self.url, self.make_batch(size), self.headers)
+            counts.append(len(statements))
+        assert counts[0] == counts[1]
+
+    def test_invalid_entry_rejects_the_whole_batch(self):
+        batch = self.make_batch(3)
+        del batch[1]['title']
+        response = self.post_json(self.url, batch, self.headers)
+        assert response.status_code == 400
+        results = json.loads(response.data)['results']
+        assert [result['status'] for result in results] == [424, 400, 424]
+        assert tiny_models.Entry.query.count() == 0
+
+    def test_empty_batch_is_rejected_without_touching_the_log(self):
+        version = self.log.version
+        empty_ndjson = self.client.post(
+            self.url,
+            data='\n',
+            content_type='application/x-ndjson',
+            headers=self.headers,
+        )
+        for response in (self.post_json(self.url, [], self.headers),
+                         empty_ndjson):
+            assert response.status_code == 400
+            assert json.loads(response.data) == 'At least one entry is required'
+        assert tiny_models.Log.query.get(self.log.id).version == version
+
+    def test_ndjson_body(self):
+        body = '\n'.join(json.dumps(item) for item in self.make_batch(4))
+        response = self.client.post(
+            self.url,
+            data=body,
+            content_type='application/x-ndjson',
+            headers=self.headers,
+        )
+        assert response.status_code == 201
+        assert tiny_models.Entry.query.count() == 4
@@ -0,0 +1,93 @@
+"""Tests for captcha verification backends"""
+
+import http.server
+import json
+import threading
+import time
+import unittest
+
+from helpers import AppTestCase
+
+from tinylog_server import recaptcha
+
+
+class StubHandler(http.server.BaseHTTPRequestHandler):
+    """Answers like siteverify: tokens starting with 'good' succeed"""
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self): #pylint: disable=C0103
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        self.server.requests += 1
+        if b'slow' in body:
+            time.sleep(1)
+        payload = json.dumps({'success': b'response=good' in body})
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload.encode('utf-8'))
+
+    def log_message(self, *args): #pylint: disable=W0221
+        pass
+
+
+class TestHTTPVerifier(unittest.TestCase):
+    def setUp(self):
+        self.server = http.server.ThreadingHTTPServer(
+            ('127.0.0.1', 0), StubHandler)
+        self.server.requests = 0
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.verifier = recaptcha.HTTPVerifier(
+            url='http://127.0.0.1:{}/'.format(self.server.server_port),
+            read_timeout=0.2,
+        )
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_stub_answers_are_used(self):
+        assert self.verifier.verify('secret', 'good-token')
+        assert not self.verifier.verify('secret', 'bad-token')
+
+    def test_slow_upstream_is_an_error(self):
+        with self.assertRaises(recaptcha.VerificationError):
+            self.verifier.verify('secret', 'good-but-slow')
+
+    def test_caching_verifier_reuses_answers(self):
+        verifier = recaptcha.CachingVerifier(self.verifier, ttl=60)
+        assert verifier.verify('secret', 'good-token')
+        assert verifier.verify('secret', 'good-token')
+        assert self.server.requests == 1
+
+    def test_caching_verifier_does_not_cache_errors(self):
+        verifier = recaptcha.CachingVerifier(self.verifier, ttl=60)
+        for _ in range(2):
+            with self.assertRaises(recaptcha.VerificationError):
+                verifier.verify('secret', 'good-but-slow')
+        assert self.server.requests == 2
+
+
+class UnreachableVerifier(recaptcha.Verifier):
+    def verify(self, secret, response):
+        raise recaptcha.VerificationError('unreachable')
+
+
+class TestSignupVerification(AppTestCase):
+    def setUp(self):
+        super().setUp()
+        self.verifier = recaptcha.get_verifier()
+        recaptcha.set_verifier(UnreachableVerifier())
+
+    def tearDown(self):
+        recaptcha.set_verifier(self.verifier)
+        super().tearDown()
+
+    def test_unreachable_upstream_asks_for_a_retry(self):
+        response = self.post_json('/users/', {
+            'username': 'dlockhart',
+            'password': 'password',
+            'captcha_token': 'token',
+        })
+        assert response.status_code == 503
+        assert response.headers['Retry-After'] == '1'
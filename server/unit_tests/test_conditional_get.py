@@ -0,0 +1,67 @@
+"""Tests for ETag and Last-Modified handling on log resources"""
+
+import datetime
+
+from helpers import AppTestCase, tiny_models
+
+
+class TestConditionalGet(AppTestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = self.create_user()
+        self.log = self.create_log()
+        self.headers = self.auth_header(self.login())
+        self.urls = [
+            '/logs/{}/'.format(self.log.id),
+            '/logs/{}/entries/'.format(self.log.id),
+        ]
+
+    def get(self, url, **headers):
+        return self.client.get(url, headers=dict(self.headers, **headers))
+
+    def test_matching_etag_is_not_modified(self):
+        for url in self.urls:
+            etag = self.get(url).headers['ETag']
+            response = self.get(url, **{'If-None-Match': etag})
+            assert response.status_code == 304
+            assert response.data == b''
+
+    def test_new_entry_changes_the_etag(self):
+        etags = [self.get(url).headers['ETag'] for url in self.urls]
+        self.post_json(
+            '/logs/{}/entries/'.format(self.log.id),
+            {'title': 'New', 'description': 'Entry'},
+            self.headers,
+        )
+        for url, etag in zip(self.urls, etags):
+            assert self.get(url, **{'If-None-Match': etag}).status_code == 200
+
+    def test_if_modified_since(self):
+        # A whole second, which Last-Modified can show exactly
+        self.log.updated_at = datetime.datetime(2017, 9, 1, 12, 0, 0)
+        tiny_models.DB.session.commit()
+        url = self.urls[0]
+        last_modified = self.get(url).headers['Last-Modified']
+        response = self.get(url, **{'If-Modified-Since': last_modified})
+        assert response.status_code == 304
+
+    def test_writes_in_the_same_second_are_modified(self):
+        url = self.urls[0]
+        entries_url = '/logs/{}/entries/'.format(self.log.id)
+        self.post_json(
+            entries_url, {'title': 'First', 'description': 'Entry'},
+            self.headers)
+        last_modified = self.get(url).headers['Last-Modified']
+        self.post_json(
+            entries_url, {'title': 'Second', 'description': 'Entry'},
+            self.headers)
+        response = self.get(url, **{'If-Modified-Since': last_modified})
+        assert response.status_code == 200
+
+    def test_not_modified_check_loads_no_entries(self):
+        self.create_entries(self.log, self.author, 5)
+        url = self.urls[1]
+        etag = self.get(url).headers['ETag']
+        with self.count_queries() as statements:
+            self.get(url, **{'If-None-Match': etag})
+        assert not any('FROM entry' in statement for statement in statements)
@@ -0,0 +1,82 @@
+"""Tests for response compression and MessagePack listings"""
+
+import gzip
+import json
+import unittest
+
+from helpers import AppTestCase, tiny_app
+
+from tinylog_server import encoding
+
+
+class TestCompression(AppTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = self.create_user()
+        self.access_token = self.login()
+        self.log = self.create_log()
+        self.create_entries(self.log, self.user, 50)
+        self.original_encodings = tiny_app.COMPRESSION_ENCODINGS
+        tiny_app.COMPRESSION_ENCODINGS = ['gzip']
+
+    def tearDown(self):
+        tiny_app.COMPRESSION_ENCODINGS = self.original_encodings
+        super().tearDown()
+
+    def get(self, url, **headers):
+        headers.update(self.auth_header(self.access_token))
+        return self.client.get(url, headers=headers)
+
+    def test_large_responses_are_gzipped(self):
+        plain = self.get('/logs/{}/'.format(self.log.id))
+        response = self.get(
+            '/logs/{}/'.format(self.log.id), **{'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response.headers['Vary'])
+        self.assertEqual(gzip.decompress(response.data), plain.data)
+        self.assertLess(len(response.data), len(plain.data))
+
+    def test_clients_without_gzip_get_identity(self):
+        response = self.get(
+            '/logs/{}/'.format(self.log.id), **{'Accept-Encoding': 'br'})
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertIn('Accept-Encoding', response.headers['Vary'])
+        json.loads(response.data)
+
+    def test_small_responses_are_not_compressed(self):
+        response = self.get('/current-user/', **{'Accept-Encoding': 'gzip'})
+        self.assertNotIn('Content-Encoding', response.headers)
+
+    def test_streams_are_not_compressed(self):
+        response = self.get(
+            '/logs/{}/entries/?stream=1'.format(self.log.id),
+            **{'Accept-Encoding': 'gzip'})
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertIn(b'Entry 49', response.data)
+
+    def test_encodings_need_their_package(self):
+        self.assertEqual(encoding.available_encodings('gzip, deflate'),
+                         ['gzip'])
+        self.assertEqual(
+            'br' in encoding.available_encodings('br,gzip'),
+            encoding.brotli is not None)
+
+
+@unittest.skipIf(encoding.msgpack is None, 'msgpack is not installed')
+class TestMessagePack(AppTestCase):
+    def setUp(self):
+        super().setUp()
+        self.create_user()
+        self.access_token = self.login()
+        self.log = self.create_log()
+
+    def test_listings_follow_the_accept_header(self):
+        headers = self.auth_header(self.access_token)
+        as_json = self.client.get('/logs/', headers=headers)
+        headers['Accept'] = encoding.MSGPACK_MIMETYPE
+        as_msgpack = self.client.get('/logs/', headers=headers)
+        self.assertEqual(as_msgpack.mimetype, encoding.MSGPACK_MIMETYPE)
+        self.assertIn('Accept', as_msgpack.headers['Vary'])
+        self.assertEqual(
+            encoding.msgpack.unpackb(as_msgpack.data, raw=False),
+            json.loads(as_json.data))
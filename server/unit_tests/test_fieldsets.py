@@ -0,0 +1,82 @@
+"""Tests for the fields and embed query parameters"""
+
+import json
+
+from helpers import AppTestCase
+
+
+class TestFieldsets(AppTestCase):
+    def setUp(self):
+        super().setUp()
+        author = self.create_user()
+        self.log = self.create_log()
+        self.create_entries(self.log, author, 3)
+        self.log_id = self.log.id
+        self.headers = self.auth_header(self.login())
+
+    def get(self, url):
+        response = self.client.get(url, headers=self.headers)
+        return response.status_code, json.loads(response.data)
+
+    def query(self, url):
+        with self.count_queries() as statements:
+            self.client.get(url, headers=self.headers)
+        return statements
+
+    def test_logs_keep_their_full_shape_by_default(self):
+        status, body = self.get('/logs/')
+        assert status == 200
+        assert set(body['logs'][0]) == {
+            '_link', 'name', 'description', 'entry_count', 'entries'}
+        assert len(body['logs'][0]['entries']) == 3
+
+    def test_fields_select_log_columns_without_entries(self):
+        status, body = self.get('/logs/?fields=name')
+        assert status == 200
+        assert body['logs'] == [{
+            '_link': 'http://localhost/logs/{}'.format(self.log_id),
+            'name': 'Case History',
+        }]
+
+        statements = self.query('/logs/?fields=name&limit=5')
+        log_queries = [s for s in statements if 'FROM log' in s]
+        assert len(log_queries) == 1
+        assert 'log.description' not in log_queries[0]
+        assert not any('FROM entry' in s for s in statements)
+
+    def test_entries_are_embedded_on_request(self):
+        status, body = self.get('/logs/{}/?fields=name&embed=entries'.format(
+            self.log_id))
+        assert status == 200
+        assert set(body) == {'_link', 'name', 'entries'}
+        assert len(body['entries']) == 3
+
+    def test_embed_alone_can_drop_entries(self):
+        status, body = self.get('/logs/?embed=')
+        assert status == 200
+        assert 'entries' not in body['logs'][0]
+        assert 'description' in body['logs'][0]
+
+    def test_entry_fields_skip_the_author(self):
+        url = '/logs/{}/entries/?fields=title'.format(self.log_id)
+        status, body = self.get(url)
+        assert status == 200
+        assert set(body['entries'][0]) == {'_link', 'title'}
+        assert not any('FROM user' in s or 'JOIN user' in s
+                       for s in self.query(url))
+
+    def test_entry_fields_apply_to_streams(self):
+        response = self.client.get(
+            '/entries/?fields=title,log',
+            headers=dict(self.headers, Accept='application/x-ndjson'),
+        )
+        rows = [json.loads(line) for line in response.data.splitlines()]
+        assert len(rows) == 3
+        assert set(rows[0]) == {'_link', 'title', 'log'}
+
+    def test_unknown_fields_are_rejected(self):
+        status, body = self.get('/logs/?fields=name,secret')
+        assert status == 400
+        assert 'secret' in body
+        status, _ = self.get('/logs/?embed=authors')
+        assert status == 400
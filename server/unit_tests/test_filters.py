@@ -0,0 +1,52 @@
+"""Tests for time-range and author filters on entry listings"""
+
+import datetime
+import json
+
+from helpers import AppTestCase, tiny_models
+
+
+class TestEntryFilters(AppTestCase):
+    def setUp(self):
+        super().setUp()
+        alicia = self.create_user('aflorrick')
+        cary = self.create_user('agos')
+        self.log = self.create_log()
+        other_log = self.create_log('Other')
+        start = datetime.datetime(2017, 9, 1)
+        for day in range(6):
+            for author, log in ((alicia, self.log), (cary, other_log)):
+                entry = tiny_models.Entry(
+                    'Day {}'.format(day), 'Work', author.id, log.id)
+                entry.created_at = start + datetime.timedelta(days=day)
+                tiny_models.DB.session.add(entry)
+        tiny_models.DB.session.commit()
+        self.headers = self.auth_header(self.login())
+
+    def get(self, url):
+        response = self.client.get(url, headers=self.headers)
+        return response.status_code, json.loads(response.data)
+
+    def test_time_range_within_a_log(self):
+        status, body = self.get(
+            '/logs/{}/entries/?since=2017-09-02&until=2017-09-04'.format(
+                self.log.id))
+        assert status == 200
+        assert [e['title'] for e in body['entries']] == ['Day 1', 'Day 2']
+
+    def test_author_across_logs(self):
+        status, body = self.get('/entries/?author=agos&since=2017-09-05')
+        assert status == 200
+        assert [e['author'].rsplit('/', 1)[-1] for e in body['entries']] == [
+            'agos', 'agos']
+
+    def test_cross_log_listing_spans_logs(self):
+        _, body = self.get('/entries/?until=2017-09-02T00:00:00%2B00:00')
+        assert len(body['entries']) == 2
+
+    def test_unknown_author_matches_nothing(self):
+        _, body = self.get('/entries/?author=nobody')
+        assert body['entries'] == []
+
+    def test_invalid_timestamp_is_rejected(self):
+        assert self.get('/entries/?since=last-week')[0] == 400
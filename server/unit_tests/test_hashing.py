@@ -0,0 +1,63 @@
+"""Tests for the password hashing pool"""
+
+import threading
+import unittest
+
+from helpers import AppTestCase, tiny_app
+
+from tinylog_server import hashing
+
+
+class BlockingContext(object):
+    """Stands in for a CryptContext whose hashes wait for a signal"""
+
+    def __init__(self):
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def hash(self, password):
+        self.started.set()
+        self.release.wait(5)
+        return 'hashed-' + password
+
+    def verify(self, password, password_hash):
+        return password_hash == 'hashed-' + password
+
+
+class TestHashingPool(unittest.TestCase):
+    def test_saturated_pool_rejects_work(self):
+        context = BlockingContext()
+        pool = hashing.HashingPool(context, max_workers=1, max_pending=0)
+        results = []
+        worker = threading.Thread(
+            target=lambda: results.append(pool.hash('secret')))
+        worker.start()
+        context.started.wait(5)
+
+        with self.assertRaises(hashing.PoolSaturatedError):
+            pool.verify('secret', 'hashed-secret')
+
+        context.release.set()
+        worker.join(5)
+        assert results == ['hashed-secret']
+        assert pool.verify('secret', 'hashed-secret')
+        assert pool.stats()['rejected'] == 1
+
+
+class TestLoginWhenSaturated(AppTestCase):
+    def test_login_is_turned_away_with_retry_after(self):
+        self.create_user()
+        pool = tiny_app.PASSWORD_POOL
+        tiny_app.PASSWORD_POOL = hashing.HashingPool(
+            pool.context, max_workers=1, max_pending=0)
+        tiny_app.PASSWORD_POOL._in_flight = 1
+        try:
+            response = self.post_json('/login/', {
+                'username': 'aflorrick',
+                'password': 'password',
+            })
+        finally:
+            tiny_app.PASSWORD_POOL = pool
+        assert response.status_code == 503
+        assert response.headers['Retry-After'] == '1'
+        assert response.headers['X-Hash-Queue-Depth'] == '0'
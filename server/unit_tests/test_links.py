@@ -0,0 +1,41 @@
+"""Tests for the links built into serialized resources"""
+
+import unittest
+
+from helpers import AppTestCase, tiny_models
+
+
+class TestUrlBuilder(unittest.TestCase):
+    def test_links_are_built_under_the_root(self):
+        urls = tiny_models.UrlBuilder('http://example.com/api')
+        assert urls.path('search') == 'http://example.com/api/search'
+        assert urls.user('aflorrick') == (
+            'http://example.com/api/users/aflorrick')
+        assert urls.log('ab12') == 'http://example.com/api/logs/ab12'
+        assert urls.entry('ab12', 'cd34') == (
+            'http://example.com/api/logs/ab12/entries/cd34')
+
+    def test_builders_are_reused_per_root(self):
+        assert (tiny_models.url_builder('http://a/')
+                is tiny_models.url_builder('http://a/'))
+
+
+class TestEntryLinks(AppTestCase):
+    def setUp(self):
+        super().setUp()
+        author = self.create_user()
+        log = self.create_log()
+        self.entry_id = self.create_entries(log, author, 1)[0].id
+        self.log_id = log.id
+        tiny_models.DB.session.expire_all()
+
+    def test_serializing_loads_no_relationships(self):
+        entry = tiny_models.Entry.query_with_relations().get(self.entry_id)
+        urls = tiny_models.url_builder('http://localhost/')
+        with self.count_queries() as statements:
+            data = entry.to_dict(urls)
+        assert statements == []
+        assert data['_link'] == 'http://localhost/logs/{}/entries/{}'.format(
+            self.log_id, self.entry_id)
+        assert data['log'] == 'http://localhost/logs/{}'.format(self.log_id)
+        assert data['author'] == 'http://localhost/users/aflorrick'
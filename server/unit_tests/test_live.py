@@ -0,0 +1,147 @@
+"""Tests for live entry streams"""
+
+import datetime
+import json
+import unittest
+
+from helpers import AppTestCase, tiny_app, tiny_models
+
+from tinylog_server import live
+
+
+class TestEntryStream(AppTestCase):
+    def setUp(self):
+        super().setUp()
+        author = self.create_user()
+        self.author_id = author.id
+        self.log_id = self.create_log().id
+        self.create_entries(
+            tiny_models.Log.query.get(self.log_id), author, 2)
+        self.headers = self.auth_header(self.login())
+        self.url = '/logs/{}/entries/stream'.format(self.log_id)
+        self.heartbeat = tiny_app.CONFIG['LIVE_HEARTBEAT']
+        tiny_app.CONFIG['LIVE_HEARTBEAT'] = 0
+
+    def tearDown(self):
+        tiny_app.CONFIG['LIVE_HEARTBEAT'] = self.heartbeat
+        super().tearDown()
+
+    def open_stream(self, **headers):
+        response = self.client.get(
+            self.url, headers=dict(self.headers, **headers), buffered=False)
+        assert response.status_code == 200
+        assert response.mimetype == 'text/event-stream'
+        return iter(response.response)
+
+    def next_event(self, stream):
+        for chunk in stream:
+            chunk = chunk.decode('utf-8') if isinstance(chunk, bytes) else chunk
+            if chunk.startswith('id: '):
+                event_id, data = chunk.splitlines()[:2]
+                return event_id[len('id: '):], json.loads(data[len('data: '):])
+        return None
+
+    def post_entry(self, title):
+        self.post_json('/logs/{}/entries/'.format(self.log_id), {
+            'title': title,
+            'description': 'Live',
+        }, self.headers)
+
+    def commit_late(self, title):
+        """Commit an entry created before the newest one and publish it"""
+        entry = tiny_models.Entry(
+            title=title,
+            description='Late',
+            author_id=self.author_id,
+            log_id=self.log_id,
+        )
+        entry.created_at = (
+            datetime.datetime.utcnow() - datetime.timedelta(seconds=1))
+        tiny_models.DB.session.add(entry)
+        tiny_models.DB.session.commit()
+        tiny_app.publish_events([live.EntryEvent(entry)])
+
+    def test_new_entries_are_pushed(self):
+        stream = self.open_stream()
+        assert next(stream).startswith(b'retry')
+        self.post_entry('First')
+        self.post_entry('Second')
+        assert self.next_event(stream)[1]['title'] == 'First'
+        assert self.next_event(stream)[1]['title'] == 'Second'
+        assert tiny_app.LIVE.stats()['followers'] == 1
+        stream.close()
+        assert tiny_app.LIVE.stats()['followers'] == 0
+
+    def test_resume_from_last_event_id(self):
+        stream = self.open_stream()
+        next(stream)
+        self.post_entry('Seen')
+        event_id, _ = self.next_event(stream)
+        stream.close()
+
+        self.post_entry('Missed')
+        stream = self.open_stream(**{'Last-Event-ID': event_id})
+        # The entries created in setUp are inside the lookback window, so
+        # they are sent again, but the last event received is not
+        titles = [self.next_event(stream)[1]['title'] for _ in range(3)]
+        assert sorted(titles[:2]) == ['Entry 0', 'Entry 1']
+        assert titles[2] == 'Missed'
+        stream.close()
+
+    def test_entries_committed_out_of_order_are_pushed(self):
+        stream = self.open_stream()
+        next(stream)
+        self.post_entry('Newer')
+        self.commit_late('Older')
+        assert self.next_event(stream)[1]['title'] == 'Newer'
+        assert self.next_event(stream)[1]['title'] == 'Older'
+        stream.close()
+
+    def test_resume_sends_entries_committed_out_of_order(self):
+        stream = self.open_stream()
+        next(stream)
+        self.post_entry('Seen')
+        event_id, _ = self.next_event(stream)
+        stream.close()
+
+        self.commit_late('Late')
+        stream = self.open_stream(**{'Last-Event-ID': event_id})
+        titles = [self.next_event(stream)[1]['title'] for _ in range(3)]
+        assert 'Late' in titles and 'Seen' not in titles
+        stream.close()
+
+    def test_events_are_only_built_for_the_local_backend(self):
+        entry = tiny_models.Entry.query.filter_by(log_id=self.log_id).first()
+        assert len(tiny_app.entry_events([entry])) == 1
+        tiny_app.CONFIG['LIVE_BACKEND'] = 'postgres'
+        try:
+            assert tiny_app.entry_events([entry]) == []
+        finally:
+            tiny_app.CONFIG['LIVE_BACKEND'] = 'local'
+
+    def test_idle_stream_sends_heartbeats(self):
+        stream = self.open_stream()
+        next(stream)
+        assert next(stream).startswith(b':')
+        stream.close()
+
+
+class TestRecentIds(unittest.TestCase):
+    def setUp(self):
+        self.now = datetime.datetime(2020, 1, 1)
+        self.recent = live.RecentIds(datetime.timedelta(seconds=5))
+
+    def key(self, seconds, entry_id):
+        return (self.now + datetime.timedelta(seconds=seconds), entry_id)
+
+    def test_entries_are_seen_once_in_any_order(self):
+        assert self.recent.add(self.key(2, 'b'))
+        assert self.recent.add(self.key(1, 'a'))
+        assert not self.recent.add(self.key(2, 'b'))
+        assert not self.recent.add(self.key(1, 'a'))
+
+    def test_entries_outside_the_window_are_forgotten(self):
+        self.recent.add(self.key(0, 'a'))
+        self.recent.add(self.key(10, 'b'))
+        assert self.recent.floor == self.now + datetime.timedelta(seconds=5)
+        assert self.recent.add(self.key(0, 'a'))
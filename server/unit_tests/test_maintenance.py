@@ -0,0 +1,43 @@
+"""Tests for database housekeeping jobs"""
+
+import datetime
+
+from helpers import AppTestCase, tiny_models
+
+from tinylog_server.db import maintenance
+
+
+class TestSweepExpiredSessions(AppTestCase):
+    def test_only_expired_sessions_are_removed(self):
+        user = self.create_user()
+        sessions = [tiny_models.Session(user.id) for _ in range(7)]
+        for session in sessions[:5]:
+            session.expires_at = datetime.datetime.utcnow() - \
+                datetime.timedelta(minutes=1)
+        tiny_models.DB.session.add_all(sessions)
+        tiny_models.DB.session.commit()
+
+        with self.count_queries() as statements:
+            removed = maintenance.sweep_expired_sessions(batch_size=2)
+
+        assert removed == 5
+        assert tiny_models.Session.query.count() == 2
+        # Three batches of select and delete
+        deletes = [s for s in statements if s.startswith('DELETE')]
+        assert len(deletes) == 3
+
+
+class TestSessionSweeper(AppTestCase):
+    def test_each_run_is_reported_through_the_app_logger(self):
+        user = self.create_user()
+        session = tiny_models.Session(user.id)
+        session.expires_at = datetime.datetime.utcnow() - \
+            datetime.timedelta(minutes=1)
+        tiny_models.DB.session.add(session)
+        tiny_models.DB.session.commit()
+
+        sweeper = maintenance.SessionSweeper(
+            self.app, interval=60, batch_size=10)
+        with self.assertLogs(self.app.logger, level='INFO') as logs:
+            sweeper.sweep()
+        assert logs.output[-1].endswith('Swept 1 expired sessions')
@@ -0,0 +1,104 @@
+"""Tests for request metrics and the /metrics endpoint"""
+
+import logging
+import unittest
+
+from helpers import AppTestCase, tiny_app
+
+from tinylog_server import metrics
+
+
+class TestRegistry(unittest.TestCase):
+    def test_histogram_renders_cumulative_buckets(self):
+        registry = metrics.Registry()
+        histogram = metrics.Histogram(
+            'test_seconds', 'Test', labels=('route',), buckets=(0.1, 1.0),
+            registry=registry)
+        histogram.labels('/a/').observe(0.05)
+        histogram.labels('/a/').observe(0.5)
+        histogram.labels('/a/').observe(5)
+
+        lines = registry.render().splitlines()
+        self.assertIn('# TYPE test_seconds histogram', lines)
+        self.assertIn('test_seconds_bucket{route="/a/",le="0.1"} 1', lines)
+        self.assertIn('test_seconds_bucket{route="/a/",le="1.0"} 2', lines)
+        self.assertIn('test_seconds_bucket{route="/a/",le="+Inf"} 3', lines)
+        self.assertIn('test_seconds_count{route="/a/"} 3', lines)
+
+    def test_label_values_are_escaped(self):
+        registry = metrics.Registry()
+        counter = metrics.Counter(
+            'test', 'Test', labels=('path',), registry=registry)
+        counter.labels('say "hi"\n').inc()
+        self.assertIn(
+            'test_total{path="say \\"hi\\"\\n"} 1', registry.render())
+
+
+class TestRequestMetrics(AppTestCase):
+    def setUp(self):
+        super().setUp()
+        self.threshold = tiny_app.CONFIG['SLOW_REQUEST_THRESHOLD']
+        self.create_user()
+        self.access_token = self.login()
+
+    def tearDown(self):
+        tiny_app.CONFIG['SLOW_REQUEST_THRESHOLD'] = self.threshold
+        super().tearDown()
+
+    def test_requests_are_recorded_by_route(self):
+        log = self.create_log()
+        self.client.get(
+            '/logs/{}/entries/'.format(log.id),
+            headers=self.auth_header(self.access_token))
+
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content_type.startswith('text/plain'))
+        body = response.data.decode('utf-8')
+        self.assertIn(
+            'tinylog_request_seconds_count{method="GET",'
+            'route="/logs/<log_id>/entries/",status="200"}', body)
+        self.assertIn(
+            'tinylog_request_sql_statements_count{method="GET",'
+            'route="/logs/<log_id>/entries/"}', body)
+        self.assertIn('tinylog_password_hash_seconds_count{operation="verify"}',
+                      body)
+        self.assertIn('tinylog_password_hash_pool{state="queued"} 0', body)
+
+    def test_session_cache_stats_are_exposed(self):
+        headers = self.auth_header(self.access_token)
+        self.client.get('/current-user/', headers=headers)
+        self.client.get('/current-user/', headers=headers)
+
+        body = self.client.get('/metrics').data.decode('utf-8')
+        stats = tiny_app.SESSION_CACHE.stats()
+        self.assertGreaterEqual(stats['hits'], 1)
+        self.assertIn(
+            'tinylog_session_cache{{stat="hits"}} {}'.format(stats['hits']),
+            body)
+        self.assertIn('tinylog_session_cache{stat="max_size"}', body)
+
+    def test_sql_is_captured_per_request(self):
+        log_id = self.create_log().id
+        metrics.start_capture(keep_statements=True)
+        tiny_app.tiny_models.Log.query.filter_by(id=log_id).first()
+        capture = metrics.stop_capture()
+        self.assertEqual(capture.count, 1)
+        self.assertIn('FROM log', capture.statements[0][0])
+        self.assertIsNone(metrics.stop_capture())
+
+    def test_slow_requests_are_logged_with_their_queries(self):
+        tiny_app.CONFIG['SLOW_REQUEST_THRESHOLD'] = 1e-9
+        with self.assertLogs(tiny_app.app.logger, logging.WARNING) as logs:
+            self.client.get(
+                '/current-user/', headers=self.auth_header(self.access_token))
+        self.assertIn('Slow request: GET /current-user/', logs.output[0])
+        self.assertIn('FROM user', logs.output[0])
+
+    def test_fast_requests_are_not_logged(self):
+        tiny_app.CONFIG['SLOW_REQUEST_THRESHOLD'] = 60
+        logger = tiny_app.app.logger
+        with self.assertRaises(AssertionError):
+            with self.assertLogs(logger, logging.WARNING):
+                self.client.get(
+                    '/current-user/', headers=self.auth_header(self.access_token))
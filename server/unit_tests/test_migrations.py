@@ -0,0 +1,38 @@
+"""Tests for the schema migration runner"""
+
+import sqlalchemy
+
+from helpers import AppTestCase, tiny_models
+
+from tinylog_server.db import migrations
+
+
+class TestMigrations(AppTestCase):
+    def tearDown(self):
+        migrations.SCHEMA_MIGRATION.drop(
+            bind=tiny_models.DB.engine, checkfirst=True)
+        super().tearDown()
+
+    def index_names(self, table):
+        inspector = sqlalchemy.inspect(tiny_models.DB.engine)
+        return {index['name'] for index in inspector.get_indexes(table)}
+
+    def test_upgrade_adds_missing_indexes(self):
+        engine = tiny_models.DB.engine
+        engine.execute('DROP INDEX ix_entry_log_id_created_at')
+        engine.execute('DROP INDEX ix_session_expires_at')
+
+        assert migrations.upgrade(engine) == [
+            version for version, _, _ in migrations.MIGRATIONS]
+        assert 'ix_entry_log_id_created_at' in self.index_names('entry')
+        assert 'ix_session_expires_at' in self.index_names('session')
+
+    def test_upgrade_is_idempotent(self):
+        engine = tiny_models.DB.engine
+        migrations.upgrade(engine)
+        assert migrations.upgrade(engine) == []
+
+    def test_stamped_database_has_nothing_pending(self):
+        engine = tiny_models.DB.engine
+        migrations.stamp(engine)
+        assert migrations.pending_migrations(engine) == []
@@ -0,0 +1,47 @@
+"""Tests for keyset pagination of the listing endpoints"""
+
+import json
+
+from helpers import AppTestCase
+
+
+class TestPagination(AppTestCase):
+    def setUp(self):
+        super().setUp()
+        author = self.create_user()
+        self.log = self.create_log()
+        self.entry_ids = sorted(
+            (entry.created_at, entry.id)
+            for entry in self.create_entries(self.log, author, 7)
+        )
+        self.headers = self.auth_header(self.login())
+
+    def get(self, url):
+        response = self.client.get(url, headers=self.headers)
+        return response.status_code, json.loads(response.data)
+
+    def test_pages_cover_every_entry_once(self):
+        url = '/logs/{}/entries/?limit=3'.format(self.log.id)
+        seen = []
+        pages = 0
+        while url is not None:
+            status, body = self.get(url)
+            assert status == 200
+            assert len(body['entries']) <= 3
+            seen.extend(entry['_link'].rsplit('/', 1)[-1]
+                        for entry in body['entries'])
+            url = body['next']
+            pages += 1
+        assert pages == 3
+        assert seen == [entry_id for _, entry_id in self.entry_ids]
+
+    def test_last_page_has_no_next_link(self):
+        status, body = self.get('/users/?limit=5')
+        assert status == 200
+        assert body['next'] is None
+
+    def test_invalid_parameters_are_rejected(self):
+        url = '/logs/{}/entries/'.format(self.log.id)
+        assert self.get(url + '?limit=0')[0] == 400
+        assert self.get(url + '?limit=abc')[0] == 400
+        assert self.get(url + '?after=not-a-cursor')[0] == 400
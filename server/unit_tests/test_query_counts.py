@@ -0,0 +1,78 @@
+"""Check that listing endpoints issue a constant number of SQL statements"""
+
+import re
+
+from helpers import AppTestCase, tiny_app, tiny_models
+
+
+class TestQueryCounts(AppTestCase):
+    def setUp(self):
+        super().setUp()
+        # Rows are added behind the views' backs, so don't cache responses
+        self.response_cache_ttl = tiny_app.CONFIG['RESPONSE_CACHE_TTL']
+        tiny_app.CONFIG['RESPONSE_CACHE_TTL'] = 0
+        for username in ('aflorrick', 'dlockhart', 'wgardner'):
+            self.create_user(username)
+        self.access_token = self.login()
+        self.headers = self.auth_header(self.access_token)
+        # Warm the session cache so only the view's queries are counted
+        self.client.get('/current-user/', headers=self.headers)
+
+    def tearDown(self):
+        tiny_app.CONFIG['RESPONSE_CACHE_TTL'] = self.response_cache_ttl
+        super().tearDown()
+
+    def add_data(self, entries_per_log):
+        logs = [self.create_log('Log {}'.format(i)) for i in range(3)]
+        for log in logs:
+            for user in tiny_models.User.query.all():
+                self.create_entries(log, user, entries_per_log)
+        tiny_models.DB.session.expire_all()
+        return logs
+
+    def query_count(self, url):
+        tiny_models.DB.session.remove()
+        with self.count_queries() as statements:
+            response = self.client.get(url, headers=self.headers)
+        assert response.status_code == 200, response.data
+        return len(statements)
+
+    def assert_constant(self, make_url):
+        small_log = self.add_data(1)[0]
+        small = self.query_count(make_url(small_log))
+        large_log = self.add_data(10)[0]
+        large = self.query_count(make_url(large_log))
+        assert small == large, (small, large)
+        return large
+
+    def test_logs_listing(self):
+        assert self.assert_constant(lambda log: '/logs/') <= 3
+
+    def test_log_detail(self):
+        assert self.assert_constant(
+            lambda log: '/logs/{}/'.format(log.id)) <= 3
+
+    def test_entries_listing(self):
+        # Version check, log lookup and the entries themselves
+        assert self.assert_constant(
+            lambda log: '/logs/{}/entries/'.format(log.id)) <= 3
+
+    def test_entry_detail(self):
+        log = self.add_data(1)[0]
+        entry = log.entries[0]
+        url = '/logs/{}/entries/{}/'.format(log.id, entry.id)
+        assert self.query_count(url) == 1
+
+    def test_posting_an_entry_does_not_read_it_back(self):
+        log = self.create_log()
+        with self.count_queries() as statements:
+            response = self.post_json(
+                '/logs/{}/entries/'.format(log.id),
+                {'title': 'Motion', 'description': 'Filed'}, self.headers)
+        assert response.status_code == 201, response.data
+        selects = [
+            re.search(r'\bFROM (\w+)', statement).group(1)
+            for statement in statements if statement.startswith('SELECT')
+        ]
+        assert 'entry' not in selects
+        assert selects.count('user') == 1
@@ -0,0 +1,115 @@
+"""Tests for the token bucket rate limits"""
+
+import json
+import unittest
+
+from helpers import AppTestCase, tiny_app
+
+from tinylog_server import ratelimit
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestLocalStore(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.store = ratelimit.LocalStore(max_size=2, clock=self.clock)
+        self.limit = ratelimit.Limit(3, 60.0)
+
+    def test_bursts_up_to_the_count(self):
+        for _ in range(3):
+            assert self.store.take('a', self.limit) == 0
+        assert self.store.take('a', self.limit) == 20.0
+
+    def test_buckets_refill_over_the_period(self):
+        for _ in range(3):
+            self.store.take('a', self.limit)
+        self.clock.now = 20.0
+        assert self.store.take('a', self.limit) == 0
+        assert self.store.take('a', self.limit) == 20.0
+        self.clock.now = 1000.0
+        for _ in range(3):
+            assert self.store.take('a', self.limit) == 0
+        assert self.store.take('a', self.limit) > 0
+
+    def test_keys_have_their_own_buckets(self):
+        for _ in range(3):
+            self.store.take('a', self.limit)
+        assert self.store.take('b', self.limit) == 0
+
+    def test_least_recently_used_buckets_are_dropped(self):
+        for key in ('a', 'b', 'c'):
+            self.store.take(key, self.limit)
+        assert len(self.store) == 2
+
+
+class TestParseLimit(unittest.TestCase):
+    def test_parses_count_per_period(self):
+        assert ratelimit.parse_limit('10/60') == ratelimit.Limit(10, 60.0)
+        assert ratelimit.parse_limit('10/60').rate == 10 / 60
+
+    def test_empty_or_zero_disables(self):
+        assert ratelimit.parse_limit('') is None
+        assert ratelimit.parse_limit(None) is None
+        assert ratelimit.parse_limit('0/60') is None
+
+    def test_rejects_malformed_limits(self):
+        for value in ('10', 'ten/60', '10/0'):
+            with self.assertRaises(ValueError):
+                ratelimit.parse_limit(value)
+
+
+class TestRateLimitedViews(AppTestCase):
+    def setUp(self):
+        super().setUp()
+        self.limits = dict(tiny_app.RATE_LIMITER.limits)
+        tiny_app.RATE_LIMITER.limits.update({
+            'login': ratelimit.Limit(2, 60.0),
+            'signup': ratelimit.Limit(1, 60.0),
+            'writes': ratelimit.Limit(2, 60.0),
+        })
+        self.create_user()
+
+    def tearDown(self):
+        tiny_app.RATE_LIMITER.limits = self.limits
+        super().tearDown()
+
+    def test_logins_are_limited_before_hashing(self):
+        for _ in range(2):
+            self.login()
+        verified = tiny_app.PASSWORD_POOL.completed
+        response = self.post_json('/login/', {
+            'username': 'aflorrick',
+            'password': 'password',
+        })
+        assert response.status_code == 429
+        assert response.headers['Retry-After'] == '30'
+        assert tiny_app.PASSWORD_POOL.completed == verified
+
+    def test_signups_are_limited_by_address(self):
+        payload = {'username': 'dlockhart', 'password': 'password'}
+        assert self.post_json('/users/', payload).status_code == 400
+        assert self.post_json('/users/', payload).status_code == 429
+        assert self.client.get('/users/').status_code == 200
+
+    def test_writes_are_limited_by_access_token(self):
+        log_id = self.create_log().id
+        url = '/logs/{}/entries/'.format(log_id)
+        entry = {'title': 'Title', 'description': 'Description'}
+        first = self.auth_header(self.login())
+        second = self.auth_header(self.login())
+
+        for _ in range(2):
+            assert self.post_json(url, entry, first).status_code == 201
+        response = self.post_json(url, entry, first)
+        assert response.status_code == 429
+        assert json.loads(response.data) == (
+            'Too many requests, please try again later')
+        assert self.post_json(url, entry, second).status_code == 201
+        assert self.client.get(url, headers=first).status_code == 200
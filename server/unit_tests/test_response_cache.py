@@ -0,0 +1,139 @@
+"""Tests for the response cache on the user and log listings"""
+
+import json
+import unittest
+
+from helpers import AppTestCase, tiny_app
+
+from tinylog_server import cache
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestResponseCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = cache.ResponseCache(
+            cache.LocalBackend(max_size=10), ttl=60, settle_time=5)
+        self.response = cache.CachedResponse(
+            200, 'application/json', b'{"users": []}')
+
+    def test_responses_round_trip_with_their_vary_headers(self):
+        response = cache.CachedResponse.loads(cache.CachedResponse(
+            200, 'application/json', b'{}', ['Accept']).dumps())
+        self.assertEqual(response.vary, ['Accept'])
+        self.assertEqual(response.body, b'{}')
+
+    def test_keys_depend_on_args_and_url_root(self):
+        key = self.cache.key('users', '/users/', [('limit', '1')], 'http://a/')
+        self.assertEqual(
+            key,
+            self.cache.key('users', '/users/', [('limit', '1')], 'http://a/'))
+        self.assertNotEqual(
+            key,
+            self.cache.key('users', '/users/', [('limit', '2')], 'http://a/'))
+        self.assertNotEqual(
+            key,
+            self.cache.key('users', '/users/', [('limit', '1')], 'http://b/'))
+
+    def test_invalidation_changes_the_key(self):
+        key = self.cache.key('users', '/users/', [], 'http://a/')
+        self.cache.set('users', key, self.response)
+        self.assertEqual(self.cache.get('users', key).body, b'{"users": []}')
+
+        self.cache.invalidate('users')
+        new_key = self.cache.key('users', '/users/', [], 'http://a/')
+        self.assertNotEqual(key, new_key)
+        self.assertIsNone(self.cache.get('users', new_key))
+        self.assertEqual(self.cache.stats()['users'], {
+            'hits': 1, 'misses': 1, 'hit_rate': 0.5,
+        })
+
+    def test_replica_reads_are_not_stored_while_settling(self):
+        self.cache.invalidate('users')
+        key = self.cache.key('users', '/users/', [], 'http://a/')
+        self.cache.set('users', key, self.response, from_replica=True)
+        self.assertIsNone(self.cache.get('users', key))
+        self.cache.set('users', key, self.response)
+        self.assertIsNotNone(self.cache.get('users', key))
+
+
+class TestCachedListings(AppTestCase):
+    def setUp(self):
+        super().setUp()
+        self.create_user()
+        self.headers = self.auth_header(self.login())
+        self.verifier = tiny_app.recaptcha.get_verifier()
+        tiny_app.recaptcha.set_verifier(tiny_app.recaptcha.StaticVerifier())
+
+    def tearDown(self):
+        tiny_app.recaptcha.set_verifier(self.verifier)
+        super().tearDown()
+
+    def get(self, url):
+        response = self.client.get(url, headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_repeated_listings_are_served_from_the_cache(self):
+        self.assertEqual(self.get('/logs/').headers['X-Cache'], 'MISS')
+        with self.count_queries() as statements:
+            response = self.get('/logs/')
+        self.assertEqual(response.headers['X-Cache'], 'HIT')
+        self.assertEqual(statements, [])
+        self.assertEqual(
+            self.get('/logs/?limit=1').headers['X-Cache'], 'MISS')
+
+    def test_hits_vary_on_accept_like_misses(self):
+        for cache_status in ('MISS', 'HIT'):
+            response = self.get('/users/')
+            self.assertEqual(response.headers['X-Cache'], cache_status)
+            self.assertIn('Accept', response.vary)
+
+    def test_creating_a_log_invalidates_the_log_listing(self):
+        self.get('/logs/')
+        self.post_json(
+            '/logs/', {'name': 'Appeals', 'description': 'Appeals'},
+            headers=self.headers)
+        response = self.get('/logs/')
+        self.assertEqual(response.headers['X-Cache'], 'MISS')
+        self.assertEqual(len(json.loads(response.data)['logs']), 1)
+
+    def test_adding_an_entry_invalidates_the_log_listing(self):
+        log = self.create_log()
+        self.get('/logs/')
+        self.post_json(
+            '/logs/{}/entries/'.format(log.id),
+            {'title': 'Filed', 'description': 'Motion filed'},
+            headers=self.headers)
+        logs = json.loads(self.get('/logs/').data)['logs']
+        self.assertEqual(logs[0]['entry_count'], 1)
+
+    def test_signing_up_invalidates_the_user_listing(self):
+        self.get('/users/')
+        self.post_json('/users/', {
+            'username': 'dlockhart',
+            'password': 'password',
+            'captcha_token': 'token',
+        })
+        users = json.loads(self.get('/users/').data)['users']
+        self.assertEqual(len(users), 2)
+
+    def test_logs_are_not_invalidated_by_signups(self):
+        self.get('/logs/')
+        self.post_json('/users/', {
+            'username': 'dlockhart',
+            'password': 'password',
+            'captcha_token': 'token',
+        })
+        self.assertEqual(self.get('/logs/').headers['X-Cache'], 'HIT')
+
+    def test_listings_still_require_authorization(self):
+        self.get('/logs/')
+        response = self.client.get('/logs/')
+        self.assertEqual(response.status_code, 400)
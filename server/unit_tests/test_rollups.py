@@ -0,0 +1,63 @@
+"""Tests for incrementally maintained entry counts"""
+
+import datetime
+import json
+
+from helpers import AppTestCase, tiny_models
+
+from tinylog_server.db import rollups
+
+
+class TestRollups(AppTestCase):
+    def setUp(self):
+        super().setUp()
+        self.create_user('aflorrick')
+        self.create_user('agos')
+        self.log_id = self.create_log().id
+        self.headers = {
+            username: self.auth_header(self.login(username))
+            for username in ('aflorrick', 'agos')
+        }
+        self.url = '/logs/{}/entries/'.format(self.log_id)
+
+    def post_entries(self, username, count):
+        self.post_json(self.url + 'bulk/', [
+            {'title': 'Entry', 'description': 'Counted'}
+            for _ in range(count)
+        ], self.headers[username])
+
+    def stats(self, query=''):
+        response = self.client.get(
+            '/logs/{}/stats/{}'.format(self.log_id, query),
+            headers=self.headers['agos'])
+        return json.loads(response.data)
+
+    def test_counts_follow_inserts(self):
+        self.post_entries('aflorrick', 3)
+        self.post_entries('agos', 2)
+        self.post_json(self.url, {'title': 'One', 'description': 'More'},
+                       self.headers['agos'])
+
+        stats = self.stats()
+        today = datetime.datetime.utcnow().date().isoformat()
+        assert stats['entry_count'] == 6
+        assert [(a['author'].rsplit('/', 1)[-1], a['count'])
+                for a in stats['authors']] == [('aflorrick', 3), ('agos', 3)]
+        assert stats['days'] == [{'day': today, 'count': 6}]
+        assert self.stats('?until=' + today)['days'] == []
+
+    def test_log_shows_entry_count_without_loading_entries(self):
+        self.post_entries('aflorrick', 4)
+        tiny_models.DB.session.remove()
+        log = tiny_models.Log.query.get(self.log_id)
+        assert log.entry_count == 4
+        assert 'entries' not in log.__dict__
+
+    def test_rebuild_matches_incremental_counts(self):
+        self.post_entries('aflorrick', 2)
+        self.post_entries('agos', 5)
+        before = self.stats()
+        with tiny_models.DB.engine.begin() as connection:
+            rollups.rebuild(connection)
+        tiny_models.DB.session.remove()
+        assert self.stats() == before
@@ -0,0 +1,91 @@
+"""Tests for routing reads to database replicas"""
+
+import json
+
+from helpers import AppTestCase, tiny_app, tiny_models
+
+from tinylog_server.cache import TTLCache
+from tinylog_server.db import routing
+
+
+class TestReplicaBinds(AppTestCase):
+    def test_dsns_become_replica_binds(self):
+        self.assertEqual(
+            routing.replica_binds('sqlite:///a.db, sqlite:///b.db,'),
+            {'replica_0': 'sqlite:///a.db', 'replica_1': 'sqlite:///b.db'},
+        )
+        self.assertEqual(routing.replica_binds(None), {})
+
+    def test_reads_use_the_primary_without_replicas(self):
+        session = tiny_models.DB.session()
+        routing.route_reads(session, True)
+        self.assertIs(
+            session.get_bind(tiny_models.Log.__mapper__),
+            tiny_models.DB.engine,
+        )
+
+
+class TestReplicaRouting(AppTestCase):
+    """Uses an empty database as a replica that has not caught up"""
+
+    def setUp(self):
+        super().setUp()
+        self.binds = self.app.config['SQLALCHEMY_BINDS']
+        self.app.config['SQLALCHEMY_BINDS'] = {'replica_0': 'sqlite://'}
+        self.replica = tiny_models.DB.get_engine(self.app, bind='replica_0')
+        tiny_models.DB.Model.metadata.create_all(bind=self.replica)
+        tiny_app.RECENT_WRITERS = TTLCache(max_size=100, ttl=5)
+
+        self.create_user()
+        self.create_log()
+        # Sessions are created directly so the client has no primary cookie
+        session = tiny_models.Session(
+            tiny_models.User.query.first().id)
+        tiny_models.DB.session.add(session)
+        tiny_models.DB.session.commit()
+        self.access_token = session.access_token
+        tiny_models.DB.session.remove()
+
+    def tearDown(self):
+        tiny_models.DB.session.remove()
+        tiny_models.DB.Model.metadata.drop_all(bind=self.replica)
+        self.app.config['SQLALCHEMY_BINDS'] = self.binds
+        super().tearDown()
+
+    def get_logs(self, client=None):
+        response = (client or self.client).get(
+            '/logs/', headers=self.auth_header(self.access_token))
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.data)['logs']
+
+    def test_reads_go_to_the_replica(self):
+        # The session is only on the primary, so authorization falls back
+        self.assertEqual(self.get_logs(), [])
+
+    def test_writes_go_to_the_primary(self):
+        response = self.post_json(
+            '/logs/',
+            {'name': 'Appeals', 'description': 'Appeals'},
+            headers=self.auth_header(self.access_token),
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(tiny_models.Log.query.count(), 2)
+
+    def test_writers_read_their_writes_by_token(self):
+        self.post_json(
+            '/logs/',
+            {'name': 'Appeals', 'description': 'Appeals'},
+            headers=self.auth_header(self.access_token),
+        )
+        # A client without the cookie is still kept on the primary
+        self.assertEqual(len(self.get_logs(self.app.test_client())), 2)
+
+    def test_writers_read_their_writes_by_cookie(self):
+        response = self.post_json(
+            '/logs/',
+            {'name': 'Appeals', 'description': 'Appeals'},
+            headers=self.auth_header(self.access_token),
+        )
+        self.assertIn(tiny_app.PRIMARY_COOKIE, response.headers['Set-Cookie'])
+        tiny_app.RECENT_WRITERS.clear()
+        self.assertEqual(len(self.get_logs()), 2)
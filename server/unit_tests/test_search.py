@@ -0,0 +1,61 @@
+"""Tests for full-text search over entries"""
+
+import json
+
+from helpers import AppTestCase, tiny_models
+
+
+class TestSearch(AppTestCase):
+    def setUp(self):
+        super().setUp()
+        author = self.create_user()
+        self.log = self.create_log()
+        self.other_log = self.create_log('Other')
+        tiny_models.DB.session.add_all([
+            tiny_models.Entry('Kalinda', 'Found the evidence', author.id,
+                              self.log.id),
+            tiny_models.Entry('Evidence', 'evidence, evidence everywhere',
+                              author.id, self.log.id),
+            tiny_models.Entry('Deposition', 'No evidence today', author.id,
+                              self.other_log.id),
+            tiny_models.Entry('Lunch', 'Sandwiches', author.id, self.log.id),
+        ])
+        tiny_models.DB.session.commit()
+        self.headers = self.auth_header(self.login())
+
+    def search(self, query):
+        response = self.client.get('/search/?' + query, headers=self.headers)
+        return response.status_code, json.loads(response.data)
+
+    def titles(self, body):
+        return [entry['title'] for entry in body['entries']]
+
+    def test_results_are_ranked(self):
+        status, body = self.search('q=evidence')
+        assert status == 200
+        assert self.titles(body)[0] == 'Evidence'
+        assert sorted(self.titles(body)) == [
+            'Deposition', 'Evidence', 'Kalinda']
+
+    def test_results_are_paginated(self):
+        status, body = self.search('q=evidence&limit=2')
+        assert len(body['entries']) == 2
+        next_page = self.client.get(body['next'], headers=self.headers)
+        assert len(json.loads(next_page.data)['entries']) == 1
+
+    def test_search_within_a_log(self):
+        _, body = self.search('q=evidence&log=' + self.other_log.id)
+        assert self.titles(body) == ['Deposition']
+
+    def test_new_entries_are_indexed(self):
+        self.post_json('/logs/{}/entries/'.format(self.log.id), {
+            'title': 'Subpoena',
+            'description': 'Served (finally) "today"',
+        }, self.headers)
+        _, body = self.search('q=subpoena')
+        assert self.titles(body) == ['Subpoena']
+        _, body = self.search('q="today" (finally')
+        assert self.titles(body) == ['Subpoena']
+
+    def test_query_is_required(self):
+        assert self.search('q=')[0] == 400
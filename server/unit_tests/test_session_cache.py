@@ -0,0 +1,59 @@
+"""Tests for the session cache used by the authorized decorator"""
+
+import unittest
+
+from helpers import AppTestCase, tiny_app, tiny_models
+
+from tinylog_server.cache import TTLCache
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestTTLCache(unittest.TestCase):
+    def test_entries_expire(self):
+        clock = FakeClock()
+        cache = TTLCache(max_size=10, ttl=5, clock=clock)
+        cache.set('a', 1)
+        assert cache.get('a') == 1
+        clock.now = 5
+        assert cache.get('a') is None
+        assert cache.stats()['hits'] == 1
+        assert cache.stats()['misses'] == 1
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = TTLCache(max_size=2, ttl=60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        assert cache.get('b') is None
+        assert cache.get('a') == 1
+        assert cache.stats()['evictions'] == 1
+
+
+class TestAuthorizedSessionCache(AppTestCase):
+    def test_repeat_requests_hit_the_cache(self):
+        self.create_user()
+        access_token = self.login()
+        for _ in range(3):
+            response = self.client.get(
+                '/current-user/', headers=self.auth_header(access_token))
+            assert response.status_code == 200
+        stats = tiny_app.SESSION_CACHE.stats()
+        assert stats['misses'] == 1
+        assert stats['hits'] == 2
+
+    def test_logout_evicts_the_token(self):
+        self.create_user()
+        access_token = self.login()
+        headers = self.auth_header(access_token)
+        assert self.client.get('/current-user/', headers=headers).status_code == 200
+        assert self.client.post('/logout/', headers=headers).status_code == 200
+        assert tiny_models.Session.query.count() == 0
+        assert self.client.get('/current-user/', headers=headers).status_code == 403
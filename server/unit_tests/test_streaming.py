@@ -0,0 +1,30 @@
+"""Tests for streamed entry listings"""
+
+import json
+
+from helpers import AppTestCase
+
+
+class TestStreaming(AppTestCase):
+    def setUp(self):
+        super().setUp()
+        author = self.create_user()
+        self.log = self.create_log()
+        self.create_entries(self.log, author, 25)
+        self.headers = self.auth_header(self.login())
+        self.url = '/logs/{}/entries/'.format(self.log.id)
+
+    def test_ndjson_lists_every_entry(self):
+        headers = dict(self.headers, Accept='application/x-ndjson')
+        response = self.client.get(self.url + '?limit=5', headers=headers)
+        assert response.status_code == 200
+        assert response.mimetype == 'application/x-ndjson'
+        lines = response.data.decode('utf-8').splitlines()
+        assert len(lines) == 25
+        assert all('_link' in json.loads(line) for line in lines)
+
+    def test_streamed_json_matches_paged_listing(self):
+        paged = self.client.get(self.url + '?limit=100', headers=self.headers)
+        streamed = self.client.get(self.url + '?stream=1', headers=self.headers)
+        assert streamed.status_code == 200
+        assert json.loads(streamed.data) == json.loads(paged.data)
@@ -0,0 +1,171 @@
+"""Tests for exporting and importing whole logs"""
+
+import csv
+import datetime
+import gzip
+import io
+import json
+
+from helpers import AppTestCase, tiny_app, tiny_models
+
+from tinylog_server import transfer
+from tinylog_server.db import archive, search
+
+
+class TestTransfer(AppTestCase):
+    def setUp(self):
+        super().setUp()
+        self.chunk_size = tiny_app.CONFIG['IMPORT_CHUNK_SIZE']
+        tiny_app.CONFIG['IMPORT_CHUNK_SIZE'] = 2
+        self.author = self.create_user()
+        self.log = self.create_log()
+        self.log_id = self.log.id
+        start = datetime.datetime(2017, 9, 1, 12, 30)
+        for index in range(5):
+            entry = tiny_models.Entry(
+                'Motion {}'.format(index), 'Filed, "quoted"\nsecond line',
+                self.author.id, self.log.id)
+            entry.created_at = start + datetime.timedelta(hours=index)
+            tiny_models.DB.session.add(entry)
+        tiny_models.DB.session.commit()
+        self.entries = [
+            (entry.id, entry.created_at)
+            for entry in tiny_models.Entry.query.order_by(
+                tiny_models.Entry.created_at)
+        ]
+        self.headers = self.auth_header(self.login())
+
+    def tearDown(self):
+        tiny_app.CONFIG['IMPORT_CHUNK_SIZE'] = self.chunk_size
+        super().tearDown()
+
+    def export(self, export_format):
+        response = self.client.get(
+            '/logs/{}/export/?format={}'.format(self.log_id, export_format),
+            headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'application/gzip')
+        return response.data
+
+    def import_(self, body, query=''):
+        response = self.client.post(
+            '/logs/import/' + query, data=body, headers=self.headers)
+        return response.status_code, json.loads(response.data)
+
+    def imported_entries(self, log_id):
+        return [
+            (entry.id, entry.created_at)
+            for entry in tiny_models.Entry.query.filter_by(
+                log_id=log_id).order_by(tiny_models.Entry.created_at)
+        ]
+
+    def test_ndjson_export_describes_the_log_then_its_entries(self):
+        lines = gzip.decompress(self.export('ndjson')).splitlines()
+        header = json.loads(lines[0])
+        self.assertEqual(header['type'], 'log')
+        self.assertEqual(header['id'], self.log_id)
+        records = [json.loads(line) for line in lines[1:]]
+        self.assertEqual(
+            [record['id'] for record in records],
+            [entry_id for entry_id, _ in self.entries])
+        self.assertEqual(records[0]['author'], 'aflorrick')
+
+    def test_ndjson_round_trip_keeps_ids_and_times(self):
+        body = self.export('ndjson')
+        transfer.discard_log(self.log_id)
+
+        status, result = self.import_(body)
+        self.assertEqual(status, 201)
+        self.assertEqual(result['imported'], 5)
+        self.assertEqual(result['log']['entry_count'], 5)
+        self.assertEqual(self.imported_entries(self.log_id), self.entries)
+
+        # Rollups and the search index follow the imported entries
+        stats = json.loads(self.client.get(
+            '/logs/{}/stats/'.format(self.log_id), headers=self.headers).data)
+        self.assertEqual(len(stats['days']), 1)
+        self.assertEqual(stats['days'][0]['count'], 5)
+        found, _ = search.search_entries('Motion', limit=10)
+        self.assertEqual(len(found), 5)
+
+    def test_csv_round_trip_into_a_new_log(self):
+        body = self.export('csv')
+        rows = list(csv.DictReader(io.StringIO(
+            gzip.decompress(body).decode('utf-8'))))
+        self.assertEqual(rows[0]['description'], 'Filed, "quoted"\nsecond line')
+        tiny_models.Entry.query.delete()
+        tiny_models.DB.session.commit()
+
+        status, result = self.import_(
+            body, '?format=csv&name=Restored&description=From+CSV')
+        self.assertEqual(status, 201)
+        self.assertEqual(result['log']['name'], 'Restored')
+        new_log_id = result['log']['_link'].rsplit('/', 1)[-1]
+        self.assertNotEqual(new_log_id, self.log_id)
+        self.assertEqual(self.imported_entries(new_log_id), self.entries)
+
+    def test_uncompressed_imports_are_accepted(self):
+        body = gzip.decompress(self.export('ndjson'))
+        transfer.discard_log(self.log_id)
+        status, result = self.import_(body)
+        self.assertEqual(status, 201)
+        self.assertEqual(result['imported'], 5)
+
+    def test_existing_logs_are_not_overwritten(self):
+        status, _ = self.import_(self.export('ndjson'))
+        self.assertEqual(status, 400)
+        self.assertEqual(len(self.imported_entries(self.log_id)), 5)
+
+    def test_ids_already_in_the_archive_are_refused(self):
+        body = self.export('ndjson')
+        transfer.discard_log(self.log_id)
+        self.assertEqual(self.import_(body)[0], 201)
+        archive.archive_entries(datetime.datetime(2018, 1, 1))
+        lines = gzip.decompress(body).splitlines()
+        header = json.loads(lines[0])
+        header['id'] = 'otherlog'
+        lines[0] = json.dumps(header).encode('utf-8')
+
+        status, error = self.import_(b'\n'.join(lines))
+        self.assertEqual(status, 400)
+        self.assertIn('an entry id already exists', error)
+        self.assertIsNone(tiny_models.Log.query.get('otherlog'))
+
+    def test_invalid_header_times_name_the_header_line(self):
+        lines = gzip.decompress(self.export('ndjson')).splitlines()
+        header = json.loads(lines[0])
+        header.update(id='otherlog', created_at='yesterday')
+        status, error = self.import_(json.dumps(header).encode('utf-8'))
+        self.assertEqual(status, 400)
+        self.assertIn('Line 1: invalid created_at', error)
+
+    def test_failed_imports_are_rolled_back(self):
+        lines = gzip.decompress(self.export('ndjson')).splitlines()
+        record = json.loads(lines[-1])
+        record['author'] = 'nobody'
+        lines[-1] = json.dumps(record).encode('utf-8')
+        transfer.discard_log(self.log_id)
+
+        status, error = self.import_(b'\n'.join(lines))
+        self.assertEqual(status, 400)
+        self.assertIn('no user named nobody', error)
+        self.assertIsNone(tiny_models.Log.query.get(self.log_id))
+        self.assertEqual(tiny_models.Entry.query.count(), 0)
+
+    def test_undecodable_imports_are_rejected(self):
+        status, error = self.import_(b'\xff\xfe\n')
+        self.assertEqual(status, 400)
+        self.assertIn('Line 1: invalid UTF-8', error)
+
+    def test_corrupt_gzip_imports_are_rejected(self):
+        status, error = self.import_(b'\x1f\x8bgarbage')
+        self.assertEqual(status, 400)
+        self.assertIn('Line 1: invalid gzip data', error)
+
+    def test_truncated_gzip_imports_are_rejected(self):
+        body = self.export('ndjson')
+        transfer.discard_log(self.log_id)
+        status, error = self.import_(body[:len(body) // 2])
+        self.assertEqual(status, 400)
+        self.assertIn('invalid gzip data', error)
+        self.assertIsNone(tiny_models.Log.query.get(self.log_id))
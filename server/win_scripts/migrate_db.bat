@@ -0,0 +1,6 @@
+set ENV=DEV
+set FLASK_APP=..\tinylog_server\app.py
+set DATABASE_DSN=sqlite:///..\dev.db
+set CAPTCHA_CHALLENGE=6LeIxAcTAAAAAJcZVRqyHh71UMIEGNQ_MXjiZKhI
+set CAPTCHA_SECRET=6LeIxAcTAAAAAGG-vFI1TnRWxMZNFuojJ4WifJWe
+flask migrate-db
\ No newline at end of file